@@ -0,0 +1 @@
+default_app_config = 'tardis.apps.mydata.apps.MyDataConfig'
@@ -0,0 +1,71 @@
+"""
+Access checks for the MyData app's resources
+
+Experiment.safe.all(user) returns every experiment a user can access,
+so testing whether one experiment is "in" it pulls thousands of rows
+into Python for facility managers and superusers.  These helpers
+narrow the same queryset down to the IDs in question, so that each
+check is a single exists() or pk__in query.
+"""
+from tardis.tardis_portal.models.experiment import Experiment
+
+#: Maximum number of IDs in each pk__in query (SQLite allows 999
+#: parameters per statement)
+CHUNK_SIZE = 500
+
+
+def accessible_experiments(user):
+    '''
+    Returns a queryset of the experiments user can access, for use in
+    subqueries.
+    '''
+    return Experiment.safe.all(user)
+
+
+def can_access_experiment(user, experiment_id):
+    '''
+    Returns True if user can access the experiment with experiment_id.
+    '''
+    return accessible_experiments(user).filter(pk=experiment_id).exists()
+
+
+def accessible_experiment_ids(user, experiment_ids):
+    '''
+    Returns the set of IDs within experiment_ids which user can access.
+    '''
+    experiment_ids = list(set(experiment_ids))
+    accessible = set()
+    for start in range(0, len(experiment_ids), CHUNK_SIZE):
+        accessible.update(
+            accessible_experiments(user)
+            .filter(pk__in=experiment_ids[start:start + CHUNK_SIZE])
+            .values_list('pk', flat=True))
+    return accessible
+
+
+def can_access_dataset(user, dataset_id):
+    '''
+    Returns True if user can access one of the experiments containing
+    the dataset with dataset_id.
+    '''
+    return accessible_experiments(user)\
+        .filter(datasets__id=dataset_id).exists()
+
+
+def can_access_datafile(user, datafile_id):
+    '''
+    Returns True if user can access one of the experiments containing
+    the dataset containing the datafile with datafile_id.
+    '''
+    return accessible_experiments(user)\
+        .filter(datasets__datafile__id=datafile_id).exists()
+
+
+def filter_accessible_datafile_objects(user, dfos):
+    '''
+    Narrows a DataFileObject queryset down to those user can access,
+    in a single query.
+    '''
+    return dfos.filter(
+        datafile__dataset__experiments__in=accessible_experiments(user)
+        .values('pk')).distinct()
@@ -1,10 +1,58 @@
 from django.contrib import admin
+from django.contrib.admin import helpers
 from django import forms
+from django.core.paginator import InvalidPage
+from django.core.paginator import Paginator
+from django.db.models import Q
 from django.forms import TextInput
+from django.forms.models import BaseInlineFormSet
+from django.http import QueryDict
+from django.template.response import TemplateResponse
 
+from tardis.tardis_portal.models import StorageBox
+
+import approvals
 import models
 
 
+class CappedCountPaginator(Paginator):
+    '''
+    Counts at most max_count objects, so that changelists of large
+    tables don't run a COUNT over the whole table.  Objects beyond the
+    first max_count aren't paged to; search or filter to reach them.
+    '''
+    max_count = 10000
+
+    @property
+    def count(self):
+        if not hasattr(self, '_capped_count'):
+            try:
+                self._capped_count = \
+                    self.object_list[:self.max_count].count()
+            except (AttributeError, TypeError):
+                self._capped_count = len(self.object_list[:self.max_count])
+        return self._capped_count
+
+
+class IndexedSearchMixin(object):
+    '''
+    Searches with the exact and __startswith lookups listed in
+    search_fields (rather than Django's default __icontains lookups),
+    so that searches can use the columns' indexes on large fleets, and
+    caps the changelist's count (see CappedCountPaginator).
+    '''
+    paginator = CappedCountPaginator
+
+    def get_search_results(self, request, queryset, search_term):
+        search_term = search_term.strip()
+        if not search_term:
+            return queryset, False
+        query = Q()
+        for lookup in self.search_fields:
+            query |= Q(**{lookup: search_term})
+        return queryset.filter(query), False
+
+
 class UploaderSettingInlineForm(forms.ModelForm):
 
     class Meta:
@@ -16,10 +64,57 @@ class UploaderSettingInlineForm(forms.ModelForm):
         }
 
 
+class UploaderSettingInlineFormSet(BaseInlineFormSet):
+    '''
+    Only includes one page of the uploader's settings in the formset.
+    '''
+    per_page = 50
+    page_number = 1
+    page_param = 'settings_page'
+    #: The change page's query parameters (a QueryDict), for page links
+    query_params = None
+
+    def get_queryset(self):
+        if not hasattr(self, 'page'):
+            paginator = Paginator(
+                super(UploaderSettingInlineFormSet, self).get_queryset(),
+                self.per_page)
+            try:
+                self.page = paginator.page(self.page_number)
+            except InvalidPage:
+                self.page = paginator.page(1)
+        return self.page.object_list
+
+    def _page_query(self, number):
+        params = self.query_params.copy() if self.query_params is not None \
+            else QueryDict('', mutable=True)
+        params[self.page_param] = number
+        return params.urlencode()
+
+    @property
+    def previous_page_query(self):
+        return self._page_query(self.page.previous_page_number())
+
+    @property
+    def next_page_query(self):
+        return self._page_query(self.page.next_page_number())
+
+
 class UploaderSettingInline(admin.TabularInline):
     model = models.UploaderSetting
     extra = 0
     form = UploaderSettingInlineForm
+    formset = UploaderSettingInlineFormSet
+    template = 'admin/mydata/uploader/settings_inline.html'
+    page_param = 'settings_page'
+
+    def get_formset(self, request, obj=None, **kwargs):
+        formset = super(UploaderSettingInline, self).get_formset(
+            request, obj, **kwargs)
+        formset.page_param = self.page_param
+        formset.page_number = request.GET.get(self.page_param, 1)
+        formset.query_params = request.GET
+        return formset
 
 
 class UploaderForm(forms.ModelForm):
@@ -29,11 +124,98 @@ class UploaderForm(forms.ModelForm):
         model = models.Uploader
 
 
-class UploaderAdmin(admin.ModelAdmin):
+class UploaderAdmin(IndexedSearchMixin, admin.ModelAdmin):
     inlines = [UploaderSettingInline]
     form = UploaderForm
+    list_display = ('name', 'uuid', 'hostname', 'wan_ip_address',
+                    'user_agent_version', 'updated_time')
+    search_fields = ('uuid', 'name__startswith', 'hostname__startswith',
+                     'wan_ip_address')
+    raw_id_fields = ('instruments',)
+    show_full_result_count = False
+
+
+class ApprovalForm(forms.Form):
+    approved_storage_box = forms.ModelChoiceField(
+        queryset=StorageBox.objects.all())
+    approval_expiry = forms.DateField(required=False,
+                                      help_text='YYYY-MM-DD, optional')
+    approver_comments = forms.CharField(widget=forms.Textarea,
+                                        required=False)
+
+
+class UploaderRegistrationRequestAdmin(IndexedSearchMixin, admin.ModelAdmin):
+    list_display = ('__unicode__', 'approved', 'approved_storage_box',
+                    'approval_expiry')
+    list_select_related = ('uploader', 'approved_storage_box')
+    search_fields = ('requester_key_fingerprint',
+                     'requester_name__startswith',
+                     'uploader__uuid', 'uploader__name__startswith')
+    raw_id_fields = ('uploader', 'approved_storage_box')
+    show_full_result_count = False
+    actions = ['approve_selected']
+
+    def approve_selected(self, request, queryset):
+        '''
+        Approves the selected requests with one storage box and expiry,
+        after asking for them on an intermediate page.
+        '''
+        if 'apply' in request.POST:
+            form = ApprovalForm(request.POST)
+            if form.is_valid():
+                data = form.cleaned_data
+                approved = approvals.approve_registration_requests(
+                    queryset.values_list('id', flat=True),
+                    data['approved_storage_box'].id,
+                    approval_expiry=data['approval_expiry'],
+                    approver_comments=data['approver_comments'] or None)
+                self.message_user(
+                    request, 'Approved %d registration requests.' % approved)
+                return None
+        else:
+            form = ApprovalForm()
+        context = dict(
+            self.admin_site.each_context(request),
+            title='Approve registration requests',
+            form=form,
+            queryset=queryset.select_related('uploader'),
+            opts=self.model._meta,
+            action_checkbox_name=helpers.ACTION_CHECKBOX_NAME,
+        )
+        return TemplateResponse(
+            request,
+            'admin/mydata/uploaderregistrationrequest/approve_selected.html',
+            context)
+    approve_selected.short_description = \
+        'Approve selected registration requests'
+
+
+class UploaderSettingAdmin(IndexedSearchMixin, admin.ModelAdmin):
+    list_display = ('uploader', 'key', 'value')
+    list_select_related = ('uploader',)
+    search_fields = ('uploader__uuid', 'uploader__name__startswith')
+    raw_id_fields = ('uploader',)
+    show_full_result_count = False
+
+
+class StorageBoxRouteAdmin(admin.ModelAdmin):
+    list_display = ('network', 'instrument', 'storage_box', 'comments')
+    list_select_related = ('instrument', 'storage_box')
+    raw_id_fields = ('instrument', 'storage_box')
+
+
+class UploaderTelemetryAdmin(admin.ModelAdmin):
+    list_display = ('uploader', 'timestamp', 'disk_total', 'disk_used',
+                    'memory_total', 'memory_available')
+    list_select_related = ('uploader',)
+    raw_id_fields = ('uploader',)
+    show_full_result_count = False
+    paginator = CappedCountPaginator
 
 
 admin.site.register(models.Uploader, UploaderAdmin)
-admin.site.register(models.UploaderRegistrationRequest)
-admin.site.register(models.UploaderSetting)
+admin.site.register(models.UploaderRegistrationRequest,
+                    UploaderRegistrationRequestAdmin)
+admin.site.register(models.UploaderSetting, UploaderSettingAdmin)
+admin.site.register(models.StorageBoxRoute, StorageBoxRouteAdmin)
+admin.site.register(models.UploaderTelemetry, UploaderTelemetryAdmin)
@@ -2,36 +2,64 @@
 """
 Additions to MyTardis's REST API
 """
+import hashlib
+import json
 import logging
 import traceback
+from collections import OrderedDict
 from datetime import datetime
+from datetime import timedelta
 
 from django.conf import settings
+from django.conf.urls import url
 from django.contrib.auth.models import User
 from django.contrib.sites.models import Site
 from django.core import mail
 from django.core.mail import get_connection
 from django.db import IntegrityError
+from django.db import connection
+from django.db import transaction
 from django.http import HttpResponse
+from django.http import StreamingHttpResponse
 from django.template import Context
+from django.utils.dateparse import parse_date
 from tastypie import fields
+from tastypie import http
 from tastypie.constants import ALL_WITH_RELATIONS
 from tastypie.exceptions import ImmediateHttpResponse
+from tastypie.utils import dict_strip_unicode_keys
+from tastypie.utils import trailing_slash
 from ipware.ip import get_ip
 
 import tardis.tardis_portal.api
-from tardis.tardis_portal.auth.decorators import has_datafile_access
+from tardis.tardis_portal.auth.decorators import has_experiment_write
 from tardis.tardis_portal.models.facility import facilities_managed_by
 from tardis.tardis_portal.models.experiment import Experiment
-from tardis.tardis_portal.models.parameters import Schema
+from tardis.tardis_portal.models.dataset import Dataset
+from tardis.tardis_portal.models.instrument import Instrument
 from tardis.tardis_portal.models.parameters import ParameterName
 from tardis.tardis_portal.models.parameters import ExperimentParameter
 from tardis.tardis_portal.models.parameters import ExperimentParameterSet
 from tardis.tardis_portal.models.datafile import DataFileObject
 
+from models.experiment import DefaultExperimentLock
 from models.uploader import Uploader
 from models.uploader import UploaderRegistrationRequest
 from models.uploader import UploaderSetting
+from schemas import DEFAULT_EXPERIMENT_SCHEMA
+from schemas import DEFAULT_EXPERIMENT_PARAMETER_NAMES
+from signals import invalidate_experiment_lookups
+from profiling import ProfilingMixin
+from throttle import ThrottleMixin
+import acl
+import approvals
+import lookup_cache
+import manifest
+import notifications
+import registry
+import replica_index
+import routing
+import telemetry
 
 logger = logging.getLogger(__name__)
 
@@ -56,6 +84,11 @@ class ACLAuthorization(tardis.tardis_portal.api.ACLAuthorization):
             if is_facility_manager:
                 return object_list
             return []
+        elif isinstance(bundle.obj, DataFileObject):
+            if authenticated and authuser.is_superuser:
+                return object_list
+            return acl.filter_accessible_datafile_objects(authuser,
+                                                          object_list)
         else:
             return super(ACLAuthorization, self).read_list(object_list, bundle)
 
@@ -72,7 +105,7 @@ class ACLAuthorization(tardis.tardis_portal.api.ACLAuthorization):
         elif isinstance(bundle.obj, UploaderRegistrationRequest):
             return is_facility_manager
         elif isinstance(bundle.obj, DataFileObject):
-            return has_datafile_access(bundle.request, bundle.obj.datafile.id)
+            return acl.can_access_datafile(authuser, bundle.obj.datafile_id)
         else:
             return super(ACLAuthorization, self).read_detail(object_list,
                                                              bundle)
@@ -119,7 +152,8 @@ class ACLAuthorization(tardis.tardis_portal.api.ACLAuthorization):
         return super(ACLAuthorization, self).delete_detail(object_list, bundle)
 
 
-class UploaderAppResource(tardis.tardis_portal.api.MyTardisModelResource):
+class UploaderAppResource(ProfilingMixin, ThrottleMixin,
+                          tardis.tardis_portal.api.MyTardisModelResource):
     instruments = \
         fields.ManyToManyField(tardis.tardis_portal.api.InstrumentResource,
                                'instruments', null=True, full=True)
@@ -177,6 +211,28 @@ class UploaderAppResource(tardis.tardis_portal.api.MyTardisModelResource):
 
         return super(UploaderAppResource, self).hydrate_m2m(bundle)
 
+    def hydrate(self, bundle):
+        '''
+        Keeps MyData's heartbeats from rewriting an existing uploader's
+        row: its disk usage and memory are only recorded as telemetry,
+        and its updated_time is only written once the stored one is more
+        than MYDATA_UPLOADER_UPDATED_TIME_INTERVAL seconds old.
+        '''
+        bundle = super(UploaderAppResource, self).hydrate(bundle)
+        if getattr(bundle.obj, 'pk', None) is None:
+            return bundle
+        for key in ('disk_usage', 'memory'):
+            bundle.data.pop(key, None)
+        now = datetime.now()
+        interval = timedelta(seconds=getattr(
+            settings, 'MYDATA_UPLOADER_UPDATED_TIME_INTERVAL', 600))
+        if bundle.obj.updated_time is None or \
+                now - bundle.obj.updated_time >= interval:
+            bundle.data['updated_time'] = now
+        else:
+            bundle.data.pop('updated_time', None)
+        return bundle
+
     def obj_create(self, bundle, **kwargs):
         bundle.data['created_time'] = datetime.now()
         bundle.data['updated_time'] = datetime.now()
@@ -184,6 +240,7 @@ class UploaderAppResource(tardis.tardis_portal.api.MyTardisModelResource):
         if ip is not None:
             bundle.data['wan_ip_address'] = ip
         bundle = super(UploaderAppResource, self).obj_create(bundle, **kwargs)
+        telemetry.record_heartbeat(bundle.obj.id, bundle.data)
         return bundle
 
     def obj_update(self, bundle, **kwargs):
@@ -191,16 +248,19 @@ class UploaderAppResource(tardis.tardis_portal.api.MyTardisModelResource):
         # https://github.com/toastdriven/django-tastypie/issues/390 :
         if hasattr(bundle, "obj_update_done"):
             return
-        bundle.data['updated_time'] = datetime.now()
         ip = get_ip(bundle.request)
         if ip is not None:
             bundle.data['wan_ip_address'] = ip
+        # hydrate() removes the telemetry figures from bundle.data:
+        heartbeat = dict(bundle.data)
         bundle = super(UploaderAppResource, self).obj_update(bundle, **kwargs)
+        telemetry.record_heartbeat(bundle.obj.id, heartbeat)
         bundle.obj_update_done = True
         return bundle
 
 
-class UploaderRegistrationRequestAppResource(tardis.tardis_portal.api
+class UploaderRegistrationRequestAppResource(ProfilingMixin, ThrottleMixin,
+                                             tardis.tardis_portal.api
                                              .MyTardisModelResource):
     uploader = fields.ForeignKey(
         'tardis.apps.mydata.api.UploaderAppResource', 'uploader')
@@ -222,6 +282,119 @@ class UploaderRegistrationRequestAppResource(tardis.tardis_portal.api
         }
         always_return_data = True
 
+    def prepend_urls(self):
+        return super(UploaderRegistrationRequestAppResource,
+                     self).prepend_urls() + [
+            url(r"^(?P<resource_name>%s)/wait%s$" %
+                (self._meta.resource_name, trailing_slash()),
+                self.wrap_view('wait_for_approval'),
+                name='api_wait_for_approval'),
+            url(r"^(?P<resource_name>%s)/bulk_approve%s$" %
+                (self._meta.resource_name, trailing_slash()),
+                self.wrap_view('bulk_approve'),
+                name='api_bulk_approve'),
+        ]
+
+    def bulk_approve(self, request, **kwargs):
+        '''
+        Accepts POST data like {"objects": [...], "approved_storage_box":
+        ..., "approval_expiry": "YYYY-MM-DD", "approver_comments": ...},
+        where objects are registration request resource URIs or IDs and
+        approved_storage_box is a storage box resource URI or ID, and
+        approves the requests at once.  approval_expiry and
+        approver_comments are optional.  Requires permission to change
+        registration requests.
+        '''
+        self.method_check(request, allowed=['post'])
+        self.is_authenticated(request)
+        self.throttle_check(request)
+        if not request.user.has_perm(
+                'mydata.change_uploaderregistrationrequest'):
+            raise ImmediateHttpResponse(http.HttpUnauthorized())
+
+        data = self.deserialize(
+            request, request.body,
+            format=request.META.get('CONTENT_TYPE', 'application/json'))
+        try:
+            request_ids = [_uri_to_id(obj) for obj in data['objects']]
+            storage_box_id = _uri_to_id(data['approved_storage_box'])
+        except (KeyError, TypeError, ValueError):
+            raise ImmediateHttpResponse(http.HttpBadRequest(
+                'objects and approved_storage_box are required.'))
+        if storage_box_id is None or \
+                registry.get_storage_box(storage_box_id) is None:
+            raise ImmediateHttpResponse(http.HttpBadRequest(
+                'Unknown storage box.'))
+        approval_expiry = data.get('approval_expiry') or None
+        if approval_expiry is not None:
+            try:
+                approval_expiry = parse_date(str(approval_expiry))
+            except ValueError:
+                approval_expiry = None
+            if approval_expiry is None:
+                raise ImmediateHttpResponse(http.HttpBadRequest(
+                    'approval_expiry must be a date (YYYY-MM-DD).'))
+
+        approved = approvals.approve_registration_requests(
+            request_ids, storage_box_id, approval_expiry=approval_expiry,
+            approver_comments=data.get('approver_comments'))
+
+        self.log_throttled_access(request)
+        return self.create_response(request, {'approved': approved})
+
+    def wait_for_approval(self, request, **kwargs):
+        '''
+        Long-poll variant of
+        ?uploader__uuid=...&requester_key_fingerprint=... queries, for
+        MyData clients waiting for their registration requests to be
+        approved.  Responds as soon as a matching request's approved state
+        differs from the approved query parameter (default false), or
+        there is no matching request, or after timeout seconds (at most
+        MYDATA_LONG_POLL_MAX_TIMEOUT), with the matching requests.
+        '''
+        self.method_check(request, allowed=['get'])
+        self.is_authenticated(request)
+        self.throttle_check(request)
+
+        uploader_uuid = request.GET.get('uploader__uuid')
+        fingerprint = request.GET.get('requester_key_fingerprint')
+        if not uploader_uuid or not fingerprint:
+            raise ImmediateHttpResponse(http.HttpBadRequest(
+                'uploader__uuid and requester_key_fingerprint are required.'))
+        approved = request.GET.get('approved', 'false').lower() in \
+            ('true', '1')
+        max_timeout = getattr(settings, 'MYDATA_LONG_POLL_MAX_TIMEOUT', 10)
+        try:
+            timeout = min(float(request.GET.get('timeout', max_timeout)),
+                          max_timeout)
+        except ValueError:
+            raise ImmediateHttpResponse(http.HttpBadRequest(
+                'timeout must be a number of seconds.'))
+
+        base_bundle = self.build_bundle(request=request)
+
+        def fetch():
+            registration_requests = self.get_object_list(request)\
+                .filter(uploader__uuid=uploader_uuid,
+                        requester_key_fingerprint=fingerprint)
+            return list(self.authorized_read_list(registration_requests,
+                                                  base_bundle))
+
+        def changed(registration_requests):
+            return not registration_requests or any(
+                registration_request.approved != approved
+                for registration_request in registration_requests)
+
+        registration_requests = notifications.wait_for_change(
+            uploader_uuid, fingerprint, fetch, changed, timeout)
+
+        self.log_throttled_access(request)
+        bundles = [
+            self.full_dehydrate(self.build_bundle(obj=registration_request,
+                                                  request=request))
+            for registration_request in registration_requests]
+        return self.create_response(request, {'objects': bundles})
+
     def obj_create(self, bundle, **kwargs):
         bundle = super(UploaderRegistrationRequestAppResource, self)\
             .obj_create(bundle, **kwargs)
@@ -257,7 +430,9 @@ class UploaderRegistrationRequestAppResource(tardis.tardis_portal.api
               self).save_related(bundle)
 
 
-class UploaderSettingAppResource(tardis.tardis_portal.api.MyTardisModelResource):
+class UploaderSettingAppResource(ProfilingMixin, ThrottleMixin,
+                                 tardis.tardis_portal.api
+                                 .MyTardisModelResource):
     uploader = fields.ForeignKey(
         'tardis.apps.mydata.api.UploaderAppResource',
         'uploader',
@@ -272,7 +447,17 @@ class UploaderSettingAppResource(tardis.tardis_portal.api.MyTardisModelResource)
         always_return_data = True
 
 
-class ExperimentAppResource(tardis.tardis_portal.api.ExperimentResource):
+class UnknownUser(object):
+    '''
+    Stands in for a user folder name which doesn't match any MyTardis user
+    '''
+    def __init__(self, username='UNKNOWN', email='UNKNOWN'):
+        self.username = username
+        self.email = email
+
+
+class ExperimentAppResource(ProfilingMixin, ThrottleMixin,
+                            tardis.tardis_portal.api.ExperimentResource):
     '''Extends MyTardis's API for Experiments
     to allow querying of metadata relevant to MyData
     '''
@@ -285,180 +470,442 @@ class ExperimentAppResource(tardis.tardis_portal.api.ExperimentResource):
         '''
         Used by MyData to determine whether an appropriate default experiment
         exists to add a dataset to.
+
+        Results (including "no such experiment") are cached per user,
+        see lookup_cache.py
         '''
+        if not hasattr(bundle.request, 'GET'):
+            return super(ExperimentAppResource, self).obj_get_list(bundle,
+                                                                   **kwargs)
+        query = self.get_default_experiment_query(bundle.request.GET)
+        if query is None:
+            return super(ExperimentAppResource, self).obj_get_list(bundle,
+                                                                   **kwargs)
+        user = bundle.request.user
+        experiment_id = lookup_cache.get_or_compute(
+            query, user,
+            lambda: self.find_default_experiment_id(query, user))
+        if experiment_id is None:
+            return []
+        return Experiment.objects.filter(pk=experiment_id)
 
+    def prepend_urls(self):
+        return super(ExperimentAppResource, self).prepend_urls() + [
+            url(r"^(?P<resource_name>%s)/get_or_create%s$" %
+                (self._meta.resource_name, trailing_slash()),
+                self.wrap_view('get_or_create_default_experiment'),
+                name='api_get_or_create_default_experiment'),
+        ]
+
+    def get_or_create_default_experiment(self, request, **kwargs):
         '''
-        For backwards compatibility with older MyData versions, let's
-        try to guess the folder structure if it wasn't provided:
+        Accepts the same POST data MyData uses to create a default
+        experiment (title, description, institution_name and a
+        parameter_sets list including the mydata default experiment
+        parameter set), plus optional folder_structure and match_title
+        keys.  If an experiment matching the uploader (or the title, if
+        match_title is true) and the user/group folder name already exists,
+        it is returned with 200 OK, otherwise the experiment and its
+        parameter sets are created and returned with 201 CREATED.
+
+        The lookup and creation happen in one transaction while holding a
+        lock on the query's DefaultExperimentLock row, so concurrent
+        MyData instances can't create duplicate default experiments (even
+        when matching by title), while requests for other experiments
+        aren't held up.
         '''
-        folder_structure = None
-        if hasattr(bundle.request, 'GET') and \
-                'folder_structure' not in bundle.request.GET:
-            if 'group_folder_name' in bundle.request.GET and \
-                    bundle.request.GET['group_folder_name'].strip() != '':
-                folder_structure = 'User Group / ...'
-            elif 'user_folder_name' in bundle.request.GET:
-                if '@' in bundle.request.GET['user_folder_name']:
-                    folder_structure = 'Email / ...'
-                else:
-                    folder_structure = 'Username / ...'
+        self.method_check(request, allowed=['post'])
+        self.is_authenticated(request)
+        self.throttle_check(request)
+
+        data = self.deserialize(
+            request, request.body,
+            format=request.META.get('CONTENT_TYPE', 'application/json'))
+        data = self.alter_deserialized_detail_data(request, data)
+        params = self.get_default_experiment_params(data)
+        query = self.get_default_experiment_query(params)
+        if query is None or not params.get('uploader'):
+            raise ImmediateHttpResponse(http.HttpBadRequest(
+                'An uploader parameter and a user or group folder name '
+                'parameter are required in the %s parameter set.'
+                % DEFAULT_EXPERIMENT_SCHEMA))
+        data.pop('folder_structure', None)
+        data.pop('match_title', None)
+
+        if not Uploader.objects.filter(uuid=params['uploader']).exists():
+            raise ImmediateHttpResponse(http.HttpBadRequest(
+                'Uploader %s is not registered.' % params['uploader']))
+
+        with transaction.atomic():
+            lock, _ = DefaultExperimentLock.objects.get_or_create(
+                key=self.get_default_experiment_lock_key(query))
+            list(DefaultExperimentLock.objects.select_for_update()
+                 .filter(pk=lock.pk).values_list('pk', flat=True))
+            experiment_id = self.find_default_experiment_id(
+                query, request.user)
+            if experiment_id is None:
+                bundle = self.build_bundle(
+                    data=dict_strip_unicode_keys(data), request=request)
+                bundle = self.obj_create(bundle, **kwargs)
+                response_class = http.HttpCreated
             else:
-                folder_structure = 'Username / ...'
-
+                bundle = self.build_bundle(
+                    obj=Experiment.objects.get(pk=experiment_id),
+                    request=request)
+                response_class = HttpResponse
+        if experiment_id is None:
+            # Lookups cached by other processes between the signals fired
+            # during creation and the commit could still be misses:
+            invalidate_experiment_lookups(bundle.obj.id)
+
+        self.log_throttled_access(request)
+        bundle = self.full_dehydrate(bundle)
+        bundle = self.alter_detail_data_to_serialize(request, bundle)
+        return self.create_response(request, bundle,
+                                    response_class=response_class)
+
+    @staticmethod
+    def get_default_experiment_params(data):
         '''
-        Responds to title/folder_structure/[user_folder_name|group_folder_name]
-        query for MyData.  This can be used by MyData to retrieve an experiment
-        which can be used to collect datasets from multiple MyData instances.
-        '''
-        if hasattr(bundle.request, 'GET') and \
-                'title' in bundle.request.GET and \
-                ('user_folder_name' in bundle.request.GET or
-                 'group_folder_name' in bundle.request.GET):
-
-            title = bundle.request.GET['title']
-            if 'folder_structure' in bundle.request.GET:
-                folder_structure = bundle.request.GET['folder_structure']
-            need_to_match_user = (folder_structure.startswith('Username /') or
-                                  folder_structure.startswith('Email /'))
-            need_to_match_group = folder_structure.startswith('User Group /')
-
-            class UnknownUser(object):
-                def __init__(self, username='UNKNOWN', email='UNKNOWN'):
-                    self.username = username
-                    self.email = email
-
-            if need_to_match_user:
-                user_folder_name = bundle.request.GET['user_folder_name']
-                if folder_structure.startswith('Username /'):
-                    try:
-                        user_to_match = \
-                            User.objects.get(username=user_folder_name)
-                    except User.DoesNotExist:
-                        user_to_match = UnknownUser(username=user_folder_name)
-                elif folder_structure.startswith('Email /'):
-                    try:
-                        user_to_match = \
-                            User.objects.get(email__iexact=user_folder_name)
-                    except User.DoesNotExist:
-                        user_to_match = UnknownUser(email=user_folder_name)
-
-            if need_to_match_group:
-                group_folder_name = bundle.request.GET['group_folder_name']
-
-            mydata_default_exp_schema = Schema.objects.get(
-                namespace='http://mytardis.org'
-                '/schemas/mydata/defaultexperiment')
-
-            exp_psets = ExperimentParameterSet.objects\
-                .filter(experiment__title=title,
-                        schema=mydata_default_exp_schema)
-            for exp_pset in exp_psets:
-                exp_params = ExperimentParameter.objects\
-                    .filter(parameterset=exp_pset)
-                matched_user = False
-                matched_group = False
-                for exp_param in exp_params:
-                    if need_to_match_user and \
-                            exp_param.name.name == 'user_folder_name' and \
-                            (exp_param.string_value.lower() ==
-                             user_to_match.username.lower() or
-                             exp_param.string_value.lower() ==
-                             user_to_match.email.lower()):
-                        matched_user = True
-                    if need_to_match_group and \
-                            exp_param.name.name == 'group_folder_name' and \
-                            exp_param.string_value == group_folder_name:
-                        matched_group = True
-                if (need_to_match_user and matched_user) or \
-                        (need_to_match_group and matched_group) or \
-                        (not need_to_match_user and not need_to_match_group):
-                    experiment_id = exp_pset.experiment.id
-                    exp_list = Experiment.objects.filter(pk=experiment_id)
-                    if exp_list[0] in Experiment.safe.all(bundle.request.user):
-                        return exp_list
-
-            return []
-
+        Extracts query parameters (as accepted by
+        get_default_experiment_query) from an experiment's POST data.
         '''
-        Responds to
-        uploader/folder_structure/[user_folder_name|group_folder_name]
-        query for MyData.  Each MyData instance generates a UUID the first time
+        params = {}
+        for pset in data.get('parameter_sets', []):
+            if pset.get('schema') != DEFAULT_EXPERIMENT_SCHEMA:
+                continue
+            for param in pset.get('parameters', []):
+                if param.get('name') in DEFAULT_EXPERIMENT_PARAMETER_NAMES:
+                    params[param['name']] = param.get('value')
+        if data.get('match_title'):
+            # Title lookups take precedence over uploader lookups in
+            # get_default_experiment_query:
+            params['title'] = data.get('title')
+        if 'folder_structure' in data:
+            params['folder_structure'] = data['folder_structure']
+        return params
+
+    @staticmethod
+    def get_default_experiment_query(params):
+        '''
+        Normalizes a MyData default experiment query, returning a dict with
+        title (or uploader), folder_structure, user_folder_name and
+        group_folder_name keys, or None if params isn't such a query.
+
+        Responds to title/folder_structure/[user_folder_name|group_folder_name]
+        queries, which can be used by MyData to retrieve an experiment
+        which can be used to collect datasets from multiple MyData instances,
+        and to uploader/folder_structure/[user_folder_name|group_folder_name]
+        queries.  Each MyData instance generates a UUID the first time
         it runs on each upload PC. The UUID together with the user folder name
         (or group folder name) can be used to uniquely identify one particular
         user (or group) who has saved data on an instrument PC running a MyData
         instance identified by the UUID.
         '''
-        if hasattr(bundle.request, 'GET') and \
-                'uploader' in bundle.request.GET and \
-                ('user_folder_name' in bundle.request.GET or
-                 'group_folder_name' in bundle.request.GET):
-
-            uploader_uuid = bundle.request.GET['uploader']
-            if 'folder_structure' in bundle.request.GET:
-                folder_structure = bundle.request.GET['folder_structure']
-            need_to_match_user = (folder_structure.startswith('Username /') or
-                                  folder_structure.startswith('Email /'))
-            need_to_match_group = folder_structure.startswith('User Group /')
-
-            if need_to_match_user:
-                user_folder_name = bundle.request.GET['user_folder_name']
-                if folder_structure.startswith('Username /'):
-                    try:
-                        user_to_match = \
-                            User.objects.get(username=user_folder_name)
-                    except User.DoesNotExist:
-                        user_to_match = UnknownUser(username=user_folder_name)
-                elif folder_structure.startswith('Email /'):
-                    try:
-                        user_to_match = \
-                            User.objects.get(email__iexact=user_folder_name)
-                    except User.DoesNotExist:
-                        user_to_match = UnknownUser(email=user_folder_name)
-
-            if need_to_match_group:
-                group_folder_name = bundle.request.GET['group_folder_name']
-
-            mydata_default_exp_schema = Schema.objects.get(
-                namespace='http://mytardis.org'
-                '/schemas/mydata/defaultexperiment')
-
-            exp_psets = ExperimentParameterSet.objects\
-                .filter(schema=mydata_default_exp_schema)
-            for exp_pset in exp_psets:
-                exp_params = ExperimentParameter.objects\
-                    .filter(parameterset=exp_pset)
-                matched_uploader_uuid = False
-                matched_user = False
-                matched_group = False
-                for exp_param in exp_params:
-                    if exp_param.name.name == 'uploader' and \
-                            exp_param.string_value == uploader_uuid:
-                        matched_uploader_uuid = True
-                    if need_to_match_user and \
-                            exp_param.name.name == 'user_folder_name' and \
-                            (exp_param.string_value.lower() ==
-                             user_to_match.username.lower() or
-                             exp_param.string_value.lower() ==
-                             user_to_match.email.lower()):
-                        matched_user = True
-                    if exp_param.name.name == 'group_folder_name' and \
-                            exp_param.string_value == group_folder_name:
-                        matched_group = True
-                if matched_uploader_uuid and \
-                        (need_to_match_user and matched_user or
-                         need_to_match_group and matched_group):
-                    experiment_id = exp_pset.experiment.id
-                    exp_list = Experiment.objects.filter(pk=experiment_id)
-                    if exp_list[0] in Experiment.safe.all(bundle.request.user):
-                        return exp_list
+        if 'user_folder_name' not in params and \
+                'group_folder_name' not in params:
+            return None
+        if 'title' in params:
+            query = dict(title=params['title'])
+        elif 'uploader' in params:
+            query = dict(uploader=params['uploader'])
+        else:
+            return None
 
-            return []
+        '''
+        For backwards compatibility with older MyData versions, let's
+        try to guess the folder structure if it wasn't provided:
+        '''
+        if 'folder_structure' in params:
+            folder_structure = params['folder_structure']
+        elif (params.get('group_folder_name') or '').strip() != '':
+            folder_structure = 'User Group / ...'
+        elif '@' in (params.get('user_folder_name') or ''):
+            folder_structure = 'Email / ...'
+        else:
+            folder_structure = 'Username / ...'
 
-        return super(ExperimentAppResource, self).obj_get_list(bundle,
-                                                               **kwargs)
+        query.update(
+            folder_structure=folder_structure,
+            user_folder_name=params.get('user_folder_name'),
+            group_folder_name=params.get('group_folder_name'))
+        return query
 
+    @staticmethod
+    def get_default_experiment_lock_key(query):
+        '''
+        Returns the DefaultExperimentLock key for a query normalized by
+        get_default_experiment_query.  Folder names are matched case
+        insensitively, so they're lowercased.
+        '''
+        key = dict(query)
+        for name in ('user_folder_name', 'group_folder_name'):
+            if key.get(name):
+                key[name] = key[name].lower()
+        return hashlib.sha1(
+            json.dumps(sorted(key.items())).encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def find_default_experiment_id(query, user):
+        '''
+        Returns the ID of the first experiment accessible to user matching
+        a query normalized by get_default_experiment_query, or None.
+        '''
+        folder_structure = query['folder_structure']
+        need_to_match_user = (folder_structure.startswith('Username /') or
+                              folder_structure.startswith('Email /'))
+        need_to_match_group = folder_structure.startswith('User Group /')
+
+        if need_to_match_user:
+            user_folder_name = query['user_folder_name'] or ''
+            if folder_structure.startswith('Username /'):
+                try:
+                    user_to_match = \
+                        User.objects.get(username=user_folder_name)
+                except User.DoesNotExist:
+                    user_to_match = UnknownUser(username=user_folder_name)
+            else:
+                try:
+                    user_to_match = \
+                        User.objects.get(email__iexact=user_folder_name)
+                except User.DoesNotExist:
+                    user_to_match = UnknownUser(email=user_folder_name)
+
+        group_folder_name = query['group_folder_name']
+
+        schema_id = registry.get_schema_id()
+        if schema_id is None:
+            return None
+        uploader_name_id = registry.get_parameter_name_id('uploader')
+        user_folder_name_id = \
+            registry.get_parameter_name_id('user_folder_name')
+        group_folder_name_id = \
+            registry.get_parameter_name_id('group_folder_name')
+
+        exp_psets = ExperimentParameterSet.objects.filter(schema_id=schema_id)
+        if 'title' in query:
+            exp_psets = exp_psets.filter(experiment__title=query['title'])
+        for exp_pset in exp_psets:
+            exp_params = ExperimentParameter.objects\
+                .filter(parameterset=exp_pset)
+            matched_uploader_uuid = False
+            matched_user = False
+            matched_group = False
+            for exp_param in exp_params:
+                if 'uploader' in query and \
+                        exp_param.name_id == uploader_name_id and \
+                        exp_param.string_value == query['uploader']:
+                    matched_uploader_uuid = True
+                if need_to_match_user and \
+                        exp_param.name_id == user_folder_name_id and \
+                        (exp_param.string_value.lower() ==
+                         user_to_match.username.lower() or
+                         exp_param.string_value.lower() ==
+                         user_to_match.email.lower()):
+                    matched_user = True
+                if need_to_match_group and \
+                        exp_param.name_id == group_folder_name_id and \
+                        exp_param.string_value == group_folder_name:
+                    matched_group = True
+            if 'title' in query:
+                matched = (need_to_match_user and matched_user) or \
+                    (need_to_match_group and matched_group) or \
+                    (not need_to_match_user and not need_to_match_group)
+            else:
+                matched = matched_uploader_uuid and \
+                    (need_to_match_user and matched_user or
+                     need_to_match_group and matched_group)
+            if matched:
+                experiment_id = exp_pset.experiment_id
+                if acl.can_access_experiment(user, experiment_id):
+                    return experiment_id
+
+        return None
 
-class DataFileAppResource(tardis.tardis_portal.api.DataFileResource):
+
+class DatasetAppResource(ProfilingMixin, ThrottleMixin,
+                         tardis.tardis_portal.api.DatasetResource):
+    '''Extends MyTardis's API for Datasets with a bulk get-or-create
+    endpoint for MyData's folder scans
+    '''
+
+    class Meta(tardis.tardis_portal.api.DatasetResource.Meta):
+        # This will be mapped to mydata_dataset by MyTardis's urls.py:
+        resource_name = 'dataset'
+
+    def prepend_urls(self):
+        return [
+            url(r"^(?P<resource_name>%s)/get_or_create_bulk%s$" %
+                (self._meta.resource_name, trailing_slash()),
+                self.wrap_view('get_or_create_bulk'),
+                name='api_get_or_create_bulk'),
+            url(r"^(?P<resource_name>%s)/(?P<pk>\d+)/manifest_diff%s$" %
+                (self._meta.resource_name, trailing_slash()),
+                self.wrap_view('manifest_diff'),
+                name='api_manifest_diff'),
+        ] + super(DatasetAppResource, self).prepend_urls()
+
+    def manifest_diff(self, request, pk, **kwargs):
+        '''
+        Accepts a POSTed manifest of the dataset's folder (gzip-compressed
+        JSON Lines, see manifest.py) and streams back JSON Lines entries
+        like {"path": ..., "status": "missing"} for the files MyData
+        needs to upload or check, omitting those already stored and
+        verified.
+        '''
+        self.method_check(request, allowed=['post'])
+        self.is_authenticated(request)
+        self.throttle_check(request)
+        if not Dataset.objects.filter(pk=pk).exists():
+            raise ImmediateHttpResponse(http.HttpNotFound())
+        if not request.user.is_superuser and \
+                not acl.can_access_dataset(request.user, pk):
+            raise ImmediateHttpResponse(http.HttpUnauthorized())
+        self.log_throttled_access(request)
+        # The request is read completely before the response starts, and
+        # the manifest is then parsed from the spool as the response is
+        # streamed, so that neither is held in memory:
+        body = manifest.spool(request.read)
+
+        def lines():
+            try:
+                for line in manifest.iter_diff_lines(int(pk), body.read):
+                    yield line
+            finally:
+                body.close()
+        return StreamingHttpResponse(
+            lines(), content_type='application/x-ndjson')
+
+    def get_or_create_bulk(self, request, **kwargs):
+        '''
+        Accepts POST data like {"objects": [{"experiment": ...,
+        "description": ..., "instrument": ...}, ...]}, where experiment
+        and instrument are resource URIs or IDs, and responds with
+        {"objects": [{"id": ..., "resource_uri": ..., "created": ...}]}
+        in the same order.
+
+        Existing datasets are looked up by experiment, description and
+        instrument with one query per chunk of descriptions, and the
+        missing ones are created in one transaction (see
+        _create_datasets).
+        '''
+        self.method_check(request, allowed=['post'])
+        self.is_authenticated(request)
+        self.throttle_check(request)
+
+        data = self.deserialize(
+            request, request.body,
+            format=request.META.get('CONTENT_TYPE', 'application/json'))
+        records = data.get('objects', [])
+        max_records = getattr(settings, 'MYDATA_BULK_DATASET_MAX_RECORDS',
+                              1000)
+        if len(records) > max_records:
+            raise ImmediateHttpResponse(http.HttpBadRequest(
+                'At most %d datasets can be requested at once.'
+                % max_records))
+        try:
+            keys = [(_uri_to_id(record['experiment']),
+                     record['description'],
+                     _uri_to_id(record.get('instrument')))
+                    for record in records]
+        except (KeyError, TypeError, ValueError):
+            raise ImmediateHttpResponse(http.HttpBadRequest(
+                'Each object requires an experiment and a description.'))
+
+        experiment_ids = set(key[0] for key in keys)
+        accessible = acl.accessible_experiment_ids(request.user,
+                                                   experiment_ids)
+        if accessible != experiment_ids or not all(
+                has_experiment_write(request, experiment_id)
+                for experiment_id in experiment_ids):
+            raise ImmediateHttpResponse(http.HttpUnauthorized())
+        instrument_ids = set(key[2] for key in keys if key[2] is not None)
+        if Instrument.objects.filter(pk__in=instrument_ids).count() != \
+                len(instrument_ids):
+            raise ImmediateHttpResponse(http.HttpBadRequest(
+                'Unknown instrument.'))
+
+        with transaction.atomic():
+            # Serialize concurrent scans adding to the same experiments:
+            list(Experiment.objects.select_for_update()
+                 .filter(pk__in=experiment_ids).values_list('pk', flat=True))
+            dataset_ids = _find_datasets(keys)
+            missing = [key for key in OrderedDict.fromkeys(keys)
+                       if key not in dataset_ids]
+            if missing:
+                dataset_ids.update(_create_datasets(missing))
+
+        self.log_throttled_access(request)
+        missing = set(missing)
+        objects = [{'id': dataset_ids[key],
+                    'resource_uri': self.get_resource_uri(
+                        Dataset(pk=dataset_ids[key])),
+                    'created': key in missing} for key in keys]
+        return self.create_response(request, {'objects': objects})
+
+
+def _uri_to_id(uri_or_id):
+    '''
+    Returns the ID from a resource URI like /api/v1/experiment/123/, or
+    an ID passed as is (converted to an int).
+    '''
+    if uri_or_id is None:
+        return None
+    return int(str(uri_or_id).rstrip('/').split('/')[-1])
+
+
+def _find_datasets(keys, chunk_size=500):
+    '''
+    Returns a dict mapping (experiment ID, description, instrument ID)
+    keys to the ID of the first matching dataset, for those keys which
+    have one.
+    '''
+    experiment_ids = list(set(key[0] for key in keys))
+    descriptions = list(set(key[1] for key in keys))
+    wanted = set(keys)
+    found = {}
+    for start in range(0, len(descriptions), chunk_size):
+        rows = Dataset.objects\
+            .filter(experiments__id__in=experiment_ids,
+                    description__in=descriptions[start:start + chunk_size])\
+            .order_by('id')\
+            .values_list('experiments__id', 'description', 'instrument_id',
+                         'id')
+        for experiment_id, description, instrument_id, dataset_id in rows:
+            key = (experiment_id, description, instrument_id)
+            if key in wanted and key not in found:
+                found[key] = dataset_id
+    return found
+
+
+def _create_datasets(keys):
+    '''
+    Creates a dataset for each (experiment ID, description, instrument ID)
+    key, returning a dict mapping the keys to the new datasets' IDs.
+    Must be called within a transaction.
+
+    Datasets are created with bulk_create where the database backend
+    returns the new IDs from bulk inserts, and saved one at a time
+    otherwise, because other requests may be inserting datasets at the
+    same time, so the new IDs can't be inferred afterwards.
+    '''
+    datasets = [Dataset(description=description, instrument_id=instrument_id)
+                for _, description, instrument_id in keys]
+    if getattr(connection.features, 'can_return_ids_from_bulk_insert',
+               False):
+        Dataset.objects.bulk_create(datasets)
+    else:
+        for dataset in datasets:
+            dataset.save()
+    Dataset.experiments.through.objects.bulk_create(
+        [Dataset.experiments.through(dataset_id=dataset.pk,
+                                     experiment_id=key[0])
+         for key, dataset in zip(keys, datasets)])
+    return dict((key, dataset.pk) for key, dataset in zip(keys, datasets))
+
+
+class DataFileAppResource(ProfilingMixin, ThrottleMixin,
+                          tardis.tardis_portal.api.DataFileResource):
     '''Extends MyTardis's API for DataFiles to make use of the
     Uploader model's approved_storage_box in staging uploads
     (e.g. from MyData)
@@ -491,23 +938,19 @@ class DataFileAppResource(tardis.tardis_portal.api.DataFileResource):
                         'requester_key_fingerprint' in bundle.data:
                     uploader_uuid = bundle.data['uploader_uuid']
                     fingerprint = bundle.data['requester_key_fingerprint']
-                    uploader = Uploader.objects.get(uuid=uploader_uuid)
-                    uploader_registration_request = \
-                        UploaderRegistrationRequest.objects.get(
-                            uploader=uploader,
-                            requester_key_fingerprint=fingerprint)
-                    sbox = uploader_registration_request.approved_storage_box
+                    storage_box_id = UploaderRegistrationRequest.objects\
+                        .filter(uploader__uuid=uploader_uuid,
+                                requester_key_fingerprint=fingerprint)\
+                        .values_list('approved_storage_box_id', flat=True)\
+                        .get()
+                    sbox = registry.get_storage_box(storage_box_id)
                 else:
                     ip = get_ip(bundle.request)
-                    instrument_id = datafile.dataset.instrument.id
-                    uploader = Uploader.objects\
-                        .filter(wan_ip_address=ip,
-                                instruments__id=instrument_id)\
-                        .first()
-                    uploader_registration_request = \
-                        UploaderRegistrationRequest.objects\
-                        .get(uploader=uploader)
-                    sbox = uploader_registration_request.approved_storage_box
+                    instrument_id = datafile.dataset.instrument_id
+                    sbox = registry.get_storage_box(
+                        routing.lookup(ip, instrument_id))
+                    if sbox is None:
+                        sbox = datafile.get_receiving_storage_box()
             except:
                 logger.warning(traceback.format_exc())
                 sbox = datafile.get_receiving_storage_box()
@@ -522,7 +965,8 @@ class DataFileAppResource(tardis.tardis_portal.api.DataFileResource):
         return retval
 
 
-class ReplicaAppResource(tardis.tardis_portal.api.ReplicaResource):
+class ReplicaAppResource(ProfilingMixin, ThrottleMixin,
+                         tardis.tardis_portal.api.ReplicaResource):
     '''Extends MyTardis's API for DFOs, adding in the size as measured
     by file_object.size
     '''
@@ -536,6 +980,26 @@ class ReplicaAppResource(tardis.tardis_portal.api.ReplicaResource):
             'url': ('exact', 'startswith'),
         }
 
+    def build_filters(self, filters=None, **kwargs):
+        '''
+        Answers the url filters from the ReplicaURIIndex (see
+        replica_index.py) rather than scanning every DataFileObject's uri.
+        '''
+        if filters is None:
+            filters = {}
+        filters = filters.copy()
+        exact = filters.get('url', filters.get('url__exact'))
+        startswith = filters.get('url__startswith')
+        for key in ('url', 'url__exact', 'url__startswith'):
+            if key in filters:
+                del filters[key]
+        orm_filters = super(ReplicaAppResource, self).build_filters(
+            filters, **kwargs)
+        orm_filters.update(
+            replica_index.build_uri_filters(exact=exact,
+                                            startswith=startswith))
+        return orm_filters
+
     def dehydrate(self, bundle):
         dfo = bundle.obj
         bundle.data['location'] = dfo.storage_box.name
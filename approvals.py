@@ -0,0 +1,89 @@
+"""
+Approving and expiring UploaderRegistrationRequests in bulk
+
+Requests are updated with a single update() per chunk, which doesn't
+send save signals, so the long-polling notifications and routing table
+updates which signals.py would otherwise trigger are made here, once
+for the whole batch.
+"""
+from datetime import date
+from datetime import datetime
+
+from django.db import transaction
+
+from . import notifications
+from . import routing
+from .models import UploaderRegistrationRequest
+from .utils import on_commit
+
+#: Maximum number of IDs in each pk__in query (SQLite allows 999
+#: parameters per statement)
+CHUNK_SIZE = 500
+
+
+def _requests_changed(changed):
+    '''
+    Wakes the MyData clients waiting on the changed requests, and
+    updates their uploaders' routes.  changed is a list of
+    (uploader ID, uploader UUID, key fingerprint).
+    '''
+    pairs = [(uploader_uuid, fingerprint)
+             for _, uploader_uuid, fingerprint in changed]
+    on_commit(lambda: notifications.notify(pairs))
+    routing.uploaders_changed([uploader_id for uploader_id, _, _ in changed])
+
+
+def _update(querysets, **updates):
+    '''
+    Applies updates to the registration requests in querysets, in one
+    transaction.  Returns the number of requests updated.
+    '''
+    changed = []
+    with transaction.atomic():
+        for registration_requests in querysets:
+            rows = list(registration_requests.select_for_update()
+                        .values_list('id', 'uploader_id', 'uploader__uuid',
+                                     'requester_key_fingerprint'))
+            ids = [row[0] for row in rows]
+            for start in range(0, len(ids), CHUNK_SIZE):
+                UploaderRegistrationRequest.objects\
+                    .filter(pk__in=ids[start:start + CHUNK_SIZE])\
+                    .update(**updates)
+            changed.extend(row[1:] for row in rows)
+    _requests_changed(changed)
+    return len(changed)
+
+
+def approve_registration_requests(request_ids, storage_box_id,
+                                  approval_expiry=None,
+                                  approver_comments=None):
+    '''
+    Approves the registration requests with request_ids, uploading to
+    the storage box with storage_box_id, until approval_expiry (a date,
+    or None for no expiry).  Returns the number of requests approved.
+    '''
+    request_ids = list(set(request_ids))
+    updates = dict(approved=True,
+                   approved_storage_box_id=storage_box_id,
+                   approval_time=datetime.now(),
+                   approval_expiry=approval_expiry)
+    if approver_comments is not None:
+        updates['approver_comments'] = approver_comments
+    return _update(
+        [UploaderRegistrationRequest.objects.filter(
+            pk__in=request_ids[start:start + CHUNK_SIZE])
+         for start in range(0, len(request_ids), CHUNK_SIZE)],
+        **updates)
+
+
+def expire_approvals(today=None):
+    '''
+    Revokes the approval of registration requests whose approval_expiry
+    is before today, clearing their storage box, which DataFile creation
+    uses regardless of approved.  Returns the number of requests expired.
+    '''
+    today = today or date.today()
+    return _update(
+        [UploaderRegistrationRequest.objects.filter(
+            approved=True, approval_expiry__lt=today)],
+        approved=False, approved_storage_box=None)
@@ -0,0 +1,11 @@
+from django.apps import AppConfig
+
+
+class MyDataConfig(AppConfig):
+    name = 'tardis.apps.mydata'
+    label = 'mydata'
+    verbose_name = 'MyData'
+
+    def ready(self):
+        # Connect signal receivers once the models are loaded:
+        from . import signals  # noqa
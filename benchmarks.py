@@ -0,0 +1,183 @@
+"""
+Benchmarks for the MyData app's hot paths
+
+Each benchmark populates the database with a given number of rows,
+times some operations and returns a dict mapping each operation's
+label to its mean duration in seconds.  Benchmarks are run inside a
+transaction which is rolled back afterwards, see the mydata_benchmark
+management command.
+"""
+import time
+from collections import OrderedDict
+
+from django.contrib.auth.models import User
+from django.db import transaction
+
+from tardis.tardis_portal.models.access_control import ObjectACL
+from tardis.tardis_portal.models.datafile import DataFile
+from tardis.tardis_portal.models.datafile import DataFileObject
+from tardis.tardis_portal.models.dataset import Dataset
+from tardis.tardis_portal.models.experiment import Experiment
+from tardis.tardis_portal.models.parameters import Schema
+from tardis.tardis_portal.models.storage import StorageBox
+
+from . import acl
+from . import registry
+from . import replica_index
+from .schemas import DEFAULT_EXPERIMENT_SCHEMA
+
+BENCHMARKS = OrderedDict()
+
+
+def benchmark(name):
+    '''
+    Registers a benchmark function taking size and repeat arguments.
+    '''
+    def register(func):
+        BENCHMARKS[name] = func
+        return func
+    return register
+
+
+class _Rollback(Exception):
+    pass
+
+
+def run(name, size, repeat=10):
+    '''
+    Runs the named benchmark with size rows, discarding any data created.
+    '''
+    results = {}
+    try:
+        with transaction.atomic():
+            results.update(BENCHMARKS[name](size, repeat))
+            raise _Rollback()
+    except _Rollback:
+        pass
+    return results
+
+
+def mean_time(func, repeat):
+    start = time.time()
+    for _ in range(repeat):
+        func()
+    return (time.time() - start) / repeat
+
+
+@benchmark('acl')
+def benchmark_acl(size, repeat):
+    '''
+    Compares membership tests against Experiment.safe.all(user) with the
+    helpers in acl.py, for a user who can access size experiments.
+    '''
+    user = User.objects.create_user(username='mydata-benchmark-acl')
+    Experiment.objects.bulk_create(
+        [Experiment(title='MyData ACL benchmark %d' % index,
+                    created_by=user)
+         for index in range(size)])
+    experiment_ids = list(
+        Experiment.objects.filter(created_by=user)
+        .order_by('id').values_list('id', flat=True))
+    content_type = Experiment.objects.first().get_ct()
+    ObjectACL.objects.bulk_create(
+        [ObjectACL(content_type=content_type,
+                   object_id=experiment_id,
+                   pluginId='django_user',
+                   entityId=str(user.id),
+                   canRead=True,
+                   isOwner=True,
+                   aclOwnershipType=ObjectACL.OWNER_OWNED)
+         for experiment_id in experiment_ids])
+    target = experiment_ids[-1]
+    batch = experiment_ids[-100:]
+
+    def materialized():
+        experiment = Experiment.objects.get(pk=target)
+        assert experiment in Experiment.safe.all(user)
+
+    def materialized_batch():
+        accessible = Experiment.safe.all(user)
+        assert all(Experiment.objects.get(pk=experiment_id) in accessible
+                   for experiment_id in batch)
+
+    return OrderedDict([
+        ('safe.all membership', mean_time(materialized, repeat)),
+        ('can_access_experiment',
+         mean_time(lambda: acl.can_access_experiment(user, target),
+                   repeat)),
+        ('safe.all membership x%d' % len(batch),
+         mean_time(materialized_batch, repeat)),
+        ('accessible_experiment_ids x%d' % len(batch),
+         mean_time(lambda: acl.accessible_experiment_ids(user, batch),
+                   repeat)),
+    ])
+
+
+@benchmark('replica_lookup')
+def benchmark_replica_lookup(size, repeat):
+    '''
+    Compares url exact and startswith lookups on DataFileObject.uri with
+    the same lookups through ReplicaURIIndex, with size DataFileObjects.
+    '''
+    dataset = Dataset(description='MyData replica lookup benchmark')
+    dataset.save()
+    storage_box = StorageBox(name='mydata-benchmark', max_size=0)
+    storage_box.save()
+    DataFile.objects.bulk_create(
+        [DataFile(dataset=dataset, filename='file%d.dat' % index, size=0)
+         for index in range(size)])
+    datafile_ids = DataFile.objects.filter(dataset=dataset)\
+        .order_by('id').values_list('id', flat=True)
+    DataFileObject.objects.bulk_create(
+        [DataFileObject(datafile_id=datafile_id, storage_box=storage_box,
+                        uri='mydata/%d-benchmark/file%d.dat'
+                        % (datafile_id, datafile_id))
+         for datafile_id in datafile_ids])
+    dfos = DataFileObject.objects.filter(storage_box=storage_box)
+    replica_index.rebuild_index(queryset=dfos)
+    target = dfos.order_by('-id').values_list('uri', flat=True)[0]
+    prefix = target.rsplit('/', 1)[0] + '/'
+
+    def lookup(**filters):
+        return lambda: list(DataFileObject.objects.filter(**filters)
+                            .values_list('id', flat=True))
+
+    return OrderedDict([
+        ('uri exact', mean_time(lookup(uri=target), repeat)),
+        ('indexed exact',
+         mean_time(lookup(**replica_index.build_uri_filters(exact=target)),
+                   repeat)),
+        ('uri startswith',
+         mean_time(lookup(uri__startswith=prefix), repeat)),
+        ('indexed startswith',
+         mean_time(lookup(**replica_index.build_uri_filters(
+             startswith=prefix)), repeat)),
+    ])
+
+
+@benchmark('registry')
+def benchmark_registry(size, repeat):
+    '''
+    Measures the time to load the registry (as each process does on its
+    first MyData request) with size StorageBoxes, and compares registry
+    lookups with the queries they replace.
+    '''
+    StorageBox.objects.bulk_create(
+        [StorageBox(name='mydata-benchmark-%d' % index, max_size=0)
+         for index in range(size)])
+    registry.invalidate()
+    target = StorageBox.objects.order_by('-id').values_list(
+        'id', flat=True)[0]
+
+    return OrderedDict([
+        ('load_registry', mean_time(registry.load_registry, repeat)),
+        ('StorageBox.objects.get',
+         mean_time(lambda: StorageBox.objects.get(pk=target), repeat)),
+        ('registry.get_storage_box',
+         mean_time(lambda: registry.get_storage_box(target), repeat)),
+        ('Schema.objects.get',
+         mean_time(lambda: Schema.objects.filter(
+             namespace=DEFAULT_EXPERIMENT_SCHEMA).first(), repeat)),
+        ('registry.get_schema_id',
+         mean_time(registry.get_schema_id, repeat)),
+    ])
@@ -0,0 +1,135 @@
+"""
+Streaming export of the uploader fleet's inventory as CSV or JSON Lines
+
+Uploaders are read a chunk at a time (by primary key), with one query
+per chunk for their settings and one for their registration requests,
+so memory use doesn't grow with the size of the fleet.  Used by the
+mydata_export_fleet management command and the export_fleet view.
+"""
+import csv
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+from django.utils import six
+
+from .models import Uploader
+from .models import UploaderRegistrationRequest
+from .models import UploaderSetting
+
+FIELDS = [
+    'id', 'uuid', 'name', 'contact_name', 'contact_email',
+    'hostname', 'interface', 'mac_address', 'wan_ip_address',
+    'user_agent_name', 'user_agent_version', 'user_agent_install_location',
+    'os_platform', 'os_system', 'os_release', 'os_version', 'os_username',
+    'machine', 'architecture', 'processor', 'memory', 'cpus',
+    'disk_usage', 'data_path', 'default_user',
+    'created_time', 'updated_time', 'settings_updated',
+    'settings_downloaded',
+]
+
+COLUMNS = FIELDS + ['registration_status', 'approved_storage_boxes',
+                    'settings']
+
+FORMATS = ('csv', 'jsonl')
+
+CONTENT_TYPES = {
+    'csv': 'text/csv',
+    'jsonl': 'application/x-ndjson',
+}
+
+
+def iter_uploaders(since=None, chunk_size=500):
+    '''
+    Yields a dict for each uploader (optionally only those whose record
+    or settings have been updated since a datetime), with its FIELDS plus:
+
+    * registration_status: "approved" if any of its registration
+      requests are approved, "pending" if it has requests but none are
+      approved, or "unregistered",
+    * approved_storage_boxes: names of its requests' approved storage
+      boxes,
+    * settings: a dict of its settings.
+    '''
+    uploaders = Uploader.objects.order_by('pk')
+    if since is not None:
+        uploaders = uploaders.filter(Q(updated_time__gte=since) |
+                                     Q(settings_updated__gte=since))
+    last_id = 0
+    while True:
+        chunk = list(uploaders.filter(pk__gt=last_id)
+                     .values(*FIELDS)[:chunk_size].iterator())
+        if not chunk:
+            return
+        last_id = chunk[-1]['id']
+        ids = [row['id'] for row in chunk]
+
+        settings = dict((uploader_id, {}) for uploader_id in ids)
+        for uploader_id, key, value in UploaderSetting.objects\
+                .filter(uploader_id__in=ids)\
+                .values_list('uploader_id', 'key', 'value').iterator():
+            settings[uploader_id][key] = value
+
+        statuses = {}
+        storage_boxes = dict((uploader_id, []) for uploader_id in ids)
+        for uploader_id, approved, storage_box_name in \
+                UploaderRegistrationRequest.objects\
+                .filter(uploader_id__in=ids)\
+                .values_list('uploader_id', 'approved',
+                             'approved_storage_box__name').iterator():
+            if approved:
+                statuses[uploader_id] = 'approved'
+                if storage_box_name:
+                    storage_boxes[uploader_id].append(storage_box_name)
+            else:
+                statuses.setdefault(uploader_id, 'pending')
+
+        for row in chunk:
+            row['registration_status'] = \
+                statuses.get(row['id'], 'unregistered')
+            row['approved_storage_boxes'] = storage_boxes[row['id']]
+            row['settings'] = settings[row['id']]
+            yield row
+
+
+def iter_jsonl(rows):
+    for row in rows:
+        yield json.dumps(row, cls=DjangoJSONEncoder) + '\n'
+
+
+class _Echo(object):
+    '''
+    File-like object which returns what's written to it, for csv.writer
+    '''
+    def write(self, value):
+        return value
+
+
+def _csv_value(value):
+    if isinstance(value, (dict, list)):
+        value = json.dumps(value, cls=DjangoJSONEncoder)
+    elif value is None:
+        value = ''
+    value = six.text_type(value)
+    if six.PY2:
+        return value.encode('utf-8')
+    return value
+
+
+def iter_csv(rows):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(COLUMNS)
+    for row in rows:
+        yield writer.writerow([_csv_value(row[column])
+                               for column in COLUMNS])
+
+
+def iter_export(export_format, since=None, chunk_size=500):
+    '''
+    Yields the fleet inventory in export_format ("csv" or "jsonl"),
+    a line at a time.
+    '''
+    rows = iter_uploaders(since=since, chunk_size=chunk_size)
+    if export_format == 'csv':
+        return iter_csv(rows)
+    return iter_jsonl(rows)
@@ -0,0 +1,370 @@
+"""
+Load generator simulating concurrent MyData clients
+
+Each simulated client runs a realistic MyData session against a running
+MyTardis server (e.g. "python mytardis.py runserver" on SQLite or a
+local PostgreSQL database):
+
+1. register an uploader and an uploader registration request, have it
+   approved and wait for the approval,
+2. upload the uploader's settings,
+3. poll the uploader's settings,
+4. look up (or get-or-create) a default experiment,
+5. get-or-create datasets and create datafiles,
+6. poll the datafiles' replicas.
+
+The run_levels function runs sessions at increasing concurrency and
+reports throughput, tail latency and errors (separating lock/contention
+errors from others) per endpoint.  See the mydata_loadtest management
+command.
+"""
+import json
+import math
+import threading
+import time
+import uuid
+from collections import defaultdict
+
+from django.utils.six.moves.urllib.error import HTTPError
+from django.utils.six.moves.urllib.error import URLError
+from django.utils.six.moves.urllib.parse import urlencode
+from django.utils.six.moves.urllib.request import Request
+from django.utils.six.moves.urllib.request import urlopen
+
+#: Response text indicating database lock contention
+CONTENTION_MARKERS = (
+    'database is locked',
+    'deadlock',
+    'could not serialize',
+    'lock wait timeout',
+    'could not obtain lock',
+)
+
+#: Status codes indicating contention (409 is returned for duplicate keys)
+CONTENTION_STATUSES = (409, 423, 429, 503)
+
+
+def classify(status, body):
+    '''
+    Returns None for a successful response, 'contention' for lock or
+    contention errors, or 'error' for any other failure.
+    '''
+    if status is not None and status < 400:
+        return None
+    text = (body or '').lower()
+    if status in CONTENTION_STATUSES or \
+            any(marker in text for marker in CONTENTION_MARKERS):
+        return 'contention'
+    return 'error'
+
+
+def percentile(sorted_values, fraction):
+    '''
+    Nearest-rank percentile of a sorted list.
+    '''
+    if not sorted_values:
+        return 0.0
+    rank = int(math.ceil(fraction * len(sorted_values))) - 1
+    return sorted_values[max(0, min(rank, len(sorted_values) - 1))]
+
+
+class Recorder(object):
+    '''
+    Collects the latency and outcome of each request, per endpoint.
+    '''
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(lambda: defaultdict(int))
+
+    def record(self, endpoint, seconds, outcome):
+        with self.lock:
+            self.latencies[endpoint].append(seconds)
+            if outcome:
+                self.errors[endpoint][outcome] += 1
+
+    def summarize(self, elapsed):
+        '''
+        Returns a dict mapping each endpoint to its request count,
+        throughput (requests per second over elapsed seconds),
+        p50/p95/p99/max latencies and error counts.
+        '''
+        summary = {}
+        for endpoint, latencies in self.latencies.items():
+            latencies = sorted(latencies)
+            summary[endpoint] = {
+                'requests': len(latencies),
+                'throughput': len(latencies) / elapsed if elapsed else 0.0,
+                'p50': percentile(latencies, 0.50),
+                'p95': percentile(latencies, 0.95),
+                'p99': percentile(latencies, 0.99),
+                'max': latencies[-1],
+                'contention': self.errors[endpoint]['contention'],
+                'errors': self.errors[endpoint]['error'],
+            }
+        return summary
+
+
+class LoadTestError(Exception):
+    pass
+
+
+def approver(storage_box_id):
+    '''
+    Returns a function approving a registration request (given its ID)
+    for uploads to the storage box with storage_box_id, directly in the
+    database as a facility manager would in the admin.
+    '''
+    def approve(request_id):
+        from . import approvals
+        approvals.approve_registration_requests([request_id],
+                                                storage_box_id)
+    return approve
+
+
+class MyDataClient(object):
+    '''
+    Simulates one MyData instance, authenticating as a MyTardis user who
+    is a member of the instrument's facility managers group.  approve
+    is called with the ID of the uploader's registration request (see
+    approver), because uploads are refused until it is approved.
+    '''
+    def __init__(self, base_url, username, api_key, instrument_id,
+                 recorder, approve, files_per_session=10):
+        self.base_url = base_url.rstrip('/')
+        self.auth = 'ApiKey %s:%s' % (username, api_key)
+        self.username = username
+        self.instrument_id = instrument_id
+        self.recorder = recorder
+        self.approve = approve
+        self.files_per_session = files_per_session
+        self.uuid = str(uuid.uuid4())
+        self.fingerprint = uuid.uuid4().hex
+        self.uploader_uri = None
+
+    def send(self, method, url, body):
+        '''
+        Sends a request, returning (status, response text), with a status
+        of None if the server couldn't be reached.
+        '''
+        request = Request(url, data=body)
+        request.get_method = lambda: method
+        request.add_header('Authorization', self.auth)
+        request.add_header('Content-Type', 'application/json')
+        request.add_header('Accept', 'application/json')
+        try:
+            response = urlopen(request)
+            return response.getcode(), response.read().decode('utf-8')
+        except HTTPError as err:
+            return err.code, err.read().decode('utf-8', 'replace')
+        except URLError as err:
+            return None, str(err)
+
+    def request(self, endpoint, method, path, params=None, data=None):
+        url = self.base_url + path
+        if params:
+            url += '?' + urlencode(params)
+        body = json.dumps(data).encode('utf-8') if data is not None \
+            else None
+        start = time.time()
+        status, text = self.send(method, url, body)
+        outcome = classify(status, text)
+        self.recorder.record(endpoint, time.time() - start, outcome)
+        if outcome:
+            raise LoadTestError('%s %s: %s %s' % (method, path, status,
+                                                  text[:200]))
+        try:
+            return json.loads(text) if text else None
+        except ValueError:
+            # e.g. the staging path returned when creating a DataFile
+            return text
+
+    def register(self):
+        uploader = self.request(
+            'mydata_uploader POST', 'POST', '/api/v1/mydata_uploader/',
+            data={
+                'uuid': self.uuid,
+                'name': 'Load test %s' % self.uuid[:8],
+                'contact_name': 'Load Test',
+                'contact_email': 'loadtest@example.com',
+                'interface': 'Ethernet',
+                'mac_address': self.uuid[:17],
+                'instruments': ['/api/v1/instrument/%s/'
+                                % self.instrument_id],
+            })
+        self.uploader_uri = uploader['resource_uri']
+        registration_request = self.request(
+            'mydata_uploaderregistrationrequest POST', 'POST',
+            '/api/v1/mydata_uploaderregistrationrequest/',
+            data={
+                'uploader': self.uploader_uri,
+                'requester_name': 'Load Test',
+                'requester_email': 'loadtest@example.com',
+                'requester_public_key': 'ssh-rsa LOADTEST',
+                'requester_key_fingerprint': self.fingerprint,
+            })
+        self.approve(registration_request['id'])
+        found = self.request(
+            'mydata_uploaderregistrationrequest wait', 'GET',
+            '/api/v1/mydata_uploaderregistrationrequest/wait/',
+            params={'format': 'json', 'uploader__uuid': self.uuid,
+                    'requester_key_fingerprint': self.fingerprint,
+                    'timeout': 10})
+        if not any(found_request['approved']
+                   for found_request in found['objects']):
+            raise LoadTestError('Registration request %s not approved'
+                                % registration_request['id'])
+
+    def upload_settings(self):
+        self.request(
+            'mydata_uploader PUT', 'PUT', self.uploader_uri,
+            data={
+                'uuid': self.uuid,
+                'settings': [{'key': 'key%d' % index,
+                              'value': 'value%d' % index}
+                             for index in range(20)],
+            })
+
+    def poll_settings(self):
+        self.request('mydata_uploader GET', 'GET',
+                     '/api/v1/mydata_uploader/',
+                     params={'format': 'json', 'uuid': self.uuid})
+
+    def get_experiment(self, user_folder_name):
+        params = {
+            'format': 'json',
+            'uploader': self.uuid,
+            'folder_structure': 'Username / Dataset',
+            'user_folder_name': user_folder_name,
+        }
+        found = self.request('mydata_experiment GET', 'GET',
+                             '/api/v1/mydata_experiment/', params=params)
+        if found['objects']:
+            return found['objects'][0]['resource_uri']
+        experiment = self.request(
+            'mydata_experiment get_or_create', 'POST',
+            '/api/v1/mydata_experiment/get_or_create/',
+            data={
+                'title': 'Load test - %s' % user_folder_name,
+                'description': 'Uploaded by the MyData load test',
+                'folder_structure': 'Username / Dataset',
+                'parameter_sets': [{
+                    'schema': 'http://mytardis.org/schemas'
+                              '/mydata/defaultexperiment',
+                    'parameters': [
+                        {'name': 'uploader', 'value': self.uuid},
+                        {'name': 'user_folder_name',
+                         'value': user_folder_name},
+                    ]
+                }]
+            })
+        return experiment['resource_uri']
+
+    def get_datasets(self, experiment_uri, count):
+        datasets = self.request(
+            'mydata_dataset get_or_create_bulk', 'POST',
+            '/api/v1/mydata_dataset/get_or_create_bulk/',
+            data={'objects': [
+                {'experiment': experiment_uri,
+                 'description': 'Dataset %d' % index,
+                 'instrument': self.instrument_id}
+                for index in range(count)]})
+        return [dataset['resource_uri'] for dataset in datasets['objects']]
+
+    def create_datafiles(self, dataset_uri):
+        dataset_id = dataset_uri.rstrip('/').split('/')[-1]
+        for index in range(self.files_per_session):
+            filename = '%s-%d.dat' % (self.uuid[:8], index)
+            self.request(
+                'mydata_dataset_file POST', 'POST',
+                '/api/v1/mydata_dataset_file/',
+                data={
+                    'dataset': dataset_uri,
+                    'filename': filename,
+                    'directory': '',
+                    'md5sum': 'd41d8cd98f00b204e9800998ecf8427e',
+                    'size': 0,
+                    'mimetype': 'application/octet-stream',
+                    'uploader_uuid': self.uuid,
+                    'requester_key_fingerprint': self.fingerprint,
+                })
+            datafiles = self.request(
+                'mydata_dataset_file GET', 'GET',
+                '/api/v1/mydata_dataset_file/',
+                params={'format': 'json', 'dataset__id': dataset_id,
+                        'filename': filename, 'directory': ''})
+            for datafile in datafiles['objects']:
+                for replica in datafile.get('replicas', []):
+                    # MyData polls its own replica resource:
+                    replica_id = \
+                        replica['resource_uri'].rstrip('/').split('/')[-1]
+                    self.request('mydata_replica GET', 'GET',
+                                 '/api/v1/mydata_replica/%s/' % replica_id,
+                                 params={'format': 'json'})
+
+    def run_session(self):
+        self.register()
+        self.upload_settings()
+        self.poll_settings()
+        experiment_uri = self.get_experiment(self.username)
+        dataset_uris = self.get_datasets(experiment_uri, 2)
+        self.create_datafiles(dataset_uris[0])
+        self.poll_settings()
+
+
+def run_level(concurrency, sessions_per_client, **client_kwargs):
+    '''
+    Runs sessions_per_client sessions in each of concurrency threads,
+    returning (elapsed seconds, summary per endpoint, failed sessions).
+    '''
+    recorder = Recorder()
+    failures = []
+
+    def run_client():
+        for _ in range(sessions_per_client):
+            client = MyDataClient(recorder=recorder, **client_kwargs)
+            try:
+                client.run_session()
+            except LoadTestError as err:
+                failures.append(str(err))
+
+    threads = [threading.Thread(target=run_client)
+               for _ in range(concurrency)]
+    start = time.time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.time() - start
+    return elapsed, recorder.summarize(elapsed), failures
+
+
+def format_report(concurrency, elapsed, summary, failures):
+    lines = ['%d concurrent clients, %.1f s, %d failed sessions'
+             % (concurrency, elapsed, len(failures)),
+             '  %-40s %7s %8s %8s %8s %8s %6s %6s'
+             % ('endpoint', 'count', 'req/s', 'p50 ms', 'p95 ms',
+                'p99 ms', 'lock', 'error')]
+    for endpoint in sorted(summary):
+        stats = summary[endpoint]
+        lines.append(
+            '  %-40s %7d %8.1f %8.1f %8.1f %8.1f %6d %6d'
+            % (endpoint, stats['requests'], stats['throughput'],
+               stats['p50'] * 1000, stats['p95'] * 1000,
+               stats['p99'] * 1000, stats['contention'], stats['errors']))
+    return '\n'.join(lines)
+
+
+def run_levels(levels, sessions_per_client, output, **client_kwargs):
+    '''
+    Runs run_level at each concurrency level, writing a report for each
+    level to output (a file-like object) and returning the summaries.
+    '''
+    results = []
+    for concurrency in levels:
+        elapsed, summary, failures = run_level(
+            concurrency, sessions_per_client, **client_kwargs)
+        output.write(format_report(concurrency, elapsed, summary,
+                                   failures) + '\n')
+        results.append((concurrency, summary))
+    return results
@@ -0,0 +1,262 @@
+"""
+Result cache for MyData's default experiment lookups
+
+MyData repeatedly asks ExperimentAppResource.obj_get_list the same
+(uploader or title, folder_structure, folder name) questions, and many
+of the answers are "no such experiment yet".  Both hits and misses are
+cached here, keyed on the normalized query and the requesting user.
+
+Rather than deleting entries (which would require knowing every key
+that might be affected by a change), each entry records the generation
+stamps of the scopes it depends on:
+
+* the lookup scope (the title or the uploader UUID being queried),
+* the requesting user (whose group memberships and ACLs affect which
+  experiments they can access),
+* the user folder name being queried, which is matched against the
+  username and email address of a User, if one exists,
+* for hits, the experiment which was found.
+
+An entry is only used if all of its stamps still match the current
+generations, so bumping a single scope's generation precisely
+invalidates the entries depending on it.  The generations are bumped
+by the signal receivers in signals.py, once the change has been
+committed.
+
+Hit and miss statistics are counted in each process and added to the
+shared counters at most every MYDATA_EXPERIMENT_LOOKUP_CACHE_STATS_INTERVAL
+seconds, so that lookups don't write to the cache (which is a database
+write with MyTardis's default DatabaseCache) to count themselves.
+
+A shared cache backend (e.g. MyTardis's default DatabaseCache) is
+required in multi-process deployments, otherwise invalidations made in
+one process won't be seen by the others.
+"""
+import hashlib
+import json
+import threading
+import time
+import uuid
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import caches
+
+from .utils import on_commit
+
+KEY_PREFIX = 'mydata:explookup'
+
+#: Cached value representing "no matching experiment"
+MISS = 'miss'
+
+
+def is_enabled():
+    return getattr(settings, 'MYDATA_EXPERIMENT_LOOKUP_CACHE_ENABLED', True)
+
+
+def get_cache():
+    return caches[getattr(settings, 'MYDATA_EXPERIMENT_LOOKUP_CACHE',
+                          'default')]
+
+
+def get_timeout():
+    return getattr(settings, 'MYDATA_EXPERIMENT_LOOKUP_CACHE_TIMEOUT', 300)
+
+
+def _hash(value):
+    if not isinstance(value, bytes):
+        value = value.encode('utf-8')
+    return hashlib.sha1(value).hexdigest()
+
+
+def title_scope(title):
+    return 'title:%s' % _hash(title)
+
+
+def uploader_scope(uploader_uuid):
+    return 'uploader:%s' % _hash(uploader_uuid)
+
+
+def user_scope(user_id):
+    return 'user:%s' % user_id
+
+
+def folder_scope(user_folder_name):
+    return 'folder:%s' % _hash(user_folder_name.lower())
+
+
+def experiment_scope(experiment_id):
+    return 'experiment:%s' % experiment_id
+
+
+def _generation_key(scope):
+    return '%s:gen:%s' % (KEY_PREFIX, scope)
+
+
+def _entry_key(query, user_id):
+    query_json = json.dumps([user_id, sorted(query.items())])
+    return '%s:entry:%s' % (KEY_PREFIX, _hash(query_json))
+
+
+def _query_scopes(query, user_id):
+    if query.get('title') is not None:
+        scopes = [title_scope(query['title'])]
+    else:
+        scopes = [uploader_scope(query['uploader'])]
+    scopes.append(user_scope(user_id))
+    if query.get('user_folder_name'):
+        scopes.append(folder_scope(query['user_folder_name']))
+    return scopes
+
+
+def _get_generations(cache, scopes, found=None):
+    '''
+    Returns a dict mapping each scope to its current generation,
+    creating generations for scopes which don't have one yet
+    (or whose generation has been evicted from the cache).  found may
+    hold the results of a get_many which already included the scopes'
+    generation keys.
+    '''
+    keys = dict((_generation_key(scope), scope) for scope in scopes)
+    if found is None:
+        found = cache.get_many(keys.keys())
+    generations = {}
+    for key, scope in keys.items():
+        if key not in found:
+            cache.add(key, uuid.uuid4().hex, None)
+            found[key] = cache.get(key)
+        generations[scope] = found[key]
+    return generations
+
+
+def bump(*scopes):
+    '''
+    Invalidates all cached lookups depending on any of the given scopes,
+    once the current transaction has been committed (so that a lookup
+    made in between can't cache what it found before the change under
+    the new generations).
+    '''
+    if not scopes or not is_enabled():
+        return
+    generations = dict((_generation_key(scope), uuid.uuid4().hex)
+                       for scope in scopes)
+    on_commit(lambda: get_cache().set_many(generations, None))
+
+
+#: This process's statistics which haven't been flushed to the cache yet
+_stats = Counter()
+_stats_lock = threading.Lock()
+_stats_state = {'flushed': time.time()}
+
+
+def _incr(cache, name, delta=1):
+    key = '%s:stats:%s' % (KEY_PREFIX, name)
+    try:
+        cache.incr(key, delta)
+    except ValueError:
+        if not cache.add(key, delta, None):
+            cache.incr(key, delta)
+
+
+def flush_stats(cache=None):
+    '''
+    Adds this process's statistics to the shared counters in the cache.
+    '''
+    with _stats_lock:
+        pending = dict(_stats)
+        _stats.clear()
+        _stats_state['flushed'] = time.time()
+    if cache is None:
+        cache = get_cache()
+    for name, delta in pending.items():
+        if delta:
+            _incr(cache, name, delta)
+
+
+def _count(cache, outcome, elapsed):
+    '''
+    Counts a hit or a miss taking elapsed seconds, flushing the counts
+    if the last flush was long enough ago.
+    '''
+    interval = getattr(
+        settings, 'MYDATA_EXPERIMENT_LOOKUP_CACHE_STATS_INTERVAL', 60)
+    with _stats_lock:
+        _stats[outcome + 's'] += 1
+        _stats[outcome + '_time_us'] += int(elapsed * 1e6)
+        due = time.time() - _stats_state['flushed'] >= interval
+    if due:
+        flush_stats(cache)
+
+
+def get_or_compute(query, user, compute):
+    '''
+    Returns the experiment ID for a normalized default experiment query
+    made by user, or None if there is no matching experiment.
+
+    compute is called (with no arguments) to perform the lookup on a
+    cache miss, and must return an experiment ID or None.
+    '''
+    if not is_enabled():
+        return compute()
+    start = time.time()
+    cache = get_cache()
+    user_id = user.id if user.is_authenticated() else None
+    key = _entry_key(query, user_id)
+    scopes = _query_scopes(query, user_id)
+    # Fetch the entry and the generations of the scopes every entry for
+    # the query depends on in one round trip.  The generations are read
+    # before computing on a miss, so that a change committed during the
+    # lookup invalidates what we're about to cache:
+    found = cache.get_many([key] + [_generation_key(scope)
+                                    for scope in scopes])
+    generations = _get_generations(cache, scopes, found)
+    entry = found.get(key)
+    if entry is not None:
+        result, stamps = entry
+        # Only hits' experiment scopes are left to fetch:
+        extra = [scope for scope in stamps if scope not in generations]
+        current = dict(generations)
+        if extra:
+            current.update(_get_generations(cache, extra))
+        if all(scope in stamps for scope in scopes) and \
+                all(current[scope] == stamp
+                    for scope, stamp in stamps.items()):
+            _count(cache, 'hit', time.time() - start)
+            return None if result == MISS else result
+
+    stamps = generations
+    result = compute()
+    if result is not None:
+        stamps.update(
+            _get_generations(cache, [experiment_scope(result)]))
+    cache.set(key, (MISS if result is None else result, stamps),
+              get_timeout())
+    _count(cache, 'miss', time.time() - start)
+    return result
+
+
+def get_stats():
+    '''
+    Returns hit/miss counts, the hit ratio and an estimate of the time
+    saved by the cache (hits multiplied by the mean lookup time on a miss,
+    less the time spent serving hits), for monitoring.  Other processes'
+    most recent lookups may not have been counted yet.
+    '''
+    cache = get_cache()
+    flush_stats(cache)
+    names = ['hits', 'misses', 'hit_time_us', 'miss_time_us']
+    found = cache.get_many(['%s:stats:%s' % (KEY_PREFIX, name)
+                            for name in names])
+    stats = dict((name, found.get('%s:stats:%s' % (KEY_PREFIX, name), 0))
+                 for name in names)
+    lookups = stats['hits'] + stats['misses']
+    stats['hit_ratio'] = float(stats['hits']) / lookups if lookups else 0.0
+    if stats['misses']:
+        mean_miss_time_us = float(stats['miss_time_us']) / stats['misses']
+    else:
+        mean_miss_time_us = 0.0
+    stats['time_saved_seconds'] = max(
+        0.0,
+        (stats['hits'] * mean_miss_time_us - stats['hit_time_us']) / 1e6)
+    stats['enabled'] = is_enabled()
+    return stats
@@ -0,0 +1,35 @@
+"""
+Runs benchmarks of the MyData app's hot paths at increasing table sizes
+"""
+from django.core.management.base import BaseCommand
+from django.core.management.base import CommandError
+
+from ... import benchmarks
+
+
+class Command(BaseCommand):
+    help = "Benchmarks MyData's hot paths at increasing table sizes.  " \
+        "Rows created by the benchmarks are rolled back afterwards.  " \
+        "Available benchmarks: %s" % ', '.join(benchmarks.BENCHMARKS)
+
+    def add_arguments(self, parser):
+        parser.add_argument('names', nargs='*',
+                            help='Benchmarks to run (default: all)')
+        parser.add_argument('--sizes', default='100,1000,10000',
+                            help='Comma-separated numbers of rows')
+        parser.add_argument('--repeat', type=int, default=10,
+                            help='Number of times to time each operation')
+
+    def handle(self, *args, **options):
+        names = options['names'] or list(benchmarks.BENCHMARKS)
+        for name in names:
+            if name not in benchmarks.BENCHMARKS:
+                raise CommandError('Unknown benchmark: %s' % name)
+        sizes = [int(size) for size in options['sizes'].split(',')]
+        for name in names:
+            self.stdout.write('%s:' % name)
+            for size in sizes:
+                results = benchmarks.run(name, size, options['repeat'])
+                for label, seconds in results.items():
+                    self.stdout.write('  %8d rows  %-40s %10.3f ms'
+                                      % (size, label, seconds * 1000))
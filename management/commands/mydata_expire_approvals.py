@@ -0,0 +1,15 @@
+"""
+Revokes uploader registration approvals past their approval_expiry
+"""
+from django.core.management.base import BaseCommand
+
+from ... import approvals
+
+
+class Command(BaseCommand):
+    help = "Revokes the approval of uploader registration requests " \
+        "whose approval_expiry has passed."
+
+    def handle(self, *args, **options):
+        expired = approvals.expire_approvals()
+        self.stdout.write('Expired %d registration requests' % expired)
@@ -0,0 +1,39 @@
+"""
+Exports the uploader fleet's inventory as CSV or JSON Lines
+"""
+from django.core.management.base import BaseCommand
+from django.core.management.base import CommandError
+from django.utils.dateparse import parse_datetime
+
+from ... import export
+
+
+class Command(BaseCommand):
+    help = "Exports the uploader fleet's inventory (uploaders with their " \
+        "settings and registration status) as CSV or JSON Lines."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=export.FORMATS,
+                            default='csv')
+        parser.add_argument('--since', default=None,
+                            help='Only export uploaders updated since this '
+                            'timestamp, e.g. 2016-06-01T00:00:00')
+        parser.add_argument('--output', default=None,
+                            help='File to write to (default: stdout)')
+        parser.add_argument('--chunk-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        since = None
+        if options['since']:
+            since = parse_datetime(options['since'])
+            if since is None:
+                raise CommandError('Invalid timestamp: %s' % options['since'])
+        lines = export.iter_export(options['format'], since=since,
+                                   chunk_size=options['chunk_size'])
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                for line in lines:
+                    output.write(line)
+        else:
+            for line in lines:
+                self.stdout.write(line, ending='')
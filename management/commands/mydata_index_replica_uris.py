@@ -0,0 +1,20 @@
+"""
+Rebuilds the index of DataFileObject URIs used by the mydata_replica url
+filters
+"""
+from django.core.management.base import BaseCommand
+
+from ... import replica_index
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the index of DataFileObject URIs used by the " \
+        "mydata_replica url filters, e.g. after DataFileObjects have " \
+        "been updated in bulk."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        indexed = replica_index.rebuild_index(options['chunk_size'])
+        self.stdout.write('Indexed %d DataFileObjects' % indexed)
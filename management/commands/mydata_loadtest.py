@@ -0,0 +1,57 @@
+"""
+Simulates concurrent MyData clients against a running MyTardis server
+"""
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.core.management.base import CommandError
+
+from tardis.tardis_portal.models.storage import StorageBox
+
+from ... import loadtest
+
+
+class Command(BaseCommand):
+    help = "Replays MyData sessions from increasing numbers of concurrent " \
+        "simulated clients against a running MyTardis server (e.g. " \
+        "'python mytardis.py runserver'), reporting throughput, tail " \
+        "latency and lock/contention errors per endpoint.  The user must " \
+        "be a member of the instrument's facility managers group.  Each " \
+        "simulated uploader's registration request is approved for the " \
+        "given storage box directly in the database.  " \
+        "Uploaders, experiments, datasets and datafiles created by the " \
+        "load test are not cleaned up, so use a disposable database."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://127.0.0.1:8000',
+                            help='Base URL of the MyTardis server')
+        parser.add_argument('--username', required=True)
+        parser.add_argument('--instrument', type=int, required=True,
+                            help='ID of the instrument to upload from')
+        parser.add_argument('--storage-box', type=int, required=True,
+                            help='ID of the storage box the simulated '
+                            'uploaders are approved to upload to')
+        parser.add_argument('--levels', default='1,10,50,100,300',
+                            help='Comma-separated numbers of concurrent '
+                            'clients')
+        parser.add_argument('--sessions', type=int, default=1,
+                            help='Sessions run by each client per level')
+        parser.add_argument('--files', type=int, default=10,
+                            help='Datafiles created in each session')
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['username'])
+        except User.DoesNotExist:
+            raise CommandError('Unknown user: %s' % options['username'])
+        if not StorageBox.objects.filter(pk=options['storage_box']).exists():
+            raise CommandError('Unknown storage box: %s'
+                               % options['storage_box'])
+        levels = [int(level) for level in options['levels'].split(',')]
+        loadtest.run_levels(
+            levels, options['sessions'], self.stdout,
+            base_url=options['url'],
+            username=user.username,
+            api_key=user.api_key.key,
+            instrument_id=options['instrument'],
+            approve=loadtest.approver(options['storage_box']),
+            files_per_session=options['files'])
@@ -0,0 +1,26 @@
+"""
+Summarizes the hot spots across profiles captured from MyData requests
+"""
+from django.core.management.base import BaseCommand
+
+from ... import profiling
+
+
+class Command(BaseCommand):
+    help = "Summarizes the slowest views, SQL statements and functions " \
+        "across the profiles captured from MyData API requests."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dir', default=None,
+                            help='Directory containing the profiles '
+                            '(default: MYDATA_PROFILING_DIR)')
+        parser.add_argument('--limit', type=int, default=20,
+                            help='Number of entries in each list')
+        parser.add_argument('--sort', default='cumulative',
+                            help='pstats sort key for functions, '
+                            'e.g. cumulative or tottime')
+
+    def handle(self, *args, **options):
+        profiling.summarize_profiles(
+            options['dir'] or profiling.get_profiling_dir(), self.stdout,
+            limit=options['limit'], sort=options['sort'])
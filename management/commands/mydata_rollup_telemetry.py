@@ -0,0 +1,21 @@
+"""
+Downsamples expired uploader telemetry into hourly rollups
+"""
+from django.core.management.base import BaseCommand
+
+from ... import telemetry
+
+
+class Command(BaseCommand):
+    help = "Downsamples uploader telemetry older than " \
+        "MYDATA_TELEMETRY_RETENTION_DAYS into hourly rollups, and deletes " \
+        "rollups older than MYDATA_TELEMETRY_ROLLUP_RETENTION_DAYS."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        rolled_up, rollups_deleted = telemetry.rollup_telemetry(
+            chunk_size=options['chunk_size'])
+        self.stdout.write('Rolled up %d samples, deleted %d rollups'
+                          % (rolled_up, rollups_deleted))
@@ -0,0 +1,240 @@
+"""
+Compares a MyData folder manifest with a dataset's DataFiles
+
+A manifest is JSON Lines (optionally gzip-compressed), one entry per
+file in the dataset's folder:
+
+    {"path": "subdir/file.txt", "size": 1024, "mtime": 1466000000.0,
+     "md5": "..."}
+
+where md5 is optional and mtime is informational.  The manifest is
+decompressed and parsed incrementally, and compared with the dataset's
+DataFiles (and whether they have verified DataFileObjects) one chunk of
+entries at a time, with one query per chunk, so memory use doesn't grow
+with the size of the manifest.  The request's (compressed) manifest is
+spooled to a temporary file before the response is streamed, because
+reading a request while its response is being streamed can deadlock
+some WSGI servers and proxies.  Only the entries MyData needs to act on
+are returned, with a status of:
+
+* "missing": there's no DataFile for the path,
+* "size": the DataFile's size differs,
+* "md5": the DataFile's MD5 checksum differs from the entry's,
+* "unverified": none of the DataFile's DataFileObjects are verified.
+"""
+import json
+import zlib
+from tempfile import SpooledTemporaryFile
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import six
+
+from tardis.tardis_portal.models.datafile import DataFile
+
+#: Bytes read from the request (and decompressed) at a time
+READ_SIZE = 64 * 1024
+
+#: Maximum length of a manifest line
+MAX_LINE_LENGTH = 64 * 1024
+
+GZIP_MAGIC = b'\x1f\x8b'
+
+#: Default size of a spooled manifest kept in memory
+SPOOL_SIZE = 1024 * 1024
+
+
+class ManifestError(Exception):
+    pass
+
+
+def _decompressed(read):
+    '''
+    Yields the decompressed data from read(size), which returns gzip or
+    zlib-compressed data (detected from its header) or plain text, a
+    bounded amount at a time.
+    '''
+    data = read(READ_SIZE)
+    if data[:2] == GZIP_MAGIC:
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    elif data[:1] == b'\x78':
+        decompressor = zlib.decompressobj()
+    else:
+        decompressor = None
+    while data:
+        if decompressor is None:
+            yield data
+        else:
+            # Limit the output per step, so a small, highly compressed
+            # manifest can't expand into memory all at once:
+            output = decompressor.decompress(data, READ_SIZE)
+            while output:
+                yield output
+                output = decompressor.decompress(
+                    decompressor.unconsumed_tail, READ_SIZE)
+        data = read(READ_SIZE)
+    if decompressor is not None:
+        output = decompressor.flush()
+        if output:
+            yield output
+
+
+def normalize_path(path):
+    '''
+    Returns (directory, filename) for a path relative to the dataset's
+    folder, using the same separators as DataFile.directory.
+    '''
+    path = path.replace('\\', '/').strip('/')
+    while path.startswith('./'):
+        path = path[2:]
+    if '/' in path:
+        directory, filename = path.rsplit('/', 1)
+    else:
+        directory, filename = '', path
+    return directory, filename
+
+
+def iter_manifest(read):
+    '''
+    Yields the entries (dicts with at least path and size) of a manifest
+    read incrementally with read(size).  Raises ManifestError if the
+    manifest is invalid.
+    '''
+    buffered = b''
+    line_number = 0
+    try:
+        for data in _decompressed(read):
+            buffered += data
+            lines = buffered.split(b'\n')
+            buffered = lines.pop()
+            if len(buffered) > MAX_LINE_LENGTH:
+                raise ManifestError('Line %d is too long.'
+                                    % (line_number + 1))
+            for line in lines:
+                line_number += 1
+                entry = _parse_line(line, line_number)
+                if entry is not None:
+                    yield entry
+    except zlib.error as err:
+        raise ManifestError('Invalid compressed data: %s' % err)
+    line_number += 1
+    entry = _parse_line(buffered, line_number)
+    if entry is not None:
+        yield entry
+
+
+def _parse_line(line, line_number):
+    line = line.strip()
+    if not line:
+        return None
+    try:
+        entry = json.loads(line.decode('utf-8'))
+        if not isinstance(entry, dict):
+            raise ValueError('not an object')
+        if not isinstance(entry['path'], six.string_types) or \
+                not isinstance(entry.get('md5', ''), six.string_types):
+            raise ValueError('path and md5 must be strings')
+        entry['size'] = int(entry['size'])
+    except (KeyError, TypeError, ValueError) as err:
+        raise ManifestError('Invalid entry on line %d: %s'
+                            % (line_number, err))
+    return entry
+
+
+def _to_int(size):
+    # DataFile.size is a CharField in some MyTardis versions
+    try:
+        return int(size)
+    except (TypeError, ValueError):
+        return None
+
+
+def _diff_chunk(dataset_id, entries):
+    keys = [normalize_path(entry['path']) for entry in entries]
+    datafiles = {}
+    query = Q()
+    for directory in set(key[0] for key in keys):
+        filenames = set(key[1] for key in keys if key[0] == directory)
+        if directory:
+            query |= Q(directory=directory, filename__in=filenames)
+        else:
+            query |= (Q(directory='') | Q(directory__isnull=True)) & \
+                Q(filename__in=filenames)
+    for directory, filename, size, md5sum, verified in \
+            DataFile.objects.filter(query, dataset_id=dataset_id)\
+            .values_list('directory', 'filename', 'size', 'md5sum',
+                         'file_objects__verified'):
+        key = (directory or '', filename)
+        if key in datafiles:
+            datafiles[key]['verified'] |= bool(verified)
+        else:
+            datafiles[key] = {'size': _to_int(size), 'md5sum': md5sum,
+                              'verified': bool(verified)}
+    for entry, key in zip(entries, keys):
+        datafile = datafiles.get(key)
+        if datafile is None:
+            status = 'missing'
+        elif datafile['size'] != entry['size']:
+            status = 'size'
+        elif entry.get('md5') and datafile['md5sum'] and \
+                entry['md5'].lower() != datafile['md5sum'].lower():
+            status = 'md5'
+        elif not datafile['verified']:
+            status = 'unverified'
+        else:
+            continue
+        yield {'path': entry['path'], 'status': status}
+
+
+def diff_manifest(dataset_id, entries, chunk_size=None):
+    '''
+    Yields {"path": ..., "status": ...} for each manifest entry which is
+    missing, has a different size or MD5 checksum, or is unverified in
+    the dataset with dataset_id.
+    '''
+    if chunk_size is None:
+        # A chunk's query has up to two parameters per entry (when every
+        # entry is in a different directory) plus two more, which must
+        # stay within SQLite's limit of 999:
+        chunk_size = getattr(settings, 'MYDATA_MANIFEST_CHUNK_SIZE', 450)
+    chunk = []
+    for entry in entries:
+        chunk.append(entry)
+        if len(chunk) >= chunk_size:
+            for result in _diff_chunk(dataset_id, chunk):
+                yield result
+            chunk = []
+    if chunk:
+        for result in _diff_chunk(dataset_id, chunk):
+            yield result
+
+
+def spool(read, max_size=None):
+    '''
+    Copies everything read(size) returns to a temporary file, which is
+    kept in memory until it exceeds max_size bytes (or
+    MYDATA_MANIFEST_SPOOL_SIZE), and returns the file, positioned at its
+    start.
+    '''
+    if max_size is None:
+        max_size = getattr(settings, 'MYDATA_MANIFEST_SPOOL_SIZE', SPOOL_SIZE)
+    spooled = SpooledTemporaryFile(max_size=max_size)
+    data = read(READ_SIZE)
+    while data:
+        spooled.write(data)
+        data = read(READ_SIZE)
+    spooled.seek(0)
+    return spooled
+
+
+def iter_diff_lines(dataset_id, read):
+    '''
+    Yields the JSON Lines response for a manifest read with read(size).
+    An invalid manifest ends the response with an {"error": ...} line,
+    because the response's status has already been sent.
+    '''
+    try:
+        for result in diff_manifest(dataset_id, iter_manifest(read)):
+            yield json.dumps(result) + '\n'
+    except ManifestError as err:
+        yield json.dumps({'error': str(err)}) + '\n'
@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mydata', '0003_uploadersetting_blank'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='uploader',
+            name='name',
+            field=models.CharField(max_length=64, db_index=True),
+        ),
+        migrations.AlterField(
+            model_name='uploader',
+            name='hostname',
+            field=models.CharField(max_length=64, null=True, db_index=True),
+        ),
+        migrations.AlterField(
+            model_name='uploader',
+            name='wan_ip_address',
+            field=models.CharField(max_length=64, null=True, db_index=True),
+        ),
+        migrations.AlterField(
+            model_name='uploaderregistrationrequest',
+            name='requester_name',
+            field=models.CharField(max_length=64, db_index=True),
+        ),
+        migrations.AlterField(
+            model_name='uploaderregistrationrequest',
+            name='requester_key_fingerprint',
+            field=models.CharField(max_length=64, db_index=True),
+        ),
+    ]
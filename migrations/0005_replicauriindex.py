@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import hashlib
+
+from django.db import models, migrations
+
+PREFIX_LENGTH = 200
+
+
+def build_index(apps, schema_editor):
+    '''
+    Indexes the existing DataFileObjects' URIs, a chunk at a time.
+    '''
+    DataFileObject = apps.get_model('tardis_portal', 'DataFileObject')
+    ReplicaURIIndex = apps.get_model('mydata', 'ReplicaURIIndex')
+    last_id = 0
+    while True:
+        chunk = list(DataFileObject.objects
+                     .filter(pk__gt=last_id, uri__isnull=False)
+                     .order_by('pk')
+                     .values_list('pk', 'uri')[:1000])
+        if not chunk:
+            return
+        last_id = chunk[-1][0]
+        ReplicaURIIndex.objects.bulk_create(
+            [ReplicaURIIndex(
+                dfo_id=dfo_id,
+                uri_hash=hashlib.sha1(uri.encode('utf-8')).hexdigest(),
+                uri_prefix=uri[:PREFIX_LENGTH])
+             for dfo_id, uri in chunk])
+
+
+def remove_index(apps, schema_editor):
+    apps.get_model('mydata', 'ReplicaURIIndex').objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tardis_portal', '0001_initial'),
+        ('mydata', '0004_admin_search_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReplicaURIIndex',
+            fields=[
+                ('dfo', models.OneToOneField(related_name='mydata_uri_index', primary_key=True, serialize=False, to='tardis_portal.DataFileObject')),
+                ('uri_hash', models.CharField(max_length=40, db_index=True)),
+                ('uri_prefix', models.CharField(max_length=200, db_index=True)),
+            ],
+            options={
+                'verbose_name': 'ReplicaURIIndex',
+                'verbose_name_plural': 'ReplicaURIIndexes',
+            },
+        ),
+        migrations.RunPython(build_index, remove_index),
+    ]
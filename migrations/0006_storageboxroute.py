@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tardis_portal', '0001_initial'),
+        ('mydata', '0005_replicauriindex'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StorageBoxRoute',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('network', models.CharField(max_length=64)),
+                ('comments', models.TextField(blank=True)),
+                ('instrument', models.ForeignKey(blank=True, to='tardis_portal.Instrument', help_text='Leave blank to route uploads for any instrument', null=True)),
+                ('storage_box', models.ForeignKey(to='tardis_portal.StorageBox')),
+            ],
+            options={
+                'verbose_name': 'StorageBoxRoute',
+                'verbose_name_plural': 'StorageBoxRoutes',
+            },
+        ),
+    ]
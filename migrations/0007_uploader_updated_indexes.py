@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mydata', '0006_storageboxroute'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='uploader',
+            name='updated_time',
+            field=models.DateTimeField(null=True, db_index=True),
+        ),
+        migrations.AlterField(
+            model_name='uploader',
+            name='settings_updated',
+            field=models.DateTimeField(null=True, blank=True, db_index=True),
+        ),
+    ]
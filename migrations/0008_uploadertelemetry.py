@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mydata', '0007_uploader_updated_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UploaderTelemetry',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('timestamp', models.DateTimeField()),
+                ('disk_total', models.BigIntegerField(null=True)),
+                ('disk_used', models.BigIntegerField(null=True)),
+                ('memory_total', models.BigIntegerField(null=True)),
+                ('memory_available', models.BigIntegerField(null=True)),
+                ('uploader', models.ForeignKey(related_name='telemetry', to='mydata.Uploader')),
+            ],
+            options={
+                'verbose_name_plural': 'UploaderTelemetry',
+            },
+        ),
+        migrations.CreateModel(
+            name='UploaderTelemetryRollup',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('period_start', models.DateTimeField()),
+                ('samples', models.IntegerField()),
+                ('disk_total', models.BigIntegerField(null=True)),
+                ('disk_used_mean', models.BigIntegerField(null=True)),
+                ('disk_used_max', models.BigIntegerField(null=True)),
+                ('memory_total', models.BigIntegerField(null=True)),
+                ('memory_available_mean', models.BigIntegerField(null=True)),
+                ('memory_available_min', models.BigIntegerField(null=True)),
+                ('uploader', models.ForeignKey(related_name='telemetry_rollups', to='mydata.Uploader')),
+            ],
+            options={
+                'verbose_name_plural': 'UploaderTelemetryRollups',
+            },
+        ),
+        migrations.AlterIndexTogether(
+            name='uploadertelemetry',
+            index_together=set([('uploader', 'timestamp')]),
+        ),
+        migrations.AlterUniqueTogether(
+            name='uploadertelemetryrollup',
+            unique_together=set([('uploader', 'period_start')]),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mydata', '0008_uploadertelemetry'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='uploaderregistrationrequest',
+            name='approval_expiry',
+            field=models.DateField(default=None, null=True, blank=True, db_index=True),
+        ),
+    ]
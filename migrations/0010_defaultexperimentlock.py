@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mydata', '0009_approval_expiry_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DefaultExperimentLock',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('key', models.CharField(unique=True, max_length=40)),
+            ],
+            options={
+                'verbose_name': 'DefaultExperimentLock',
+                'verbose_name_plural': 'DefaultExperimentLocks',
+            },
+        ),
+    ]
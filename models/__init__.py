@@ -2,3 +2,8 @@
 from .uploader import Uploader
 from .uploader import UploaderRegistrationRequest
 from .uploader import UploaderSetting
+from .replica import ReplicaURIIndex
+from .routing import StorageBoxRoute
+from .telemetry import UploaderTelemetry
+from .telemetry import UploaderTelemetryRollup
+from .experiment import DefaultExperimentLock
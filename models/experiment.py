@@ -0,0 +1,22 @@
+from django.db import models
+
+
+class DefaultExperimentLock(models.Model):
+    '''
+    A row per normalized default experiment query (see
+    ExperimentAppResource.get_or_create_default_experiment), locked while
+    looking up and creating the query's experiment, so that concurrent
+    MyData instances asking for the same experiment can't create
+    duplicates, without serializing requests for different experiments.
+    '''
+
+    #: SHA-1 hash of the normalized query
+    key = models.CharField(max_length=40, unique=True)
+
+    class Meta:
+        app_label = 'mydata'
+        verbose_name = 'DefaultExperimentLock'
+        verbose_name_plural = 'DefaultExperimentLocks'
+
+    def __unicode__(self):
+        return self.key
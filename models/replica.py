@@ -0,0 +1,30 @@
+from django.db import models
+
+from tardis.tardis_portal.models.datafile import DataFileObject
+
+
+class ReplicaURIIndex(models.Model):
+    '''
+    Indexes DataFileObject URIs for the mydata_replica url filters, which
+    MyData uses to check whether a path is already stored.  DataFileObject's
+    uri is an unindexed TextField, so exact matches use a hash of the
+    URI, and startswith matches use an indexed prefix of the URI.
+    Maintained by a post_save receiver in signals.py, see also
+    replica_index.py.
+    '''
+
+    #: Length of the indexed URI prefix
+    PREFIX_LENGTH = 200
+
+    dfo = models.OneToOneField(DataFileObject, primary_key=True,
+                               related_name='mydata_uri_index')
+    uri_hash = models.CharField(max_length=40, db_index=True)
+    uri_prefix = models.CharField(max_length=PREFIX_LENGTH, db_index=True)
+
+    class Meta:
+        app_label = 'mydata'
+        verbose_name = 'ReplicaURIIndex'
+        verbose_name_plural = 'ReplicaURIIndexes'
+
+    def __unicode__(self):
+        return '%d: %s' % (self.dfo_id, self.uri_prefix)
@@ -0,0 +1,37 @@
+from django.core.exceptions import ValidationError
+from django.db import models
+
+from tardis.tardis_portal.models import Instrument
+from tardis.tardis_portal.models import StorageBox
+
+
+class StorageBoxRoute(models.Model):
+    '''
+    Routes uploads from MyData clients in an IP range (optionally for one
+    instrument only) to a storage box, for clients which don't identify
+    themselves by uploader UUID and key fingerprint, e.g. behind NAT.
+    See routing.py.
+    '''
+
+    #: IPv4 or IPv6 network in CIDR notation, e.g. 10.0.0.0/8
+    network = models.CharField(max_length=64)
+    instrument = models.ForeignKey(Instrument, null=True, blank=True,
+                                   help_text='Leave blank to route uploads '
+                                   'for any instrument')
+    storage_box = models.ForeignKey(StorageBox)
+    comments = models.TextField(blank=True)
+
+    class Meta:
+        app_label = 'mydata'
+        verbose_name = 'StorageBoxRoute'
+        verbose_name_plural = 'StorageBoxRoutes'
+
+    def __unicode__(self):
+        return self.network + " -> " + self.storage_box.name
+
+    def clean(self):
+        from ..routing import parse_network
+        try:
+            parse_network(self.network)
+        except ValueError as err:
+            raise ValidationError({'network': str(err)})
@@ -0,0 +1,55 @@
+from django.db import models
+
+from .uploader import Uploader
+
+
+class UploaderTelemetry(models.Model):
+    '''
+    A sample of an uploader's disk and memory figures, recorded from
+    MyData's heartbeats (see telemetry.py).  Samples are append-only,
+    and are downsampled into UploaderTelemetryRollups once they are
+    older than MYDATA_TELEMETRY_RETENTION_DAYS.
+    '''
+
+    uploader = models.ForeignKey(Uploader, related_name='telemetry')
+    timestamp = models.DateTimeField()
+
+    #: Sizes in bytes
+    disk_total = models.BigIntegerField(null=True)
+    disk_used = models.BigIntegerField(null=True)
+    memory_total = models.BigIntegerField(null=True)
+    memory_available = models.BigIntegerField(null=True)
+
+    class Meta:
+        app_label = 'mydata'
+        verbose_name_plural = 'UploaderTelemetry'
+        index_together = [('uploader', 'timestamp')]
+
+    def __unicode__(self):
+        return '%s | %s' % (self.uploader_id, self.timestamp)
+
+
+class UploaderTelemetryRollup(models.Model):
+    '''
+    An hour of an uploader's telemetry samples, downsampled.
+    '''
+
+    uploader = models.ForeignKey(Uploader, related_name='telemetry_rollups')
+    period_start = models.DateTimeField()
+    samples = models.IntegerField()
+
+    #: Sizes in bytes
+    disk_total = models.BigIntegerField(null=True)
+    disk_used_mean = models.BigIntegerField(null=True)
+    disk_used_max = models.BigIntegerField(null=True)
+    memory_total = models.BigIntegerField(null=True)
+    memory_available_mean = models.BigIntegerField(null=True)
+    memory_available_min = models.BigIntegerField(null=True)
+
+    class Meta:
+        app_label = 'mydata'
+        verbose_name_plural = 'UploaderTelemetryRollups'
+        unique_together = [('uploader', 'period_start')]
+
+    def __unicode__(self):
+        return '%s | %s' % (self.uploader_id, self.period_start)
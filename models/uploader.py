@@ -31,7 +31,7 @@ class Uploader(models.Model):
 
     uuid = models.CharField(max_length=36, unique=True, blank=False)
 
-    name = models.CharField(max_length=64)
+    name = models.CharField(max_length=64, db_index=True)
     contact_name = models.CharField(max_length=64)
     contact_email = models.CharField(max_length=64)
 
@@ -80,20 +80,22 @@ class Uploader(models.Model):
     ipv6_address = models.CharField(max_length=64, null=True)
     subnet_mask = models.CharField(max_length=16, null=True)
 
-    hostname = models.CharField(max_length=64, null=True)
+    hostname = models.CharField(max_length=64, null=True, db_index=True)
 
     # The wan_ip_address is populated in TastyPie by looking in request.META
     # It could be IPv4 or IPv6
-    wan_ip_address = models.CharField(max_length=64, null=True)
+    wan_ip_address = models.CharField(max_length=64, null=True,
+                                      db_index=True)
 
     #: When the MyData instance was first registered on the MyTardis server.
     created_time = models.DateTimeField(null=True)
 
     #: The last time this MyData instance ran on the client.
-    updated_time = models.DateTimeField(null=True)
+    updated_time = models.DateTimeField(null=True, db_index=True)
 
     #: Thet last time the uploader settings were updated.
-    settings_updated = models.DateTimeField(null=True, blank=True)
+    settings_updated = models.DateTimeField(null=True, blank=True,
+                                            db_index=True)
 
     #: The last time the settings were downloaded to the MyData client.
     settings_downloaded = models.DateTimeField(null=True, blank=True)
@@ -105,6 +107,52 @@ class Uploader(models.Model):
     def __unicode__(self):
         return self.name + " | " + self.uuid
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super(Uploader, cls).from_db(db, field_names, values)
+        # Lets signal receivers tell which fields have changed:
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
+    def save(self, *args, **kwargs):
+        '''
+        Only writes the fields which have changed since the uploader was
+        loaded, so that MyData's heartbeats don't rewrite the whole row.
+        '''
+        loaded_values = getattr(self, '_loaded_values', None)
+        if loaded_values and self.pk is not None and \
+                not kwargs.get('force_insert') and \
+                kwargs.get('update_fields') is None:
+            changed = [field.attname for field in self._meta.concrete_fields
+                       if field.attname in loaded_values and
+                       getattr(self, field.attname) !=
+                       loaded_values[field.attname]]
+            if not changed:
+                return
+            kwargs['update_fields'] = changed
+        super(Uploader, self).save(*args, **kwargs)
+        if loaded_values is not None:
+            for field in self._meta.concrete_fields:
+                if field.attname in loaded_values:
+                    loaded_values[field.attname] = getattr(self,
+                                                           field.attname)
+
+    def refresh_from_db(self, using=None, fields=None, **kwargs):
+        '''
+        Updates the values save() compares with, so that refreshed fields
+        aren't written back (or skipped) as if they had been changed.
+        '''
+        super(Uploader, self).refresh_from_db(using=using, fields=fields,
+                                              **kwargs)
+        if fields is None:
+            loaded_values = self.__dict__.setdefault('_loaded_values', {})
+        else:
+            loaded_values = getattr(self, '_loaded_values', {})
+        for field in self._meta.concrete_fields:
+            if fields is None or field.name in fields or \
+                    field.attname in fields:
+                loaded_values[field.attname] = getattr(self, field.attname)
+
     def get_ct(self):
         return ContentType.objects.get_for_model(self)
 
@@ -123,10 +171,11 @@ class UploaderRegistrationRequest(models.Model):
 
     uploader = models.ForeignKey(Uploader)
 
-    requester_name = models.CharField(max_length=64)
+    requester_name = models.CharField(max_length=64, db_index=True)
     requester_email = models.CharField(max_length=64)
     requester_public_key = models.TextField()
-    requester_key_fingerprint = models.CharField(max_length=64)
+    requester_key_fingerprint = models.CharField(max_length=64,
+                                                 db_index=True)
     request_time = models.DateTimeField(null=True, blank=True)
 
     approved = models.BooleanField(default=False)
@@ -134,7 +183,8 @@ class UploaderRegistrationRequest(models.Model):
                                              null=True, blank=True,
                                              default=None)
     approver_comments = models.TextField(null=True, blank=True, default=None)
-    approval_expiry = models.DateField(null=True, blank=True, default=None)
+    approval_expiry = models.DateField(null=True, blank=True, default=None,
+                                       db_index=True)
     approval_time = models.DateTimeField(null=True, blank=True, default=None)
 
     class Meta:
@@ -0,0 +1,96 @@
+"""
+Wakes long-polling MyData clients when their registration requests change
+
+Each (uploader UUID, key fingerprint) pair has a version stored in
+Django's cache, which is replaced whenever one of its
+UploaderRegistrationRequests is saved (see signals.py), once the saving
+transaction has committed.  Waiters only
+re-query the database when the version changes.  Waiters in the process
+which saved the request are woken immediately through a condition
+variable, and waiters in other processes notice the new version at
+their next check of the cache.  Checks start MYDATA_LONG_POLL_INTERVAL
+seconds apart, and the interval doubles after each check (up to
+MYDATA_LONG_POLL_MAX_INTERVAL), so that idle waiters don't keep
+querying the cache.
+
+Each waiter occupies a worker (thread or process) for up to
+MYDATA_LONG_POLL_MAX_TIMEOUT seconds, so the server needs enough
+workers for its waiting clients as well as its other requests.
+"""
+import hashlib
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+
+KEY_PREFIX = 'mydata:registration'
+
+_condition = threading.Condition()
+
+
+def get_cache():
+    return caches[getattr(settings, 'MYDATA_NOTIFICATION_CACHE', 'default')]
+
+
+def _version_key(uploader_uuid, fingerprint):
+    pair = u'%s|%s' % (uploader_uuid, fingerprint)
+    return '%s:%s' % (KEY_PREFIX,
+                      hashlib.sha1(pair.encode('utf-8')).hexdigest())
+
+
+def notify(pairs):
+    '''
+    Wakes the clients waiting on any of the (uploader UUID, key
+    fingerprint) pairs.
+    '''
+    versions = dict((_version_key(uploader_uuid, fingerprint),
+                     uuid.uuid4().hex)
+                    for uploader_uuid, fingerprint in pairs)
+    if not versions:
+        return
+    get_cache().set_many(versions, None)
+    with _condition:
+        _condition.notify_all()
+
+
+def wait_for_change(uploader_uuid, fingerprint, fetch, changed, timeout):
+    '''
+    Calls fetch() and returns its result as soon as changed(result) is
+    true, calling fetch() again only after notify() has been called for
+    the pair, until timeout seconds have passed.
+
+    A notification can arrive before the change it announces is visible
+    (e.g. the saving transaction hasn't committed yet), so once the
+    version has changed, fetch() is called on every later wake until
+    changed(result) is true, checking at the initial interval again.
+    '''
+    cache = get_cache()
+    key = _version_key(uploader_uuid, fingerprint)
+    initial_interval = getattr(settings, 'MYDATA_LONG_POLL_INTERVAL', 1.0)
+    max_interval = max(initial_interval, getattr(
+        settings, 'MYDATA_LONG_POLL_MAX_INTERVAL', 5.0))
+    interval = initial_interval
+    deadline = time.time() + timeout
+    # Read the version before fetching, so a change made in between
+    # isn't missed:
+    version = cache.get(key)
+    result = fetch()
+    notified = False
+    while not changed(result):
+        remaining = deadline - time.time()
+        if remaining <= 0:
+            break
+        with _condition:
+            _condition.wait(min(remaining, interval))
+        new_version = cache.get(key)
+        if new_version != version:
+            version = new_version
+            notified = True
+        if notified:
+            result = fetch()
+            interval = initial_interval
+        else:
+            interval = min(interval * 2, max_interval)
+    return result
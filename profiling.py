@@ -0,0 +1,215 @@
+"""
+On-demand request profiling for the MyData app's API resources
+
+A request to a MyData resource is profiled when:
+
+* a staff user sends the X-MyData-Profile header,
+* it is randomly sampled (MYDATA_PROFILING_SAMPLE_RATE, 0.0 to 1.0), or
+* it comes from an uploader whose UUID is in MYDATA_PROFILING_UPLOADERS.
+
+Each profiled request writes a cProfile/pstats dump (.prof) and a JSON
+file with the request's details and its SQL statements and timings
+(.json) into MYDATA_PROFILING_DIR.  Only the most recent
+MYDATA_PROFILING_MAX_PROFILES profiles are kept.  The
+mydata_profile_summary management command summarizes the hot spots
+across the captured profiles.
+"""
+import cProfile
+import glob
+import json
+import logging
+import os
+import pstats
+import random
+import re
+import tempfile
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.views.decorators.csrf import csrf_exempt
+
+from .utils import get_uploader_identifiers
+
+logger = logging.getLogger(__name__)
+
+PROFILE_HEADER = 'HTTP_X_MYDATA_PROFILE'
+
+
+def get_profiling_dir():
+    return getattr(settings, 'MYDATA_PROFILING_DIR',
+                   os.path.join(tempfile.gettempdir(), 'mydata-profiles'))
+
+
+def _is_staff(resource, request):
+    auth_result = resource._meta.authentication.is_authenticated(request)
+    return auth_result is True and request.user.is_staff
+
+
+def should_profile(resource, request):
+    '''
+    Returns the reason for profiling request ("header", "sampled" or
+    "uploader"), or None if it shouldn't be profiled.
+    '''
+    if PROFILE_HEADER in request.META and _is_staff(resource, request):
+        return 'header'
+    sample_rate = getattr(settings, 'MYDATA_PROFILING_SAMPLE_RATE', 0.0)
+    if sample_rate and random.random() < sample_rate:
+        return 'sampled'
+    uploaders = getattr(settings, 'MYDATA_PROFILING_UPLOADERS', ())
+    if uploaders and get_uploader_identifiers(request)[0] in uploaders:
+        return 'uploader'
+    return None
+
+
+def save_profile(directory, name, profiler, details, max_profiles):
+    '''
+    Writes name.prof and name.json into directory, then deletes the
+    oldest profiles beyond max_profiles.
+    '''
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    path = os.path.join(directory, name)
+    profiler.dump_stats(path + '.prof')
+    with open(path + '.json', 'w') as details_file:
+        json.dump(details, details_file)
+    # Names start with a zero-padded timestamp, so sort oldest first:
+    profiles = sorted(glob.glob(os.path.join(directory, '*.prof')))
+    for old_profile in profiles[:max(0, len(profiles) - max_profiles)]:
+        for old_path in (old_profile,
+                         old_profile[:-len('.prof')] + '.json'):
+            try:
+                os.remove(old_path)
+            except OSError:
+                # Already removed by another process
+                pass
+
+
+def profile_view(resource, view_name, request, view):
+    '''
+    Calls view() under cProfile, capturing the SQL it executes, and saves
+    the results.  Returns view()'s response.
+    '''
+    profiler = cProfile.Profile()
+    start = time.time()
+    with CaptureQueriesContext(connection) as context:
+        profiler.enable()
+        try:
+            response = view()
+        finally:
+            profiler.disable()
+    duration = time.time() - start
+
+    name = '%017.6f-%d-%s-%s' % (start, os.getpid(),
+                                 resource._meta.resource_name, view_name)
+    user = getattr(request, 'user', None)
+    details = {
+        'resource': resource._meta.resource_name,
+        'view': view_name,
+        'method': request.method,
+        'path': request.get_full_path(),
+        'uploader': get_uploader_identifiers(request)[0],
+        'user': user.username if user is not None and
+        user.is_authenticated() else None,
+        'reason': request.mydata_profile_reason,
+        'status': response.status_code,
+        'duration': duration,
+        'queries': [{'sql': query['sql'], 'time': float(query['time'])}
+                    for query in context.captured_queries],
+    }
+    try:
+        save_profile(get_profiling_dir(), name, profiler, details,
+                     getattr(settings, 'MYDATA_PROFILING_MAX_PROFILES',
+                             100))
+    except (IOError, OSError):
+        logger.exception('Failed to save profile %s', name)
+    else:
+        # The profile's name is only of use to (and only disclosed to)
+        # staff, who can read the profiling directory:
+        if user is not None and user.is_authenticated() and user.is_staff:
+            response['X-MyData-Profile'] = name
+    return response
+
+
+class ProfilingMixin(object):
+    '''
+    Profiles requests to a Tastypie resource on demand, see the module's
+    docstring.
+    '''
+    def wrap_view(self, view):
+        wrapped_view = super(ProfilingMixin, self).wrap_view(view)
+
+        @csrf_exempt
+        def wrapper(request, *args, **kwargs):
+            reason = should_profile(self, request)
+            if reason is None:
+                return wrapped_view(request, *args, **kwargs)
+            request.mydata_profile_reason = reason
+            return profile_view(
+                self, view, request,
+                lambda: wrapped_view(request, *args, **kwargs))
+
+        return wrapper
+
+
+_NUMBER = re.compile(r"\b\d+(\.\d+)?\b")
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_IN_LIST = re.compile(r"IN \((?:\?, )*\?\)")
+
+
+def normalize_sql(sql):
+    '''
+    Replaces the literals in a SQL statement with placeholders, so that
+    statements differing only by their parameters can be grouped.
+    '''
+    sql = _STRING.sub('?', sql)
+    sql = _NUMBER.sub('?', sql)
+    return _IN_LIST.sub('IN (...)', sql)
+
+
+def summarize_profiles(directory, stream, limit=20, sort='cumulative'):
+    '''
+    Writes the top functions (by sort) across all the profiles in
+    directory, the slowest views and the most expensive SQL statements
+    (grouped by normalize_sql) to stream.
+    '''
+    profiles = sorted(glob.glob(os.path.join(directory, '*.prof')))
+    if not profiles:
+        stream.write('No profiles found in %s\n' % directory)
+        return
+    stream.write('%d profiles in %s\n\n' % (len(profiles), directory))
+
+    views = defaultdict(list)
+    queries = defaultdict(lambda: [0, 0.0])
+    for profile in profiles:
+        try:
+            with open(profile[:-len('.prof')] + '.json') as details_file:
+                details = json.load(details_file)
+        except (IOError, ValueError):
+            continue
+        views['%s %s.%s' % (details['method'], details['resource'],
+                            details['view'])].append(details['duration'])
+        for query in details['queries']:
+            totals = queries[normalize_sql(query['sql'])]
+            totals[0] += 1
+            totals[1] += query['time']
+
+    stream.write('Views by total time:\n')
+    for view, durations in sorted(views.items(),
+                                  key=lambda item: -sum(item[1]))[:limit]:
+        stream.write('  %-60s %6d requests %10.3f s total %8.1f ms mean\n'
+                     % (view, len(durations), sum(durations),
+                        1000 * sum(durations) / len(durations)))
+
+    stream.write('\nSQL by total time:\n')
+    for sql, (count, total) in sorted(queries.items(),
+                                      key=lambda item: -item[1][1])[:limit]:
+        stream.write('  %6d queries %10.3f s  %s\n' % (count, total, sql))
+
+    stream.write('\nFunctions by %s time:\n' % sort)
+    stats = pstats.Stats(profiles[0], stream=stream)
+    for profile in profiles[1:]:
+        stats.add(profile)
+    stats.sort_stats(sort).print_stats(limit)
@@ -0,0 +1,150 @@
+"""
+Per-process registry of rarely changing metadata used on MyData's hot paths
+
+Holds the ID of MyData's default experiment schema, the IDs of its
+ParameterNames and the StorageBox records, so that experiment lookups
+and DataFile creation don't query them on every request.
+
+Each process loads the registry lazily, and discards it when MyData's
+schema or its ParameterNames, or a StorageBox, is saved or deleted (see
+signals.py).  Changes are announced to other processes through a
+generation stored in Django's cache once they have been committed, which
+processes check at most every MYDATA_REGISTRY_CHECK_INTERVAL seconds.
+
+Without transaction.on_commit (Django < 1.9), a change is announced
+before it is committed, so for MYDATA_REGISTRY_SETTLE_TIME seconds after
+a change, processes reload the registry at every check rather than
+keeping one loaded before the commit.
+"""
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+
+from .schemas import DEFAULT_EXPERIMENT_PARAMETER_NAMES
+from .schemas import DEFAULT_EXPERIMENT_SCHEMA
+from .utils import on_commit
+
+GENERATION_KEY = 'mydata:registry:generation'
+
+
+class Registry(object):
+    def __init__(self, schema_id, parameter_name_ids, storage_boxes):
+        #: The ID of the default experiment schema, or None
+        self.schema_id = schema_id
+        #: Maps the default experiment schema's parameter names to IDs
+        self.parameter_name_ids = parameter_name_ids
+        #: Maps IDs to StorageBoxes
+        self.storage_boxes = storage_boxes
+
+
+def load_registry():
+    '''
+    Builds a Registry from the database.
+    '''
+    from tardis.tardis_portal.models.parameters import ParameterName
+    from tardis.tardis_portal.models.parameters import Schema
+    from tardis.tardis_portal.models.storage import StorageBox
+    schema_id = Schema.objects.filter(namespace=DEFAULT_EXPERIMENT_SCHEMA)\
+        .values_list('id', flat=True).first()
+    parameter_name_ids = dict(
+        ParameterName.objects
+        .filter(schema_id=schema_id,
+                name__in=DEFAULT_EXPERIMENT_PARAMETER_NAMES)
+        .values_list('name', 'id'))
+    storage_boxes = dict((storage_box.id, storage_box)
+                         for storage_box in StorageBox.objects.all())
+    return Registry(schema_id, parameter_name_ids, storage_boxes)
+
+
+_lock = threading.RLock()
+_state = {'registry': None, 'generation': None, 'checked': 0.0,
+          'loads': 0, 'load_time': 0.0}
+
+
+def get_cache():
+    return caches[getattr(settings, 'MYDATA_REGISTRY_CACHE', 'default')]
+
+
+def get_registry():
+    '''
+    Returns this process's Registry, (re)loading it if necessary.
+    '''
+    interval = getattr(settings, 'MYDATA_REGISTRY_CHECK_INTERVAL', 5.0)
+    settle_time = getattr(settings, 'MYDATA_REGISTRY_SETTLE_TIME', 10.0)
+    with _lock:
+        now = time.time()
+        if _state['registry'] is not None and \
+                now - _state['checked'] < interval:
+            return _state['registry']
+        generation = get_cache().get(GENERATION_KEY)
+        _state['checked'] = now
+        if _state['registry'] is None or \
+                generation != _state['generation']:
+            start = time.time()
+            _state['registry'] = load_registry()
+            _state['load_time'] = time.time() - start
+            _state['loads'] += 1
+            # Reload again at the next check if the change may not have
+            # been committed when it was loaded:
+            recent = isinstance(generation, tuple) and \
+                now - generation[1] < settle_time
+            _state['generation'] = None if recent else generation
+        return _state['registry']
+
+
+def get_schema_id():
+    '''
+    Returns the ID of MyData's default experiment schema, or None if it
+    doesn't exist.
+    '''
+    return get_registry().schema_id
+
+
+def get_parameter_name_id(name):
+    '''
+    Returns the ID of the default experiment schema's ParameterName with
+    name, or None.
+    '''
+    return get_registry().parameter_name_ids.get(name)
+
+
+def get_storage_box(storage_box_id):
+    '''
+    Returns the StorageBox with storage_box_id, or None.
+    '''
+    if storage_box_id is None:
+        return None
+    storage_box = get_registry().storage_boxes.get(storage_box_id)
+    if storage_box is None:
+        # Created by another process since the registry was loaded:
+        from tardis.tardis_portal.models.storage import StorageBox
+        storage_box = StorageBox.objects.filter(pk=storage_box_id).first()
+    return storage_box
+
+
+def invalidate():
+    '''
+    Discards this process's registry and tells the other processes to
+    discard theirs, once the current transaction has been committed.
+    '''
+    def announce():
+        get_cache().set(GENERATION_KEY, (uuid.uuid4().hex, time.time()),
+                        None)
+        with _lock:
+            _state['registry'] = None
+    on_commit(announce)
+
+
+def get_stats():
+    with _lock:
+        registry = _state['registry']
+        return {
+            'loaded': registry is not None,
+            'loads': _state['loads'],
+            'load_time_seconds': _state['load_time'],
+            'storage_boxes':
+                len(registry.storage_boxes) if registry else None,
+        }
@@ -0,0 +1,84 @@
+"""
+Maintains and queries the ReplicaURIIndex of DataFileObject URIs
+"""
+import hashlib
+
+from tardis.tardis_portal.models.datafile import DataFileObject
+
+from .models import ReplicaURIIndex
+
+
+def uri_hash(uri):
+    return hashlib.sha1(uri.encode('utf-8')).hexdigest()
+
+
+def uri_prefix(uri):
+    return uri[:ReplicaURIIndex.PREFIX_LENGTH]
+
+
+def update_index(dfo_id, uri, created=False):
+    '''
+    Indexes (or unindexes, if uri is None) a DataFileObject's URI,
+    without writing anything if the indexed URI hasn't changed.
+    created means that the DataFileObject has just been created, so it
+    can't have been indexed yet.
+    '''
+    if uri is None:
+        if not created:
+            ReplicaURIIndex.objects.filter(dfo_id=dfo_id).delete()
+        return
+    fields = dict(uri_hash=uri_hash(uri), uri_prefix=uri_prefix(uri))
+    if not created:
+        stored = ReplicaURIIndex.objects.filter(dfo_id=dfo_id)\
+            .values_list('uri_hash', 'uri_prefix').first()
+        if stored == (fields['uri_hash'], fields['uri_prefix']):
+            return
+        if stored is not None:
+            ReplicaURIIndex.objects.filter(dfo_id=dfo_id).update(**fields)
+            return
+    ReplicaURIIndex.objects.create(dfo_id=dfo_id, **fields)
+
+
+def rebuild_index(chunk_size=1000, queryset=None):
+    '''
+    Reindexes all DataFileObjects (e.g. after bulk updates, which don't
+    send post_save signals), or only those in queryset, a chunk at a
+    time.  Returns the number of DataFileObjects indexed.
+    '''
+    if queryset is None:
+        queryset = DataFileObject.objects.all()
+    last_id = 0
+    indexed = 0
+    while True:
+        chunk = list(queryset
+                     .filter(pk__gt=last_id)
+                     .order_by('pk')
+                     .values_list('pk', 'uri')[:chunk_size])
+        if not chunk:
+            return indexed
+        last_id = chunk[-1][0]
+        ReplicaURIIndex.objects\
+            .filter(dfo_id__in=[dfo_id for dfo_id, _ in chunk]).delete()
+        ReplicaURIIndex.objects.bulk_create(
+            [ReplicaURIIndex(dfo_id=dfo_id, uri_hash=uri_hash(uri),
+                             uri_prefix=uri_prefix(uri))
+             for dfo_id, uri in chunk if uri is not None])
+        indexed += len(chunk)
+
+
+def build_uri_filters(exact=None, startswith=None):
+    '''
+    Returns DataFileObject queryset filters equivalent to uri=exact and
+    uri__startswith=startswith which can use ReplicaURIIndex's indexes.
+    '''
+    filters = {}
+    if exact is not None:
+        filters['mydata_uri_index__uri_hash'] = uri_hash(exact)
+        # Guard against hash collisions:
+        filters['uri'] = exact
+    if startswith is not None:
+        filters['mydata_uri_index__uri_prefix__startswith'] = \
+            uri_prefix(startswith)
+        if len(startswith) > ReplicaURIIndex.PREFIX_LENGTH:
+            filters['uri__startswith'] = startswith
+    return filters
@@ -0,0 +1,425 @@
+"""
+In-memory routing table mapping client IP addresses and instruments to
+storage boxes
+
+DataFileAppResource uses this to find the storage box for uploads from
+MyData clients which don't identify themselves by uploader UUID and key
+fingerprint.  Routes come from:
+
+* admin-defined StorageBoxRoutes (CIDR ranges, optionally restricted to
+  one instrument), which work behind NAT, and
+* approved UploaderRegistrationRequests, as host routes for their
+  uploader's WAN IP address and instruments.
+
+Routes are stored in a binary trie (one per IP version), so a lookup
+takes at most 32 (or 128) steps regardless of the number of routes,
+returning the longest matching prefix.  At equal prefix lengths, routes
+for the upload's instrument beat routes for any instrument, and
+uploader host routes beat admin-defined routes.
+
+Each process loads the table lazily, and updates it incrementally when
+the underlying models change (see signals.py).  Once committed, each
+change (the uploaders or StorageBoxRoutes whose routes must be
+replaced) is published in Django's cache under a new, sequentially
+numbered generation.  Processes check the current generation at most
+every MYDATA_ROUTING_CHECK_INTERVAL seconds, and apply the changes
+they haven't seen yet to their tables in the same way.  A table is
+only reloaded from scratch on a cold start, or when a process has
+fallen more than MAX_CHANGES behind or the changes it missed have been
+evicted from the cache.
+
+Without transaction.on_commit (Django < 1.9) a change can be published
+before it is committed, so changes are applied again at every check
+until they are MYDATA_ROUTING_SETTLE_TIME seconds old.
+
+IPv4-mapped IPv6 addresses (::ffff:a.b.c.d), which dual-stack servers
+report for IPv4 clients, are looked up as IPv4 addresses.
+"""
+import binascii
+import socket
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils import six
+
+from .utils import on_commit
+
+GENERATION_KEY = 'mydata:routing:generation'
+CHANGE_KEY = 'mydata:routing:change:%d'
+
+#: Maximum number of changes a process catches up with instead of
+#: reloading its table
+MAX_CHANGES = 1000
+
+#: Seconds changes are kept in the cache
+CHANGE_TIMEOUT = 24 * 60 * 60
+
+#: Maximum number of uploaders in each uploader_id__in query
+CHUNK_SIZE = 500
+
+#: Priorities of routes with equal prefixes and instruments
+ADMIN_ROUTE_PRIORITY = 0
+UPLOADER_ROUTE_PRIORITY = 1
+
+_FAMILIES = {4: (socket.AF_INET, 32), 6: (socket.AF_INET6, 128)}
+
+
+def parse_ip(ip):
+    '''
+    Returns (IP version, address as an int) for an IPv4 or IPv6 address.
+    Raises ValueError for anything else.
+    '''
+    ip = ip.strip()
+    version = 6 if ':' in ip else 4
+    try:
+        packed = socket.inet_pton(_FAMILIES[version][0], str(ip))
+    except (socket.error, UnicodeError):
+        raise ValueError('Invalid IP address: %s' % ip)
+    return version, int(binascii.hexlify(packed), 16)
+
+
+def _unmapped(version, address):
+    '''
+    Returns (4, IPv4 address) for an IPv4-mapped IPv6 address, or
+    (version, address) unchanged.
+    '''
+    if version == 6 and address >> 32 == 0xffff:
+        return 4, address & 0xffffffff
+    return version, address
+
+
+def parse_network(cidr):
+    '''
+    Returns (IP version, network address as an int, prefix length) for a
+    network in CIDR notation, e.g. 10.0.0.0/8.  An address without a
+    prefix length is treated as a host route.  Raises ValueError if the
+    network is invalid or has host bits set.
+    '''
+    if '/' in cidr:
+        address, prefix_length = cidr.split('/', 1)
+    else:
+        address, prefix_length = cidr, None
+    version, network = parse_ip(address)
+    bits = _FAMILIES[version][1]
+    try:
+        prefix_length = bits if prefix_length is None \
+            else int(prefix_length)
+    except ValueError:
+        raise ValueError('Invalid prefix length: %s' % cidr)
+    if not 0 <= prefix_length <= bits:
+        raise ValueError('Invalid prefix length: %s' % cidr)
+    if network & ((1 << (bits - prefix_length)) - 1):
+        raise ValueError('Host bits set in network: %s' % cidr)
+    return version, network, prefix_length
+
+
+class _Node(object):
+    __slots__ = ('children', 'routes')
+
+    def __init__(self):
+        self.children = [None, None]
+        #: Maps instrument ID (or None for any instrument) to a dict
+        #: mapping sources to (priority, storage box ID)
+        self.routes = {}
+
+
+class RoutingTable(object):
+    '''
+    Longest-prefix-match table of (network, instrument) -> storage box
+    routes, each added on behalf of a source (e.g. ('uploader', 12)),
+    so that all of a source's routes can be replaced together.
+    '''
+    def __init__(self):
+        self._roots = {4: _Node(), 6: _Node()}
+        self._sources = {}
+
+    def __len__(self):
+        return sum(len(routes) for routes in self._sources.values())
+
+    def add(self, source, cidr, instrument_id, storage_box_id,
+            priority=(ADMIN_ROUTE_PRIORITY, 0)):
+        version, network, prefix_length = parse_network(cidr)
+        bits = _FAMILIES[version][1]
+        node = self._roots[version]
+        for depth in range(prefix_length):
+            bit = (network >> (bits - depth - 1)) & 1
+            if node.children[bit] is None:
+                node.children[bit] = _Node()
+            node = node.children[bit]
+        node.routes.setdefault(instrument_id, {})[source] = \
+            (priority, storage_box_id)
+        self._sources.setdefault(source, []).append(
+            (version, network, prefix_length, instrument_id))
+
+    def remove_source(self, source):
+        for version, network, prefix_length, instrument_id in \
+                self._sources.pop(source, []):
+            bits = _FAMILIES[version][1]
+            path = [self._roots[version]]
+            for depth in range(prefix_length):
+                bit = (network >> (bits - depth - 1)) & 1
+                path.append(path[-1].children[bit])
+                if path[-1] is None:
+                    # Already pruned (the source added the route twice)
+                    break
+            if path[-1] is None:
+                continue
+            routes = path[-1].routes.get(instrument_id, {})
+            routes.pop(source, None)
+            if not routes:
+                path[-1].routes.pop(instrument_id, None)
+            # Prune empty nodes:
+            for depth in range(prefix_length, 0, -1):
+                node = path[depth]
+                if node.routes or any(node.children):
+                    break
+                bit = (network >> (bits - depth)) & 1
+                path[depth - 1].children[bit] = None
+
+    def lookup(self, ip, instrument_id=None):
+        '''
+        Returns the storage box ID for the longest matching route for ip
+        and instrument_id, or None.
+        '''
+        try:
+            version, address = _unmapped(*parse_ip(ip))
+        except ValueError:
+            return None
+        bits = _FAMILIES[version][1]
+        node = self._roots[version]
+        best = None
+        depth = 0
+        while node is not None:
+            for key in (None, instrument_id):
+                if key in node.routes:
+                    best = max(node.routes[key].values())
+            if depth == bits:
+                break
+            node = node.children[(address >> (bits - depth - 1)) & 1]
+            depth += 1
+        return best[1] if best is not None else None
+
+
+def _host_cidr(ip):
+    version, address = _unmapped(*parse_ip(ip))
+    family, bits = _FAMILIES[version]
+    packed = binascii.unhexlify('%0*x' % (bits // 4, address))
+    return '%s/%d' % (socket.inet_ntop(family, packed), bits)
+
+
+def _add_uploader_routes(table, uploader_ids):
+    from .models import Uploader
+    from .models import UploaderRegistrationRequest
+    instruments = {}
+    for uploader_id, instrument_id in Uploader.instruments.through.objects\
+            .filter(uploader_id__in=uploader_ids)\
+            .values_list('uploader_id', 'instrument_id'):
+        instruments.setdefault(uploader_id, []).append(instrument_id)
+    approved = UploaderRegistrationRequest.objects\
+        .filter(uploader_id__in=uploader_ids, approved=True,
+                approved_storage_box__isnull=False,
+                uploader__wan_ip_address__isnull=False)\
+        .order_by('approval_time', 'id')\
+        .values_list('id', 'uploader_id', 'uploader__wan_ip_address',
+                     'approved_storage_box_id', 'approval_time')
+    for request_id, uploader_id, ip, storage_box_id, approval_time in \
+            approved:
+        try:
+            cidr = _host_cidr(ip)
+        except ValueError:
+            continue
+        # The most recently approved request wins:
+        approved_at = time.mktime(approval_time.timetuple()) \
+            if approval_time else 0
+        for instrument_id in instruments.get(uploader_id, []):
+            table.add(('uploader', uploader_id), cidr, instrument_id,
+                      storage_box_id,
+                      (UPLOADER_ROUTE_PRIORITY, approved_at, request_id))
+
+
+def _add_admin_routes(table, route_ids=None):
+    from .models import StorageBoxRoute
+    routes = StorageBoxRoute.objects.all()
+    if route_ids is not None:
+        routes = routes.filter(pk__in=route_ids)
+    for route_id, network, instrument_id, storage_box_id in \
+            routes.values_list('id', 'network', 'instrument_id',
+                               'storage_box_id'):
+        try:
+            table.add(('route', route_id), network, instrument_id,
+                      storage_box_id, (ADMIN_ROUTE_PRIORITY, route_id))
+        except ValueError:
+            continue
+
+
+def load_table():
+    '''
+    Builds a RoutingTable from the database.
+    '''
+    from .models import UploaderRegistrationRequest
+    table = RoutingTable()
+    _add_admin_routes(table)
+    _add_uploader_routes(
+        table,
+        UploaderRegistrationRequest.objects.filter(approved=True)
+        .values('uploader_id'))
+    return table
+
+
+_lock = threading.RLock()
+_state = {'table': None, 'generation': None, 'checked': 0.0}
+
+
+def get_cache():
+    return caches[getattr(settings, 'MYDATA_ROUTING_CACHE', 'default')]
+
+
+def _apply(table, change):
+    '''
+    Replaces the routes of the uploaders or StorageBoxRoutes in a
+    change, which is ('uploaders', IDs) or ('routes', IDs).
+    '''
+    kind, ids = change
+    if kind == 'uploaders':
+        for uploader_id in ids:
+            table.remove_source(('uploader', uploader_id))
+        for start in range(0, len(ids), CHUNK_SIZE):
+            _add_uploader_routes(table, ids[start:start + CHUNK_SIZE])
+    else:
+        for route_id in ids:
+            table.remove_source(('route', route_id))
+        for start in range(0, len(ids), CHUNK_SIZE):
+            _add_admin_routes(table, ids[start:start + CHUNK_SIZE])
+
+
+def _get_generation(cache):
+    generation = cache.get(GENERATION_KEY)
+    if not isinstance(generation, six.integer_types):
+        return 0
+    return generation
+
+
+def _next_generation(cache):
+    try:
+        return cache.incr(GENERATION_KEY)
+    except ValueError:
+        cache.add(GENERATION_KEY, 0, None)
+    except TypeError:
+        # Left by an older version of this module
+        cache.set(GENERATION_KEY, 0, None)
+    return cache.incr(GENERATION_KEY)
+
+
+def _get_changes(cache, first, last):
+    '''
+    Returns the list of (generation, change, time published) for the
+    generations from first to last which are still in the cache, and
+    whether all of them were.
+    '''
+    keys = dict((CHANGE_KEY % generation, generation)
+                for generation in range(max(first, 1), last + 1))
+    found = cache.get_many(keys.keys())
+    changes = sorted((keys[key], value[0], value[1])
+                     for key, value in found.items())
+    return changes, len(changes) == len(keys)
+
+
+def _settled(changes, generation, now):
+    '''
+    Returns the generation a process has seen after applying changes up
+    to generation: before the first change which may not have been
+    committed yet, so that it is applied again at the next check.
+    '''
+    settle_time = getattr(settings, 'MYDATA_ROUTING_SETTLE_TIME', 10.0)
+    recent = [change_generation for change_generation, _, published
+              in changes if now - published < settle_time]
+    return min(recent) - 1 if recent else generation
+
+
+def get_table():
+    '''
+    Returns this process's RoutingTable, loading it or applying the
+    changes published by other processes if necessary.
+    '''
+    interval = getattr(settings, 'MYDATA_ROUTING_CHECK_INTERVAL', 5.0)
+    with _lock:
+        now = time.time()
+        table = _state['table']
+        if table is not None and now - _state['checked'] < interval:
+            return table
+        _state['checked'] = now
+        cache = get_cache()
+        generation = _get_generation(cache)
+        seen = _state['generation']
+        if table is not None and seen == generation:
+            return table
+        complete = False
+        if table is not None and \
+                seen < generation <= seen + MAX_CHANGES:
+            changes, complete = _get_changes(cache, seen + 1, generation)
+        if complete:
+            for _, change, _ in changes:
+                _apply(table, change)
+        else:
+            # Cold start, or missed changes:
+            table = _state['table'] = load_table()
+            changes, _ = _get_changes(
+                cache, generation - MAX_CHANGES + 1, generation)
+        _state['generation'] = _settled(changes, generation, now)
+        return table
+
+
+def lookup(ip, instrument_id):
+    '''
+    Returns the ID of the storage box for uploads from ip for the
+    instrument with instrument_id, or None if no route matches.
+    '''
+    if ip is None:
+        return None
+    return get_table().lookup(ip, instrument_id)
+
+
+def _changed(change):
+    '''
+    Applies a change to this process's table (if loaded) and publishes
+    it for the other processes, once the current transaction has been
+    committed.
+    '''
+    def publish():
+        cache = get_cache()
+        generation = _next_generation(cache)
+        cache.set(CHANGE_KEY % generation, (change, time.time()),
+                  CHANGE_TIMEOUT)
+        with _lock:
+            if _state['table'] is not None:
+                _apply(_state['table'], change)
+                if _state['generation'] == generation - 1:
+                    _state['generation'] = generation
+    on_commit(publish)
+
+
+def uploader_changed(uploader_id):
+    '''
+    Replaces the routes for an uploader after its WAN IP address,
+    instruments or registration requests have changed.
+    '''
+    uploaders_changed([uploader_id])
+
+
+def uploaders_changed(uploader_ids):
+    '''
+    Replaces the routes for several uploaders at once, e.g. after their
+    registration requests have been approved in bulk.
+    '''
+    uploader_ids = sorted(set(uploader_ids))
+    if uploader_ids:
+        _changed(('uploaders', uploader_ids))
+
+
+def route_changed(route_id):
+    '''
+    Replaces (or removes) the routes for a StorageBoxRoute.
+    '''
+    _changed(('routes', [route_id]))
@@ -0,0 +1,11 @@
+"""
+Namespaces and parameter names of the schemas used by MyData
+"""
+
+#: Schema attached to experiments created by MyData, see
+#: fixtures/default_experiment_schema.json
+DEFAULT_EXPERIMENT_SCHEMA = \
+    'http://mytardis.org/schemas/mydata/defaultexperiment'
+
+DEFAULT_EXPERIMENT_PARAMETER_NAMES = \
+    ('uploader', 'user_folder_name', 'group_folder_name')
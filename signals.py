@@ -0,0 +1,286 @@
+"""
+Signal receivers keeping the app's caches consistent with the database
+"""
+from django.contrib.auth.models import User
+from django.core.exceptions import ObjectDoesNotExist
+from django.db.models.signals import m2m_changed
+from django.db.models.signals import post_delete
+from django.db.models.signals import post_save
+from django.db.models.signals import pre_save
+from django.dispatch import receiver
+
+from tardis.tardis_portal.models.access_control import ObjectACL
+from tardis.tardis_portal.models.datafile import DataFileObject
+from tardis.tardis_portal.models.experiment import Experiment
+from tardis.tardis_portal.models.parameters import ExperimentParameter
+from tardis.tardis_portal.models.parameters import ExperimentParameterSet
+from tardis.tardis_portal.models.parameters import ParameterName
+from tardis.tardis_portal.models.parameters import Schema
+from tardis.tardis_portal.models.storage import StorageBox
+
+from . import lookup_cache
+from . import notifications
+from . import registry
+from . import replica_index
+from . import routing
+from .models import StorageBoxRoute
+from .models import Uploader
+from .models import UploaderRegistrationRequest
+from .schemas import DEFAULT_EXPERIMENT_SCHEMA
+from .utils import on_commit
+
+
+def invalidate_experiment_lookups(experiment_id, titles=(), uploaders=()):
+    '''
+    Invalidates cached default experiment lookups which found (or could
+    now find) the experiment: those for its current title and uploader
+    parameters, plus any titles and uploader UUIDs passed in explicitly
+    (e.g. values which have just been removed from the experiment), once
+    the current transaction has been committed.
+    '''
+    if not lookup_cache.is_enabled():
+        return
+    titles = set(titles)
+    uploaders = set(uploaders)
+
+    def invalidate():
+        # Read once committed, so that the new values are seen:
+        titles.update(Experiment.objects.filter(pk=experiment_id)
+                      .values_list('title', flat=True))
+        uploaders.update(
+            ExperimentParameter.objects
+            .filter(parameterset__experiment_id=experiment_id,
+                    parameterset__schema__namespace=DEFAULT_EXPERIMENT_SCHEMA,
+                    name__name='uploader')
+            .values_list('string_value', flat=True))
+        scopes = [lookup_cache.experiment_scope(experiment_id)]
+        scopes += [lookup_cache.title_scope(title)
+                   for title in titles if title is not None]
+        scopes += [lookup_cache.uploader_scope(uploader)
+                   for uploader in uploaders if uploader is not None]
+        lookup_cache.bump(*scopes)
+    on_commit(invalidate)
+
+
+def _is_default_experiment_pset(pset):
+    return pset.schema_id == registry.get_schema_id()
+
+
+@receiver(post_save, sender=ExperimentParameterSet,
+          dispatch_uid='mydata_pset_saved')
+@receiver(post_delete, sender=ExperimentParameterSet,
+          dispatch_uid='mydata_pset_deleted')
+def experiment_parameter_set_changed(sender, instance, **kwargs):
+    if _is_default_experiment_pset(instance):
+        invalidate_experiment_lookups(instance.experiment_id)
+
+
+@receiver(post_save, sender=ExperimentParameter,
+          dispatch_uid='mydata_param_saved')
+@receiver(post_delete, sender=ExperimentParameter,
+          dispatch_uid='mydata_param_deleted')
+def experiment_parameter_changed(sender, instance, **kwargs):
+    try:
+        pset = instance.parameterset
+    except ObjectDoesNotExist:
+        # Cascading delete of the parameter set, which has its own receiver
+        return
+    if not _is_default_experiment_pset(pset):
+        return
+    uploaders = []
+    if instance.name_id == registry.get_parameter_name_id('uploader'):
+        uploaders.append(instance.string_value)
+    invalidate_experiment_lookups(pset.experiment_id, uploaders=uploaders)
+
+
+@receiver(post_save, sender=Experiment,
+          dispatch_uid='mydata_experiment_saved')
+@receiver(post_delete, sender=Experiment,
+          dispatch_uid='mydata_experiment_deleted')
+def experiment_changed(sender, instance, **kwargs):
+    invalidate_experiment_lookups(instance.id, titles=[instance.title])
+
+
+@receiver(post_save, sender=ObjectACL,
+          dispatch_uid='mydata_acl_saved')
+@receiver(post_delete, sender=ObjectACL,
+          dispatch_uid='mydata_acl_deleted')
+def object_acl_changed(sender, instance, **kwargs):
+    '''
+    Also invalidates lookups made by the users the ACL applies to, which
+    may have missed an experiment they couldn't access.
+    '''
+    if instance.content_type.model != 'experiment':
+        return
+    invalidate_experiment_lookups(int(instance.object_id))
+    if not lookup_cache.is_enabled():
+        return
+    if instance.pluginId == 'django_user':
+        user_ids = [instance.entityId]
+    elif instance.pluginId == 'django_group':
+        user_ids = User.objects.filter(groups__id=instance.entityId)\
+            .values_list('id', flat=True)
+    else:
+        return
+    lookup_cache.bump(*[lookup_cache.user_scope(user_id)
+                        for user_id in user_ids])
+
+
+def _folder_names(username, email):
+    return [name for name in (username, email) if name]
+
+
+@receiver(pre_save, sender=User, dispatch_uid='mydata_user_saving')
+def user_saving(sender, instance, update_fields=None, **kwargs):
+    '''
+    Remembers a user's previous username and email address, which
+    lookups for the user's folder may have matched.
+    '''
+    if instance.pk is None or not lookup_cache.is_enabled() or \
+            update_fields is not None and \
+            not set(update_fields) & set(['username', 'email']):
+        return
+    instance._mydata_folder_names = [
+        name for names in User.objects.filter(pk=instance.pk)
+        .values_list('username', 'email') for name in _folder_names(*names)]
+
+
+@receiver(post_save, sender=User, dispatch_uid='mydata_user_saved')
+@receiver(post_delete, sender=User, dispatch_uid='mydata_user_deleted')
+def user_changed(sender, instance, update_fields=None, **kwargs):
+    '''
+    Default experiment lookups match user folder names against users'
+    usernames and email addresses, so invalidates lookups for the
+    user's folder names (e.g. misses cached before the user existed).
+    Saves which don't touch either (e.g. logins) are ignored.
+    '''
+    if update_fields is not None and \
+            not set(update_fields) & set(['username', 'email']):
+        return
+    names = _folder_names(instance.username, instance.email) + \
+        getattr(instance, '_mydata_folder_names', [])
+    lookup_cache.bump(*[lookup_cache.folder_scope(name)
+                        for name in set(names)])
+
+
+@receiver(m2m_changed, sender=User.groups.through,
+          dispatch_uid='mydata_user_groups_changed')
+def user_groups_changed(sender, instance, action, reverse, pk_set,
+                        **kwargs):
+    '''
+    Group membership determines which group ACLs apply to a user.
+    '''
+    if reverse:
+        if action == 'pre_clear':
+            # pk_set isn't provided when clearing a group's members:
+            user_ids = instance.user_set.values_list('id', flat=True)
+        elif action in ('post_add', 'post_remove'):
+            user_ids = pk_set
+        else:
+            return
+        lookup_cache.bump(*[lookup_cache.user_scope(user_id)
+                            for user_id in user_ids])
+    elif action in ('post_add', 'post_remove', 'post_clear'):
+        lookup_cache.bump(lookup_cache.user_scope(instance.id))
+
+
+@receiver(post_save, sender=UploaderRegistrationRequest,
+          dispatch_uid='mydata_registration_request_saved')
+def registration_request_saved(sender, instance, **kwargs):
+    '''
+    Wakes MyData clients long-polling for the request's approval, once
+    the change is visible to them.
+    '''
+    pairs = [(instance.uploader.uuid, instance.requester_key_fingerprint)]
+    on_commit(lambda: notifications.notify(pairs))
+
+
+@receiver(post_save, sender=UploaderRegistrationRequest,
+          dispatch_uid='mydata_registration_request_saved_routing')
+@receiver(post_delete, sender=UploaderRegistrationRequest,
+          dispatch_uid='mydata_registration_request_deleted_routing')
+def registration_request_changed(sender, instance, **kwargs):
+    routing.uploader_changed(instance.uploader_id)
+
+
+@receiver(post_save, sender=Uploader,
+          dispatch_uid='mydata_uploader_saved_routing')
+def uploader_saved(sender, instance, created, **kwargs):
+    '''
+    Updates the uploader's routes if its WAN IP address has changed.
+    Uploaders are saved on every MyData heartbeat, so other changes
+    don't touch the routing table.
+    '''
+    if created:
+        # New uploaders don't have approved registration requests yet
+        return
+    loaded_values = getattr(instance, '_loaded_values', {})
+    if 'wan_ip_address' not in loaded_values or \
+            loaded_values['wan_ip_address'] != instance.wan_ip_address:
+        routing.uploader_changed(instance.id)
+        loaded_values['wan_ip_address'] = instance.wan_ip_address
+
+
+@receiver(post_delete, sender=Uploader,
+          dispatch_uid='mydata_uploader_deleted_routing')
+def uploader_deleted(sender, instance, **kwargs):
+    routing.uploader_changed(instance.id)
+
+
+@receiver(m2m_changed, sender=Uploader.instruments.through,
+          dispatch_uid='mydata_uploader_instruments_changed')
+def uploader_instruments_changed(sender, instance, action, reverse, pk_set,
+                                 **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        routing.uploader_changed(instance.id)
+    elif pk_set:
+        for uploader_id in pk_set:
+            routing.uploader_changed(uploader_id)
+
+
+@receiver(post_save, sender=StorageBoxRoute,
+          dispatch_uid='mydata_route_saved')
+@receiver(post_delete, sender=StorageBoxRoute,
+          dispatch_uid='mydata_route_deleted')
+def storage_box_route_changed(sender, instance, **kwargs):
+    routing.route_changed(instance.id)
+
+
+@receiver(post_save, sender=DataFileObject,
+          dispatch_uid='mydata_dfo_saved')
+def dfo_saved(sender, instance, created=False, update_fields=None,
+              **kwargs):
+    # e.g. verification, which only saves verified and last_verified_time:
+    if update_fields is not None and 'uri' not in update_fields:
+        return
+    replica_index.update_index(instance.id, instance.uri, created)
+
+
+@receiver(post_save, sender=Schema,
+          dispatch_uid='mydata_schema_saved')
+@receiver(post_delete, sender=Schema,
+          dispatch_uid='mydata_schema_deleted')
+def schema_changed(sender, instance, **kwargs):
+    # The ID is compared too, in case the namespace has just changed:
+    if instance.namespace == DEFAULT_EXPERIMENT_SCHEMA or \
+            instance.id == registry.get_schema_id():
+        registry.invalidate()
+
+
+@receiver(post_save, sender=ParameterName,
+          dispatch_uid='mydata_parameter_name_saved')
+@receiver(post_delete, sender=ParameterName,
+          dispatch_uid='mydata_parameter_name_deleted')
+def parameter_name_changed(sender, instance, **kwargs):
+    if instance.schema_id == registry.get_schema_id():
+        registry.invalidate()
+
+
+@receiver(post_save, sender=StorageBox,
+          dispatch_uid='mydata_storage_box_saved')
+@receiver(post_delete, sender=StorageBox,
+          dispatch_uid='mydata_storage_box_deleted')
+def storage_box_changed(sender, instance, **kwargs):
+    registry.invalidate()
@@ -0,0 +1,17 @@
+"""
+Celery tasks for the MyData app's periodic maintenance
+"""
+from celery import shared_task
+
+from . import approvals
+from . import telemetry
+
+
+@shared_task(name='mydata.rollup_telemetry', ignore_result=True)
+def rollup_telemetry():
+    telemetry.rollup_telemetry()
+
+
+@shared_task(name='mydata.expire_approvals', ignore_result=True)
+def expire_approvals():
+    approvals.expire_approvals()
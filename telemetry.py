@@ -0,0 +1,233 @@
+"""
+Time series of uploaders' disk and memory figures
+
+MyData's heartbeats (creating or updating its Uploader) may include
+numeric figures in bytes:
+
+    "telemetry": {"disk_total": ..., "disk_used": ...,
+                  "memory_total": ..., "memory_available": ...}
+
+which are appended to UploaderTelemetry, at most once every
+MYDATA_TELEMETRY_MIN_INTERVAL seconds per uploader.  For older clients,
+memory_total is parsed from the Uploader's human-readable memory field
+(e.g. "16 GB").
+
+rollup_telemetry() (run by the mydata_rollup_telemetry management
+command or the mydata.rollup_telemetry celery task) downsamples samples
+older than MYDATA_TELEMETRY_RETENTION_DAYS into hourly
+UploaderTelemetryRollups, and deletes rollups older than
+MYDATA_TELEMETRY_ROLLUP_RETENTION_DAYS.
+"""
+import re
+from datetime import datetime
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.utils import six
+
+from .models import UploaderTelemetry
+from .models import UploaderTelemetryRollup
+
+KEY_PREFIX = 'mydata:telemetry'
+
+FIELDS = ('disk_total', 'disk_used', 'memory_total', 'memory_available')
+
+_UNITS = {'': 1, 'B': 1, 'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3,
+          'T': 1024 ** 4, 'P': 1024 ** 5}
+
+_SIZE_PATTERN = re.compile(r'^\s*([0-9]*\.?[0-9]+)\s*([KMGTP]?)I?B?\s*$',
+                           re.IGNORECASE)
+
+
+def is_enabled():
+    return getattr(settings, 'MYDATA_TELEMETRY_ENABLED', True)
+
+
+def get_cache():
+    return caches[getattr(settings, 'MYDATA_TELEMETRY_CACHE', 'default')]
+
+
+def parse_size(value):
+    '''
+    Returns a size in bytes from a number or a human-readable string like
+    "16 GB" or "1.5 TiB", or None if value isn't a size.
+    '''
+    if isinstance(value, bool) or value is None:
+        return None
+    if isinstance(value, six.integer_types + (float,)):
+        return int(value) if value >= 0 else None
+    match = _SIZE_PATTERN.match(six.text_type(value))
+    if not match:
+        return None
+    number, unit = match.groups()
+    return int(float(number) * _UNITS[unit.upper()])
+
+
+def record_heartbeat(uploader_id, data, now=None):
+    '''
+    Appends an UploaderTelemetry sample from a heartbeat's data, unless
+    it has no figures or the uploader was sampled too recently.  Returns
+    the new sample, or None.
+    '''
+    if not is_enabled():
+        return None
+    figures = data.get('telemetry')
+    if not isinstance(figures, dict):
+        figures = {}
+    values = dict((field, parse_size(figures.get(field)))
+                  for field in FIELDS)
+    if values['memory_total'] is None:
+        values['memory_total'] = parse_size(data.get('memory'))
+    if all(value is None for value in values.values()):
+        return None
+    interval = getattr(settings, 'MYDATA_TELEMETRY_MIN_INTERVAL', 300)
+    if interval and not get_cache().add(
+            '%s:%s' % (KEY_PREFIX, uploader_id), 1, interval):
+        return None
+    return UploaderTelemetry.objects.create(
+        uploader_id=uploader_id, timestamp=now or datetime.now(), **values)
+
+
+class _Period(object):
+    '''
+    Accumulates an uploader's samples for one period.
+    '''
+    def __init__(self, uploader_id, period_start):
+        self.uploader_id = uploader_id
+        self.period_start = period_start
+        self.samples = 0
+        self.disk_total = None
+        self.disk_used_sum = 0
+        self.disk_used_count = 0
+        self.disk_used_max = None
+        self.memory_total = None
+        self.memory_available_sum = 0
+        self.memory_available_count = 0
+        self.memory_available_min = None
+
+    def add(self, disk_total, disk_used, memory_total, memory_available,
+            samples=1):
+        self.samples += samples
+        self.disk_total = _max(self.disk_total, disk_total)
+        self.memory_total = _max(self.memory_total, memory_total)
+        if disk_used is not None:
+            self.disk_used_sum += disk_used * samples
+            self.disk_used_count += samples
+            self.disk_used_max = _max(self.disk_used_max, disk_used)
+        if memory_available is not None:
+            self.memory_available_sum += memory_available * samples
+            self.memory_available_count += samples
+            self.memory_available_min = _min(self.memory_available_min,
+                                             memory_available)
+
+    def add_rollup(self, rollup):
+        self.add(rollup.disk_total, rollup.disk_used_mean,
+                 rollup.memory_total, rollup.memory_available_mean,
+                 samples=rollup.samples)
+        self.disk_used_max = _max(self.disk_used_max, rollup.disk_used_max)
+        self.memory_available_min = _min(self.memory_available_min,
+                                         rollup.memory_available_min)
+
+    def to_rollup(self):
+        return UploaderTelemetryRollup(
+            uploader_id=self.uploader_id,
+            period_start=self.period_start,
+            samples=self.samples,
+            disk_total=self.disk_total,
+            disk_used_mean=_mean(self.disk_used_sum, self.disk_used_count),
+            disk_used_max=self.disk_used_max,
+            memory_total=self.memory_total,
+            memory_available_mean=_mean(self.memory_available_sum,
+                                        self.memory_available_count),
+            memory_available_min=self.memory_available_min)
+
+
+def _max(a, b):
+    return b if a is None else a if b is None else max(a, b)
+
+
+def _min(a, b):
+    return b if a is None else a if b is None else min(a, b)
+
+
+def _mean(total, count):
+    return int(total / count) if count else None
+
+
+def _period_start(timestamp):
+    return timestamp.replace(minute=0, second=0, microsecond=0)
+
+
+def _save_periods(periods, chunk_size=450):
+    '''
+    Saves rollups for periods, merging any existing rollups for the same
+    uploaders and periods (e.g. after the retention period was changed).
+    Existing rollups are found chunk_size uploaders at a time within the
+    periods' time range, to stay within SQLite's limit of 999 parameters
+    per query.
+    '''
+    by_key = dict(((period.uploader_id, period.period_start), period)
+                  for period in periods)
+    uploader_ids = sorted(set(key[0] for key in by_key))
+    first = min(key[1] for key in by_key)
+    last = max(key[1] for key in by_key)
+    merged = []
+    for start in range(0, len(uploader_ids), chunk_size):
+        existing = UploaderTelemetryRollup.objects.filter(
+            uploader_id__in=uploader_ids[start:start + chunk_size],
+            period_start__gte=first, period_start__lte=last)
+        for rollup in existing:
+            key = (rollup.uploader_id, rollup.period_start)
+            if key in by_key:
+                by_key[key].add_rollup(rollup)
+                merged.append(rollup.id)
+    for start in range(0, len(merged), chunk_size):
+        UploaderTelemetryRollup.objects.filter(
+            pk__in=merged[start:start + chunk_size]).delete()
+    UploaderTelemetryRollup.objects.bulk_create(
+        [period.to_rollup() for period in periods])
+
+
+def rollup_telemetry(now=None, chunk_size=1000):
+    '''
+    Downsamples expired UploaderTelemetry samples into hourly rollups,
+    deletes them, and deletes expired rollups.  Returns the numbers of
+    (samples rolled up, rollups deleted).
+    '''
+    now = now or datetime.now()
+    retention = timedelta(
+        days=getattr(settings, 'MYDATA_TELEMETRY_RETENTION_DAYS', 7))
+    rollup_retention = timedelta(
+        days=getattr(settings, 'MYDATA_TELEMETRY_ROLLUP_RETENTION_DAYS',
+                     365))
+    # Only roll up whole periods:
+    cutoff = _period_start(now - retention)
+    expired = UploaderTelemetry.objects.filter(timestamp__lt=cutoff)
+    rolled_up = 0
+    with transaction.atomic():
+        periods = []
+        period = None
+        for row in expired.order_by('uploader', 'timestamp')\
+                .values_list('uploader_id', 'timestamp', *FIELDS)\
+                .iterator():
+            uploader_id, timestamp = row[:2]
+            period_start = _period_start(timestamp)
+            if period is None or period.uploader_id != uploader_id or \
+                    period.period_start != period_start:
+                if len(periods) >= chunk_size:
+                    _save_periods(periods)
+                    periods = []
+                period = _Period(uploader_id, period_start)
+                periods.append(period)
+            period.add(*row[2:])
+            rolled_up += 1
+        if periods:
+            _save_periods(periods)
+        expired.delete()
+        expired_rollups = UploaderTelemetryRollup.objects.filter(
+            period_start__lt=now - rollup_retention)
+        rollups_deleted = expired_rollups.count()
+        expired_rollups.delete()
+    return rolled_up, rollups_deleted
@@ -0,0 +1,66 @@
+'''
+Testing the MyData app's access checks
+'''
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from tardis.tardis_portal.models.access_control import ObjectACL
+from tardis.tardis_portal.models.experiment import Experiment
+
+from tardis.apps.mydata import acl
+
+
+class ExperimentAccessTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='mydata',
+                                             password='mydata')
+        self.other_user = User.objects.create_user(username='other',
+                                                   password='other')
+
+    def create_experiments(self, count, owner):
+        experiment_ids = []
+        for index in range(count):
+            experiment = Experiment(title='Experiment %d' % index,
+                                    created_by=owner)
+            experiment.save()
+            ObjectACL(content_type=experiment.get_ct(),
+                      object_id=experiment.id,
+                      pluginId='django_user',
+                      entityId=str(owner.id),
+                      canRead=True,
+                      isOwner=True,
+                      aclOwnershipType=ObjectACL.OWNER_OWNED).save()
+            experiment_ids.append(experiment.id)
+        return experiment_ids
+
+    def count_queries(self, func):
+        with CaptureQueriesContext(connection) as context:
+            func()
+        return len(context.captured_queries)
+
+    def test_can_access_experiment(self):
+        owned = self.create_experiments(2, self.user)
+        others = self.create_experiments(1, self.other_user)
+        self.assertTrue(acl.can_access_experiment(self.user, owned[0]))
+        self.assertFalse(acl.can_access_experiment(self.user, others[0]))
+        self.assertEqual(
+            acl.accessible_experiment_ids(self.user, owned + others),
+            set(owned))
+
+    def test_query_count_independent_of_acl_set_size(self):
+        owned = self.create_experiments(2, self.user)
+        few = self.count_queries(
+            lambda: acl.can_access_experiment(self.user, owned[0]))
+        few_batch = self.count_queries(
+            lambda: acl.accessible_experiment_ids(self.user, owned))
+        owned += self.create_experiments(50, self.user)
+        self.assertEqual(
+            self.count_queries(
+                lambda: acl.can_access_experiment(self.user, owned[0])),
+            few)
+        self.assertEqual(
+            self.count_queries(
+                lambda: acl.accessible_experiment_ids(self.user, owned)),
+            few_batch)
@@ -0,0 +1,106 @@
+'''
+Testing that the MyData admin pages scale with the number of uploaders
+'''
+from django.contrib.auth.models import User
+from django.core.urlresolvers import reverse
+from django.db import connection
+from django.http import QueryDict
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from tardis.apps.mydata.admin import CappedCountPaginator
+from tardis.apps.mydata.models import Uploader
+from tardis.apps.mydata.models import UploaderRegistrationRequest
+from tardis.apps.mydata.models import UploaderSetting
+
+
+class AdminQueryCountTest(TestCase):
+    def setUp(self):
+        self.admin_user = User.objects.create_superuser(
+            username='admin', email='admin@example.com', password='admin')
+        self.client.login(username='admin', password='admin')
+        self.uploader_count = 0
+
+    def create_uploaders(self, count):
+        for _ in range(count):
+            self.uploader_count += 1
+            uploader = Uploader(uuid='uuid-%d' % self.uploader_count,
+                                name='Uploader %d' % self.uploader_count,
+                                interface='Ethernet',
+                                mac_address='ABCDEFG')
+            uploader.save()
+            UploaderRegistrationRequest(
+                uploader=uploader,
+                requester_name='Requester',
+                requester_email='requester@example.com',
+                requester_public_key='ssh-rsa AAAA',
+                requester_key_fingerprint='fingerprint').save()
+            UploaderSetting(uploader=uploader, key='key',
+                            value='value').save()
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(context.captured_queries)
+
+    def assert_constant_queries(self, url):
+        self.create_uploaders(1)
+        queries = self.count_queries(url)
+        self.create_uploaders(20)
+        self.assertEqual(self.count_queries(url), queries)
+
+    def test_uploader_changelist(self):
+        self.assert_constant_queries(
+            reverse('admin:mydata_uploader_changelist'))
+
+    def test_registration_request_changelist(self):
+        self.assert_constant_queries(
+            reverse('admin:mydata_uploaderregistrationrequest_changelist'))
+
+    def test_setting_changelist(self):
+        self.assert_constant_queries(
+            reverse('admin:mydata_uploadersetting_changelist'))
+
+    def test_settings_inline_is_paginated(self):
+        self.create_uploaders(1)
+        uploader = Uploader.objects.get()
+        UploaderSetting.objects.bulk_create(
+            [UploaderSetting(uploader=uploader, key='key%d' % index,
+                             value='value') for index in range(120)])
+        url = reverse('admin:mydata_uploader_change', args=[uploader.id])
+        response = self.client.get(url)
+        self.assertEqual(
+            response.context['inline_admin_formsets'][0]
+            .formset.initial_form_count(), 50)
+        response = self.client.get(url + '?settings_page=3')
+        self.assertEqual(
+            response.context['inline_admin_formsets'][0]
+            .formset.initial_form_count(), 21)
+
+    def test_settings_inline_page_links_keep_query(self):
+        self.create_uploaders(1)
+        uploader = Uploader.objects.get()
+        UploaderSetting.objects.bulk_create(
+            [UploaderSetting(uploader=uploader, key='key%d' % index,
+                             value='value') for index in range(120)])
+        url = reverse('admin:mydata_uploader_change', args=[uploader.id])
+        response = self.client.get(
+            url, {'_changelist_filters': 'q=abc', 'settings_page': 2})
+        formset = response.context['inline_admin_formsets'][0].formset
+        self.assertEqual(QueryDict(formset.previous_page_query),
+                         QueryDict('_changelist_filters=q%3Dabc'
+                                   '&settings_page=1'))
+        self.assertEqual(QueryDict(formset.next_page_query),
+                         QueryDict('_changelist_filters=q%3Dabc'
+                                   '&settings_page=3'))
+
+    def test_changelist_count_is_capped(self):
+        self.create_uploaders(21)
+        paginator = CappedCountPaginator(Uploader.objects.order_by('id'), 10)
+        paginator.max_count = 15
+        with CaptureQueriesContext(connection) as context:
+            self.assertEqual(paginator.count, 15)
+            self.assertEqual(paginator.num_pages, 2)
+        self.assertEqual(len(context.captured_queries), 1)
+        self.assertEqual(len(paginator.page(2).object_list), 5)
@@ -5,9 +5,13 @@ Testing the tastypie-based mytardis api
 .. moduleauthor:: James Wettenhall <james.wettenhall@monash.edu>
 '''
 import json
+from datetime import datetime
+from datetime import timedelta
 import os
+import shutil
 import tempfile
 import urllib
+import zlib
 
 from django.contrib.auth.models import Permission
 from django.contrib.auth.models import User
@@ -15,6 +19,7 @@ from django.contrib.auth.models import Group
 
 from django.test.client import Client
 from django.test import TestCase
+from django.test.utils import override_settings
 
 from tastypie.test import ResourceTestCase
 
@@ -22,7 +27,19 @@ from tardis.tardis_portal.auth.authservice import AuthService
 from tardis.tardis_portal.auth.localdb_auth import django_user
 from tardis.tardis_portal.models import Facility
 from tardis.tardis_portal.models import Instrument
+from tardis.tardis_portal.models import Experiment
+from tardis.tardis_portal.models import ObjectACL
+from tardis.tardis_portal.models.datafile import DataFile
+from tardis.tardis_portal.models.datafile import DataFileObject
+from tardis.tardis_portal.models.dataset import Dataset
+from tardis.tardis_portal.models.storage import StorageBox
+from tardis.tardis_portal.models.storage import StorageBoxOption
 
+from tardis.apps.mydata import routing
+from tardis.apps.mydata.api import ExperimentAppResource
+from tardis.apps.mydata.models import DefaultExperimentLock
+
+from tardis.apps.mydata.models import StorageBoxRoute
 from tardis.apps.mydata.models import Uploader
 from tardis.apps.mydata.models import UploaderRegistrationRequest
 
@@ -82,3 +99,226 @@ class UploaderAppResourceTest(MyTardisResourceTestCase):
         for key, value in expected_output.iteritems():
             self.assertTrue(key in returned_data)
             self.assertEqual(returned_data[key], value)
+
+    def test_heartbeat_keeps_volatile_fields_out_of_uploader(self):
+        uploader = Uploader(uuid='1234-5678', name='Heartbeat',
+                            interface='Ethernet', mac_address='ABCDEFG',
+                            memory='8 GB', disk_usage='10 GB',
+                            updated_time=datetime.now() - timedelta(minutes=1))
+        uploader.save()
+        updated_time = Uploader.objects.get(pk=uploader.pk).updated_time
+        url = '/api/v1/mydata_uploader/%d/' % uploader.id
+        data = {'uuid': '1234-5678', 'name': 'Heartbeat',
+                'memory': '16 GB', 'disk_usage': '20 GB'}
+        response = self.api_client.put(
+            url, data=data, authentication=self.get_credentials())
+        self.assertHttpOK(response)
+        uploader = Uploader.objects.get(pk=uploader.pk)
+        self.assertEqual(uploader.memory, '8 GB')
+        self.assertEqual(uploader.disk_usage, '10 GB')
+        self.assertEqual(uploader.updated_time, updated_time)
+        with override_settings(MYDATA_UPLOADER_UPDATED_TIME_INTERVAL=30):
+            response = self.api_client.put(
+                url, data=data, authentication=self.get_credentials())
+        self.assertHttpOK(response)
+        self.assertGreater(
+            Uploader.objects.get(pk=uploader.pk).updated_time, updated_time)
+
+
+class ExperimentAppResourceTest(MyTardisResourceTestCase):
+    fixtures = ['default_experiment_schema']
+
+    def setUp(self):
+        super(ExperimentAppResourceTest, self).setUp()
+        self.uploader = Uploader(uuid='1234-5678', name='Test Uploader',
+                                 interface='Ethernet',
+                                 mac_address='ABCDEFG')
+        self.uploader.save()
+
+    def test_get_or_create_default_experiment(self):
+        data = {
+            "title": "Test Instrument - testuser",
+            "description": "Uploaded from Test Instrument",
+            "folder_structure": "Username / Dataset",
+            "parameter_sets": [{
+                "schema": "http://mytardis.org/schemas"
+                          "/mydata/defaultexperiment",
+                "parameters": [
+                    {"name": "uploader", "value": "1234-5678"},
+                    {"name": "user_folder_name", "value": "testuser"},
+                ]
+            }]
+        }
+        created = self.api_client.post(
+            '/api/v1/mydata_experiment/get_or_create/', data=data,
+            authentication=self.get_credentials())
+        self.assertHttpCreated(created)
+        found = self.api_client.post(
+            '/api/v1/mydata_experiment/get_or_create/', data=data,
+            authentication=self.get_credentials())
+        self.assertHttpOK(found)
+        self.assertEqual(json.loads(found.content)['id'],
+                         json.loads(created.content)['id'])
+        # Both requests locked the same row:
+        self.assertEqual(DefaultExperimentLock.objects.count(), 1)
+
+    def test_default_experiment_query(self):
+        query = ExperimentAppResource.get_default_experiment_query(
+            {'uploader': '1234-5678', 'user_folder_name': 'TestUser',
+             'group_folder_name': None})
+        self.assertEqual(query['folder_structure'], 'Username / ...')
+        other_case = dict(query, user_folder_name='testuser')
+        self.assertEqual(
+            ExperimentAppResource.get_default_experiment_lock_key(query),
+            ExperimentAppResource.get_default_experiment_lock_key(other_case))
+        other_uploader = dict(query, uploader='8765-4321')
+        self.assertNotEqual(
+            ExperimentAppResource.get_default_experiment_lock_key(query),
+            ExperimentAppResource.get_default_experiment_lock_key(
+                other_uploader))
+
+    def test_get_or_create_requires_registered_uploader(self):
+        data = {
+            "title": "Test Instrument - testuser",
+            "parameter_sets": [{
+                "schema": "http://mytardis.org/schemas"
+                          "/mydata/defaultexperiment",
+                "parameters": [
+                    {"name": "uploader", "value": "unregistered"},
+                    {"name": "user_folder_name", "value": "testuser"},
+                ]
+            }]
+        }
+        response = self.api_client.post(
+            '/api/v1/mydata_experiment/get_or_create/', data=data,
+            authentication=self.get_credentials())
+        self.assertHttpBadRequest(response)
+
+
+class DatasetAppResourceTest(MyTardisResourceTestCase):
+    def setUp(self):
+        super(DatasetAppResourceTest, self).setUp()
+        self.experiment = Experiment(title='Test Experiment',
+                                     created_by=self.user)
+        self.experiment.save()
+        ObjectACL(content_type=self.experiment.get_ct(),
+                  object_id=self.experiment.id,
+                  pluginId='django_user',
+                  entityId=str(self.user.id),
+                  canRead=True,
+                  canWrite=True,
+                  isOwner=True,
+                  aclOwnershipType=ObjectACL.OWNER_OWNED).save()
+
+    def test_get_or_create_bulk(self):
+        experiment_uri = '/api/v1/experiment/%d/' % self.experiment.id
+        instrument_uri = '/api/v1/instrument/%d/' % self.testinstrument.id
+        data = {'objects': [
+            {'experiment': experiment_uri, 'description': 'Dataset 1',
+             'instrument': instrument_uri},
+            {'experiment': experiment_uri, 'description': 'Dataset 2',
+             'instrument': instrument_uri},
+            {'experiment': experiment_uri, 'description': 'Dataset 1',
+             'instrument': instrument_uri},
+        ]}
+        response = self.api_client.post(
+            '/api/v1/mydata_dataset/get_or_create_bulk/', data=data,
+            authentication=self.get_credentials())
+        self.assertHttpOK(response)
+        created = json.loads(response.content)['objects']
+        self.assertEqual([obj['created'] for obj in created],
+                         [True, True, True])
+        self.assertEqual(created[0]['id'], created[2]['id'])
+        self.assertNotEqual(created[0]['id'], created[1]['id'])
+        self.assertEqual(self.experiment.datasets.count(), 2)
+
+        response = self.api_client.post(
+            '/api/v1/mydata_dataset/get_or_create_bulk/', data=data,
+            authentication=self.get_credentials())
+        found = json.loads(response.content)['objects']
+        self.assertEqual([obj['created'] for obj in found],
+                         [False, False, False])
+        self.assertEqual([obj['id'] for obj in found],
+                         [obj['id'] for obj in created])
+
+    def test_manifest_diff(self):
+        dataset = Dataset(description='Test Dataset')
+        dataset.save()
+        dataset.experiments.add(self.experiment)
+        storage_box = StorageBox(name='test', max_size=0)
+        storage_box.save()
+        for filename, size, verified in (('stored.txt', 10, True),
+                                         ('unverified.txt', 10, False),
+                                         ('changed.txt', 10, True)):
+            datafile = DataFile(dataset=dataset, filename=filename,
+                                directory='subdir', size=size)
+            datafile.save()
+            DataFileObject(datafile=datafile, storage_box=storage_box,
+                           uri='subdir/' + filename,
+                           verified=verified).save()
+        lines = [json.dumps({'path': 'subdir/' + filename, 'size': size,
+                             'mtime': 0})
+                 for filename, size in (('stored.txt', 10),
+                                        ('unverified.txt', 10),
+                                        ('changed.txt', 20),
+                                        ('new.txt', 5))]
+        response = self.api_client.client.post(
+            '/api/v1/mydata_dataset/%d/manifest_diff/' % dataset.id,
+            data=zlib.compress('\n'.join(lines).encode('utf-8')),
+            content_type='application/octet-stream',
+            HTTP_AUTHORIZATION=self.get_credentials())
+        self.assertHttpOK(response)
+        results = [json.loads(line) for line in
+                   b''.join(response.streaming_content).splitlines()]
+        self.assertEqual(
+            results,
+            [{'path': 'subdir/unverified.txt', 'status': 'unverified'},
+             {'path': 'subdir/changed.txt', 'status': 'size'},
+             {'path': 'subdir/new.txt', 'status': 'missing'}])
+
+
+class DataFileAppResourceTest(MyTardisResourceTestCase):
+    def setUp(self):
+        super(DataFileAppResourceTest, self).setUp()
+        routing._state.update(table=None, generation=None, checked=0.0)
+        experiment = Experiment(title='Test Experiment', created_by=self.user)
+        experiment.save()
+        ObjectACL(content_type=experiment.get_ct(),
+                  object_id=experiment.id,
+                  pluginId='django_user',
+                  entityId=str(self.user.id),
+                  canRead=True,
+                  canWrite=True,
+                  isOwner=True,
+                  aclOwnershipType=ObjectACL.OWNER_OWNED).save()
+        self.dataset = Dataset(description='Test Dataset',
+                               instrument=self.testinstrument)
+        self.dataset.save()
+        self.dataset.experiments.add(experiment)
+        self.location = tempfile.mkdtemp()
+        self.storage_box = StorageBox(name='routed', max_size=0)
+        self.storage_box.save()
+        StorageBoxOption(storage_box=self.storage_box, key='location',
+                         value=self.location).save()
+
+    def tearDown(self):
+        shutil.rmtree(self.location)
+        super(DataFileAppResourceTest, self).tearDown()
+
+    def test_unidentified_upload_is_routed_by_ip(self):
+        # The test client's requests come from 127.0.0.1:
+        StorageBoxRoute(network='127.0.0.0/8',
+                        instrument=self.testinstrument,
+                        storage_box=self.storage_box).save()
+        response = self.api_client.post(
+            '/api/v1/mydata_dataset_file/',
+            data={'dataset': '/api/v1/dataset/%d/' % self.dataset.id,
+                  'filename': 'routed.txt',
+                  'directory': '',
+                  'md5sum': 'd41d8cd98f00b204e9800998ecf8427e',
+                  'size': 0,
+                  'mimetype': 'text/plain'},
+            authentication=self.get_credentials())
+        self.assertHttpCreated(response)
+        dfo = DataFileObject.objects.get(datafile__filename='routed.txt')
+        self.assertEqual(dfo.storage_box_id, self.storage_box.id)
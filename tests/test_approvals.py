@@ -0,0 +1,112 @@
+'''
+Testing bulk approval and expiry of uploader registration requests
+'''
+from datetime import date
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.core.urlresolvers import reverse
+from django.test import TestCase
+from django.test.utils import override_settings
+
+from tardis.tardis_portal.models.storage import StorageBox
+
+from tardis.apps.mydata import approvals
+from tardis.apps.mydata import notifications
+from tardis.apps.mydata.models import Uploader
+from tardis.apps.mydata.models import UploaderRegistrationRequest
+
+
+@override_settings(CACHES={
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'mydata-approval-tests',
+    }})
+class ApprovalsTest(TestCase):
+    def setUp(self):
+        caches['default'].clear()
+        self.storage_box = StorageBox(name='box', max_size=0)
+        self.storage_box.save()
+        self.requests = []
+        for index in range(3):
+            uploader = Uploader(uuid='uuid-%d' % index,
+                                name='Uploader %d' % index,
+                                interface='Ethernet',
+                                mac_address='ABCDEFG')
+            uploader.save()
+            registration_request = UploaderRegistrationRequest(
+                uploader=uploader,
+                requester_name='Requester',
+                requester_email='requester@example.com',
+                requester_public_key='ssh-rsa AAAA',
+                requester_key_fingerprint='fingerprint')
+            registration_request.save()
+            self.requests.append(registration_request)
+
+    def version(self, index):
+        return notifications.get_cache().get(
+            notifications._version_key('uuid-%d' % index, 'fingerprint'))
+
+    def test_approve(self):
+        versions = [self.version(index) for index in range(3)]
+        expiry = date.today() + timedelta(days=30)
+        approved = approvals.approve_registration_requests(
+            [self.requests[0].id, self.requests[1].id],
+            self.storage_box.id, approval_expiry=expiry)
+        self.assertEqual(approved, 2)
+        approved_requests = UploaderRegistrationRequest.objects.filter(
+            approved=True)
+        self.assertEqual(
+            set(approved_requests.values_list('id', flat=True)),
+            set([self.requests[0].id, self.requests[1].id]))
+        for registration_request in approved_requests:
+            self.assertEqual(registration_request.approved_storage_box_id,
+                             self.storage_box.id)
+            self.assertEqual(registration_request.approval_expiry, expiry)
+            self.assertIsNotNone(registration_request.approval_time)
+        # Long-polling clients are woken for the approved requests only:
+        self.assertNotEqual(self.version(0), versions[0])
+        self.assertNotEqual(self.version(1), versions[1])
+        self.assertEqual(self.version(2), versions[2])
+
+    def test_expire(self):
+        approvals.approve_registration_requests(
+            [registration_request.id
+             for registration_request in self.requests],
+            self.storage_box.id,
+            approval_expiry=date.today() - timedelta(days=1))
+        UploaderRegistrationRequest.objects.filter(
+            pk=self.requests[2].id).update(approval_expiry=None)
+        self.assertEqual(approvals.expire_approvals(), 2)
+        self.assertEqual(
+            list(UploaderRegistrationRequest.objects.filter(approved=True)
+                 .values_list('id', flat=True)),
+            [self.requests[2].id])
+        # Uploads are no longer staged in the storage box:
+        self.assertFalse(
+            UploaderRegistrationRequest.objects
+            .filter(approved=False, approved_storage_box__isnull=False)
+            .exists())
+        self.assertEqual(approvals.expire_approvals(), 0)
+
+    def test_admin_action(self):
+        User.objects.create_superuser(
+            username='admin', email='admin@example.com', password='admin')
+        self.client.login(username='admin', password='admin')
+        url = reverse(
+            'admin:mydata_uploaderregistrationrequest_changelist')
+        data = {'action': 'approve_selected',
+                '_selected_action': [registration_request.id
+                                     for registration_request
+                                     in self.requests]}
+        response = self.client.post(url, data)
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(UploaderRegistrationRequest.objects
+                         .filter(approved=True).exists())
+
+        data.update(apply='1', approved_storage_box=self.storage_box.id)
+        response = self.client.post(url, data)
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(UploaderRegistrationRequest.objects
+                         .filter(approved=True).count(), 3)
@@ -0,0 +1,96 @@
+'''
+Testing the streaming export of the uploader fleet's inventory
+'''
+import csv
+import json
+from datetime import datetime
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.urlresolvers import reverse
+from django.test import TestCase
+from django.utils.six import StringIO
+
+from tardis.tardis_portal.models.storage import StorageBox
+
+from tardis.apps.mydata import export
+from tardis.apps.mydata.models import Uploader
+from tardis.apps.mydata.models import UploaderRegistrationRequest
+from tardis.apps.mydata.models import UploaderSetting
+
+
+class FleetExportTest(TestCase):
+    def setUp(self):
+        self.now = datetime.now()
+        storage_box = StorageBox(name='box', max_size=0)
+        storage_box.save()
+        for index in range(5):
+            uploader = Uploader(uuid='uuid-%d' % index,
+                                name='Uploader %d' % index,
+                                interface='Ethernet',
+                                mac_address='ABCDEFG',
+                                updated_time=self.now -
+                                timedelta(days=index))
+            uploader.save()
+            UploaderSetting(uploader=uploader, key='folder_structure',
+                            value='Username / Dataset').save()
+            if index < 3:
+                UploaderRegistrationRequest(
+                    uploader=uploader,
+                    requester_name='Requester',
+                    requester_email='requester@example.com',
+                    requester_public_key='ssh-rsa AAAA',
+                    requester_key_fingerprint='fingerprint',
+                    approved=(index == 0),
+                    approved_storage_box=storage_box
+                    if index == 0 else None).save()
+
+    def test_iter_uploaders(self):
+        rows = list(export.iter_uploaders(chunk_size=2))
+        self.assertEqual([row['uuid'] for row in rows],
+                         ['uuid-%d' % index for index in range(5)])
+        self.assertEqual(
+            [row['registration_status'] for row in rows],
+            ['approved', 'pending', 'pending', 'unregistered',
+             'unregistered'])
+        self.assertEqual(rows[0]['approved_storage_boxes'], ['box'])
+        self.assertEqual(rows[4]['settings'],
+                         {'folder_structure': 'Username / Dataset'})
+
+    def test_since(self):
+        rows = export.iter_uploaders(
+            since=self.now - timedelta(days=1, hours=12))
+        self.assertEqual([row['uuid'] for row in rows],
+                         ['uuid-0', 'uuid-1'])
+
+    def test_view(self):
+        url = reverse('tardis.apps.mydata.views.export_fleet')
+        User.objects.create_user(username='user', password='user')
+        self.client.login(username='user', password='user')
+        self.assertEqual(self.client.get(url).status_code, 403)
+
+        User.objects.create_superuser(
+            username='admin', email='admin@example.com', password='admin')
+        self.client.login(username='admin', password='admin')
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        rows = list(csv.reader(
+            b''.join(response.streaming_content).splitlines()))
+        self.assertEqual(rows[0], export.COLUMNS)
+        self.assertEqual(len(rows), 6)
+
+        response = self.client.get(url, {'format': 'jsonl'})
+        lines = b''.join(response.streaming_content).splitlines()
+        self.assertEqual(json.loads(lines[0])['uuid'], 'uuid-0')
+
+        self.assertEqual(
+            self.client.get(url, {'format': 'xml'}).status_code, 400)
+
+    def test_command(self):
+        output = StringIO()
+        call_command('mydata_export_fleet', format='jsonl', stdout=output)
+        lines = output.getvalue().splitlines()
+        self.assertEqual(len(lines), 5)
+        self.assertEqual(json.loads(lines[0])['uuid'], 'uuid-0')
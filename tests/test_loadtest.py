@@ -0,0 +1,91 @@
+'''
+Testing the MyData load test harness
+'''
+import shutil
+import tempfile
+
+from django.test import SimpleTestCase
+
+from tardis.tardis_portal.models.datafile import DataFile
+from tardis.tardis_portal.models.datafile import DataFileObject
+from tardis.tardis_portal.models.storage import StorageBox
+from tardis.tardis_portal.models.storage import StorageBoxOption
+
+from tardis.apps.mydata import loadtest
+from tardis.apps.mydata.tests.test_api import MyTardisResourceTestCase
+
+
+class LoadTestReportingTest(SimpleTestCase):
+    def test_classify(self):
+        self.assertIsNone(loadtest.classify(201, ''))
+        self.assertEqual(loadtest.classify(409, ''), 'contention')
+        self.assertEqual(
+            loadtest.classify(500, 'OperationalError: database is locked'),
+            'contention')
+        self.assertEqual(loadtest.classify(500, 'KeyError'), 'error')
+        self.assertEqual(loadtest.classify(None, 'Connection refused'),
+                         'error')
+
+    def test_summarize(self):
+        recorder = loadtest.Recorder()
+        for index in range(100):
+            recorder.record('mydata_experiment GET', (index + 1) / 1000.0,
+                            'contention' if index == 99 else None)
+        summary = recorder.summarize(2.0)['mydata_experiment GET']
+        self.assertEqual(summary['requests'], 100)
+        self.assertEqual(summary['throughput'], 50.0)
+        self.assertEqual(summary['p50'], 0.050)
+        self.assertEqual(summary['p99'], 0.099)
+        self.assertEqual(summary['max'], 0.100)
+        self.assertEqual(summary['contention'], 1)
+        self.assertEqual(summary['errors'], 0)
+
+
+class TestClientMyDataClient(loadtest.MyDataClient):
+    '''
+    Sends the simulated client's requests through Django's test client
+    '''
+    def __init__(self, client, *args, **kwargs):
+        super(TestClientMyDataClient, self).__init__(*args, **kwargs)
+        self.client = client
+
+    def send(self, method, url, body):
+        response = self.client.generic(
+            method, url, body or '', content_type='application/json',
+            HTTP_AUTHORIZATION=self.auth, HTTP_ACCEPT='application/json')
+        return response.status_code, response.content.decode('utf-8')
+
+
+class LoadTestSessionTest(MyTardisResourceTestCase):
+    fixtures = ['default_experiment_schema']
+
+    def setUp(self):
+        super(LoadTestSessionTest, self).setUp()
+        self.location = tempfile.mkdtemp()
+        self.storage_box = StorageBox(name='staging', max_size=0)
+        self.storage_box.save()
+        StorageBoxOption(storage_box=self.storage_box, key='location',
+                         value=self.location).save()
+
+    def tearDown(self):
+        shutil.rmtree(self.location)
+        super(LoadTestSessionTest, self).tearDown()
+
+    def test_run_session(self):
+        recorder = loadtest.Recorder()
+        client = TestClientMyDataClient(
+            self.client, '', self.username, self.user.api_key.key,
+            self.testinstrument.id, recorder,
+            loadtest.approver(self.storage_box.id), files_per_session=2)
+        client.run_session()
+        summary = recorder.summarize(1.0)
+        for endpoint, stats in summary.items():
+            self.assertEqual(stats['errors'] + stats['contention'], 0,
+                             endpoint)
+        self.assertEqual(summary['mydata_dataset_file POST']['requests'], 2)
+        # Uploads were staged in the approved storage box:
+        self.assertEqual(
+            DataFileObject.objects.filter(
+                storage_box=self.storage_box).count(), 2)
+        self.assertEqual(DataFile.objects.count(), 2)
+        self.assertEqual(summary['mydata_replica GET']['requests'], 2)
@@ -0,0 +1,137 @@
+'''
+Testing the cache for MyData's default experiment lookups
+'''
+from django.contrib.auth.models import Group
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.test import TestCase
+from django.test.utils import override_settings
+
+from tardis.tardis_portal.models.access_control import ObjectACL
+from tardis.tardis_portal.models.experiment import Experiment
+from tardis.tardis_portal.models.parameters import ExperimentParameter
+from tardis.tardis_portal.models.parameters import ExperimentParameterSet
+from tardis.tardis_portal.models.parameters import ParameterName
+from tardis.tardis_portal.models.parameters import Schema
+
+from tardis.apps.mydata import lookup_cache
+from tardis.apps.mydata.schemas import DEFAULT_EXPERIMENT_SCHEMA
+
+
+@override_settings(CACHES={
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'mydata-lookup-cache-tests',
+    }})
+class ExperimentLookupCacheTest(TestCase):
+    fixtures = ['default_experiment_schema']
+
+    def setUp(self):
+        caches['default'].clear()
+        lookup_cache._stats.clear()
+        self.user = User.objects.create_user(username='mydata',
+                                             password='mydata')
+        self.query = dict(uploader='1234-5678',
+                          folder_structure='Username / ...',
+                          user_folder_name='testuser',
+                          group_folder_name=None)
+        self.computed = []
+
+    def lookup(self, result):
+        def compute():
+            self.computed.append(result)
+            return result
+        return lookup_cache.get_or_compute(self.query, self.user, compute)
+
+    def test_caches_misses(self):
+        self.assertIsNone(self.lookup(None))
+        self.assertIsNone(self.lookup(None))
+        self.assertEqual(len(self.computed), 1)
+        stats = lookup_cache.get_stats()
+        self.assertEqual(stats['hits'], 1)
+        self.assertEqual(stats['misses'], 1)
+
+    @override_settings(MYDATA_EXPERIMENT_LOOKUP_CACHE_STATS_INTERVAL=3600)
+    def test_stats_are_counted_per_process(self):
+        lookup_cache.flush_stats()
+        self.assertIsNone(self.lookup(None))
+        self.assertIsNone(self.lookup(None))
+        self.assertIsNone(
+            caches['default'].get('%s:stats:hits' % lookup_cache.KEY_PREFIX))
+        lookup_cache.flush_stats()
+        self.assertEqual(
+            caches['default'].get('%s:stats:hits' % lookup_cache.KEY_PREFIX),
+            1)
+
+    def test_new_uploader_parameter_invalidates_miss(self):
+        self.assertIsNone(self.lookup(None))
+        experiment = Experiment(title='Test', created_by=self.user)
+        experiment.save()
+        pset = ExperimentParameterSet(
+            experiment=experiment,
+            schema=Schema.objects.get(namespace=DEFAULT_EXPERIMENT_SCHEMA))
+        pset.save()
+        ExperimentParameter(
+            parameterset=pset,
+            name=ParameterName.objects.get(schema=pset.schema,
+                                           name='uploader'),
+            string_value=self.query['uploader']).save()
+        self.assertEqual(self.lookup(experiment.id), experiment.id)
+        self.assertEqual(self.lookup(experiment.id), experiment.id)
+        self.assertEqual(self.computed, [None, experiment.id])
+
+    def test_other_uploaders_stay_cached(self):
+        self.assertIsNone(self.lookup(None))
+        lookup_cache.bump(lookup_cache.uploader_scope('other-uploader'))
+        self.assertIsNone(self.lookup(None))
+        self.assertEqual(len(self.computed), 1)
+
+    def grant(self, experiment, plugin_id, entity_id):
+        ObjectACL(content_object=experiment, pluginId=plugin_id,
+                  entityId=str(entity_id), canRead=True,
+                  aclOwnershipType=ObjectACL.OWNER_OWNED).save()
+
+    def test_new_user_invalidates_miss(self):
+        self.assertIsNone(self.lookup(None))
+        User.objects.create_user(username='other', password='other')
+        self.assertIsNone(self.lookup(None))
+        # The queried user folder name now matches a user:
+        User.objects.create_user(username='testuser', password='testuser')
+        self.assertIsNone(self.lookup(None))
+        self.assertEqual(len(self.computed), 2)
+
+    def test_login_keeps_lookups(self):
+        user = User.objects.create_user(username='testuser',
+                                        password='testuser')
+        self.assertIsNone(self.lookup(None))
+        user.save(update_fields=['last_login'])
+        self.assertIsNone(self.lookup(None))
+        self.assertEqual(len(self.computed), 1)
+
+    def test_user_acl_invalidates_miss(self):
+        experiment = Experiment(title='Test', created_by=self.user)
+        experiment.save()
+        self.assertIsNone(self.lookup(None))
+        self.grant(experiment, 'django_user', self.user.id)
+        self.assertEqual(self.lookup(experiment.id), experiment.id)
+        self.assertEqual(self.computed, [None, experiment.id])
+
+    def test_group_acl_invalidates_miss(self):
+        group = Group.objects.create(name='Test Group')
+        group.user_set.add(self.user)
+        experiment = Experiment(title='Test', created_by=self.user)
+        experiment.save()
+        self.assertIsNone(self.lookup(None))
+        self.grant(experiment, 'django_group', group.id)
+        self.assertEqual(self.lookup(experiment.id), experiment.id)
+        self.assertEqual(self.computed, [None, experiment.id])
+
+    def test_group_membership_invalidates_miss(self):
+        group = Group.objects.create(name='Test Group')
+        self.assertIsNone(self.lookup(None))
+        group.user_set.add(self.user)
+        self.assertIsNone(self.lookup(None))
+        self.assertEqual(len(self.computed), 2)
+        self.user.groups.remove(group)
+        self.assertIsNone(self.lookup(None))
+        self.assertEqual(len(self.computed), 3)
@@ -0,0 +1,86 @@
+'''
+Testing the incremental parsing and comparison of MyData folder manifests
+'''
+import gzip
+import io
+import json
+
+from django.db import connection
+from django.test import SimpleTestCase
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from tardis.tardis_portal.models.datafile import DataFile
+from tardis.tardis_portal.models.datafile import DataFileObject
+from tardis.tardis_portal.models.dataset import Dataset
+from tardis.tardis_portal.models.storage import StorageBox
+
+from tardis.apps.mydata import manifest
+
+
+def gzipped(data):
+    output = io.BytesIO()
+    with gzip.GzipFile(fileobj=output, mode='wb') as compressed:
+        compressed.write(data)
+    return output.getvalue()
+
+
+class ManifestTest(SimpleTestCase):
+    def test_iter_manifest(self):
+        entries = [{'path': 'dir/file%d.txt' % index, 'size': index,
+                    'mtime': 0} for index in range(5000)]
+        data = gzipped('\n'.join(json.dumps(entry)
+                                 for entry in entries).encode('utf-8'))
+        parsed = list(manifest.iter_manifest(io.BytesIO(data).read))
+        self.assertEqual(parsed, entries)
+        plain = b'{"path": "a.txt", "size": 1}\n\n'
+        self.assertEqual(list(manifest.iter_manifest(io.BytesIO(plain).read)),
+                         [{'path': 'a.txt', 'size': 1}])
+
+    def test_invalid_manifests(self):
+        for data in (b'{"path": "a.txt"}', b'[1, 2]', b'not json',
+                     b'{"path": 1, "size": 1}',
+                     gzipped(b'{"path": "a.txt", "size": 1}')[:-10] +
+                     b'0123456789'):
+            with self.assertRaises(manifest.ManifestError):
+                list(manifest.iter_manifest(io.BytesIO(data).read))
+
+    def test_spool(self):
+        data = gzipped(b'{"path": "a.txt", "size": 1}\n' * 1000)
+        request = io.BytesIO(data)
+        spooled = manifest.spool(request.read, max_size=100)
+        # The request has been read completely:
+        self.assertEqual(request.read(), b'')
+        self.assertEqual(len(list(manifest.iter_manifest(spooled.read))),
+                         1000)
+        spooled.close()
+
+    def test_normalize_path(self):
+        self.assertEqual(manifest.normalize_path('a.txt'), ('', 'a.txt'))
+        self.assertEqual(manifest.normalize_path('./sub\\dir\\a.txt'),
+                         ('sub/dir', 'a.txt'))
+
+
+class DiffManifestTest(TestCase):
+    def test_many_directories(self):
+        dataset = Dataset(description='Test Dataset')
+        dataset.save()
+        storage_box = StorageBox(name='test', max_size=0)
+        storage_box.save()
+        datafile = DataFile(dataset=dataset, filename='file.txt',
+                            directory='dir0', size=1)
+        datafile.save()
+        DataFileObject(datafile=datafile, storage_box=storage_box,
+                       uri='dir0/file.txt', verified=True).save()
+        # Each entry in its own directory, plus one at the top level:
+        entries = [{'path': 'dir%d/file.txt' % index, 'size': 1}
+                   for index in range(1000)]
+        entries.append({'path': 'top.txt', 'size': 1})
+        with CaptureQueriesContext(connection) as context:
+            results = list(manifest.diff_manifest(dataset.id, entries))
+        self.assertEqual(len(context.captured_queries), 3)
+        self.assertEqual(len(results), 1000)
+        self.assertNotIn({'path': 'dir0/file.txt', 'status': 'missing'},
+                         results)
+        self.assertEqual(results[-1], {'path': 'top.txt',
+                                       'status': 'missing'})
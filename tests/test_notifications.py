@@ -0,0 +1,88 @@
+'''
+Testing the notifications waking long-polling MyData clients
+'''
+import threading
+import time
+
+from django.core.cache import caches
+from django.test import SimpleTestCase
+from django.test.utils import override_settings
+
+from tardis.apps.mydata import notifications
+
+
+@override_settings(
+    CACHES={
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'mydata-notification-tests',
+        }},
+    MYDATA_LONG_POLL_INTERVAL=5.0)
+class NotificationsTest(SimpleTestCase):
+    def setUp(self):
+        caches['default'].clear()
+        self.state = {'approved': False}
+        self.fetches = 0
+
+    def fetch(self):
+        self.fetches += 1
+        return self.state['approved']
+
+    def wait(self, timeout):
+        return notifications.wait_for_change(
+            '1234-5678', 'fingerprint', self.fetch,
+            lambda approved: approved, timeout)
+
+    def test_returns_immediately_when_changed(self):
+        self.state['approved'] = True
+        self.assertTrue(self.wait(10))
+        self.assertEqual(self.fetches, 1)
+
+    def test_times_out_without_refetching(self):
+        start = time.time()
+        self.assertFalse(self.wait(0.2))
+        self.assertGreaterEqual(time.time() - start, 0.2)
+        self.assertEqual(self.fetches, 1)
+
+    def test_notify_wakes_waiter(self):
+        def approve():
+            time.sleep(0.1)
+            self.state['approved'] = True
+            notifications.notify([('1234-5678', 'fingerprint')])
+        threading.Thread(target=approve).start()
+        start = time.time()
+        self.assertTrue(self.wait(10))
+        # Woken by the condition, well before the polling interval:
+        self.assertLess(time.time() - start, 5.0)
+        self.assertEqual(self.fetches, 2)
+
+    @override_settings(MYDATA_LONG_POLL_INTERVAL=0.05)
+    def test_refetches_until_change_is_visible(self):
+        def approve():
+            time.sleep(0.1)
+            # Notified before the change is committed:
+            notifications.notify([('1234-5678', 'fingerprint')])
+            time.sleep(0.2)
+            self.state['approved'] = True
+        threading.Thread(target=approve).start()
+        self.assertTrue(self.wait(10))
+        self.assertGreater(self.fetches, 2)
+
+    @override_settings(MYDATA_LONG_POLL_INTERVAL=0.05,
+                       MYDATA_LONG_POLL_MAX_INTERVAL=0.2)
+    def test_backs_off(self):
+        checks = []
+        cache = notifications.get_cache()
+        get = cache.get
+
+        def counting_get(key, *args, **kwargs):
+            checks.append(time.time())
+            return get(key, *args, **kwargs)
+        cache.get = counting_get
+        try:
+            self.assertFalse(self.wait(0.8))
+        finally:
+            del cache.get
+        # 0.05 + 0.1 + 0.2 + 0.2 + ... rather than every 0.05 seconds:
+        self.assertLess(len(checks), 10)
+        self.assertEqual(self.fetches, 1)
@@ -0,0 +1,93 @@
+'''
+Testing the on-demand profiling of MyData requests
+'''
+import cProfile
+import os
+import shutil
+import tempfile
+
+from django.contrib.auth.models import AnonymousUser
+from django.contrib.auth.models import User
+from django.http import HttpResponse
+from django.test import RequestFactory
+from django.test import SimpleTestCase
+from django.test import TestCase
+from django.test.utils import override_settings
+from django.utils.six import StringIO
+
+from tardis.apps.mydata import profiling
+
+
+class ProfilingTest(SimpleTestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def save(self, name):
+        profiler = cProfile.Profile()
+        profiler.enable()
+        sum(range(100))
+        profiler.disable()
+        details = {'resource': 'mydata_experiment', 'view': 'dispatch_list',
+                   'method': 'GET', 'duration': 0.1,
+                   'queries': [{'sql': "SELECT * FROM t WHERE id = 1",
+                                'time': 0.01}]}
+        profiling.save_profile(self.directory, name, profiler, details,
+                               max_profiles=2)
+
+    def test_ring_buffer_keeps_most_recent_profiles(self):
+        for timestamp in ('0001', '0002', '0003'):
+            self.save(timestamp)
+        self.assertEqual(sorted(os.listdir(self.directory)),
+                         ['0002.json', '0002.prof',
+                          '0003.json', '0003.prof'])
+
+    def test_summarize_profiles(self):
+        self.save('0001')
+        self.save('0002')
+        output = StringIO()
+        profiling.summarize_profiles(self.directory, output)
+        summary = output.getvalue()
+        self.assertIn('GET mydata_experiment.dispatch_list', summary)
+        self.assertIn('2 queries', summary)
+        self.assertIn('SELECT * FROM t WHERE id = ?', summary)
+
+    def test_normalize_sql(self):
+        self.assertEqual(
+            profiling.normalize_sql(
+                "SELECT a FROM t2 WHERE b = 'x''y' AND c IN (1, 2, 3)"),
+            "SELECT a FROM t2 WHERE b = ? AND c IN (...)")
+
+
+class FakeResource(object):
+    class _meta(object):
+        resource_name = 'experiment'
+
+
+class ProfileHeaderTest(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def profile(self, user):
+        request = RequestFactory().get('/api/v1/mydata_experiment/')
+        request.user = user
+        request.mydata_profile_reason = 'sampled'
+        with override_settings(MYDATA_PROFILING_DIR=self.directory):
+            return profiling.profile_view(FakeResource(), 'dispatch_list',
+                                          request, HttpResponse)
+
+    def test_profile_name_only_sent_to_staff(self):
+        staff = User.objects.create_user(username='staff', password='staff')
+        staff.is_staff = True
+        staff.save()
+        self.assertIn('X-MyData-Profile', self.profile(staff))
+        user = User.objects.create_user(username='user', password='user')
+        self.assertNotIn('X-MyData-Profile', self.profile(user))
+        self.assertNotIn('X-MyData-Profile', self.profile(AnonymousUser()))
+        # All three requests were profiled:
+        self.assertEqual(len(os.listdir(self.directory)), 6)
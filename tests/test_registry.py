@@ -0,0 +1,65 @@
+'''
+Testing the per-process registry of MyData's schema, parameter names
+and storage boxes
+'''
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from tardis.tardis_portal.models.parameters import ParameterName
+from tardis.tardis_portal.models.parameters import Schema
+from tardis.tardis_portal.models.storage import StorageBox
+
+from tardis.apps.mydata import registry
+from tardis.apps.mydata.schemas import DEFAULT_EXPERIMENT_SCHEMA
+
+
+class RegistryTest(TestCase):
+    fixtures = ['default_experiment_schema']
+
+    def setUp(self):
+        registry.invalidate()
+
+    def test_schema_and_parameter_names(self):
+        schema = Schema.objects.get(namespace=DEFAULT_EXPERIMENT_SCHEMA)
+        self.assertEqual(registry.get_schema_id(), schema.id)
+        self.assertEqual(
+            registry.get_parameter_name_id('uploader'),
+            ParameterName.objects.get(schema=schema, name='uploader').id)
+        self.assertIsNone(registry.get_parameter_name_id('unknown'))
+
+    def test_lookups_dont_query_once_loaded(self):
+        registry.get_registry()
+        with CaptureQueriesContext(connection) as context:
+            registry.get_schema_id()
+            registry.get_parameter_name_id('user_folder_name')
+        self.assertEqual(len(context.captured_queries), 0)
+
+    def test_storage_boxes(self):
+        self.assertIsNone(registry.get_storage_box(None))
+        storage_box = StorageBox(name='box', max_size=0)
+        storage_box.save()
+        self.assertEqual(registry.get_storage_box(storage_box.id).name,
+                         'box')
+        storage_box.name = 'renamed'
+        storage_box.save()
+        self.assertEqual(registry.get_storage_box(storage_box.id).name,
+                         'renamed')
+        storage_box_id = storage_box.id
+        storage_box.delete()
+        self.assertIsNone(registry.get_storage_box(storage_box_id))
+
+    def test_schema_deleted(self):
+        self.assertIsNotNone(registry.get_schema_id())
+        Schema.objects.get(namespace=DEFAULT_EXPERIMENT_SCHEMA).delete()
+        self.assertIsNone(registry.get_schema_id())
+        self.assertTrue(registry.get_stats()['loaded'])
+
+    def test_unrelated_schema_keeps_registry(self):
+        registry.get_registry()
+        loads = registry.get_stats()['loads']
+        schema = Schema(namespace='http://example.com/other')
+        schema.save()
+        ParameterName(schema=schema, name='other', full_name='Other').save()
+        registry.get_schema_id()
+        self.assertEqual(registry.get_stats()['loads'], loads)
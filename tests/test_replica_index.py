@@ -0,0 +1,83 @@
+'''
+Testing the index of DataFileObject URIs used by the mydata_replica
+url filters
+'''
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from tardis.tardis_portal.models.datafile import DataFile
+from tardis.tardis_portal.models.datafile import DataFileObject
+from tardis.tardis_portal.models.dataset import Dataset
+from tardis.tardis_portal.models.storage import StorageBox
+
+from tardis.apps.mydata import replica_index
+from tardis.apps.mydata.models import ReplicaURIIndex
+
+
+class ReplicaURIIndexTest(TestCase):
+    def setUp(self):
+        dataset = Dataset(description='Test Dataset')
+        dataset.save()
+        self.storage_box = StorageBox(name='test', max_size=0)
+        self.storage_box.save()
+        self.datafile = DataFile(dataset=dataset, filename='file.dat',
+                                 size=0)
+        self.datafile.save()
+
+    def create_dfo(self, uri):
+        dfo = DataFileObject(datafile=self.datafile,
+                             storage_box=self.storage_box, uri=uri)
+        dfo.save()
+        return dfo
+
+    def lookup(self, **kwargs):
+        return list(DataFileObject.objects
+                    .filter(**replica_index.build_uri_filters(**kwargs))
+                    .values_list('id', flat=True))
+
+    def test_index_maintained_on_save(self):
+        dfo = self.create_dfo('mydata/1-abc/file.dat')
+        self.assertEqual(self.lookup(exact='mydata/1-abc/file.dat'),
+                         [dfo.id])
+        dfo.uri = 'mydata/1-def/file.dat'
+        dfo.save()
+        self.assertEqual(self.lookup(exact='mydata/1-abc/file.dat'), [])
+        self.assertEqual(self.lookup(startswith='mydata/1-def/'), [dfo.id])
+
+    def test_long_prefix(self):
+        directory = 'mydata/' + 'x' * ReplicaURIIndex.PREFIX_LENGTH
+        dfo = self.create_dfo(directory + '/file.dat')
+        self.create_dfo(directory + 'y/file.dat')
+        self.assertEqual(self.lookup(startswith=directory + '/'), [dfo.id])
+
+    def test_rebuild_index(self):
+        dfo = self.create_dfo('mydata/1-abc/file.dat')
+        ReplicaURIIndex.objects.all().delete()
+        self.assertEqual(replica_index.rebuild_index(), 1)
+        self.assertEqual(self.lookup(exact='mydata/1-abc/file.dat'),
+                         [dfo.id])
+
+    def test_rebuild_index_queryset(self):
+        dfo = self.create_dfo('mydata/1-abc/file.dat')
+        self.create_dfo('mydata/1-def/file.dat')
+        ReplicaURIIndex.objects.all().delete()
+        self.assertEqual(replica_index.rebuild_index(
+            queryset=DataFileObject.objects.filter(pk=dfo.pk)), 1)
+        self.assertEqual(list(ReplicaURIIndex.objects
+                              .values_list('dfo_id', flat=True)), [dfo.id])
+
+    def test_unchanged_uri_isnt_rewritten(self):
+        dfo = self.create_dfo('mydata/1-abc/file.dat')
+        with CaptureQueriesContext(connection) as context:
+            dfo.save()
+        index_writes = [
+            query['sql'] for query in context.captured_queries
+            if 'replicauriindex' in query['sql'].lower() and
+            not query['sql'].lstrip().upper().startswith('SELECT')]
+        self.assertEqual(index_writes, [])
+        dfo.verified = True
+        with CaptureQueriesContext(connection) as context:
+            dfo.save(update_fields=['verified'])
+        self.assertFalse(any('replicauriindex' in query['sql'].lower()
+                             for query in context.captured_queries))
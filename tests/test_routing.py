@@ -0,0 +1,118 @@
+'''
+Testing the IP/CIDR routing table for uploads from unidentified uploaders
+'''
+import time
+
+from django.core.cache import caches
+from django.test import SimpleTestCase
+from django.test import TestCase
+from django.test.utils import override_settings
+
+from tardis.tardis_portal.models.storage import StorageBox
+
+from tardis.apps.mydata import routing
+from tardis.apps.mydata.models import StorageBoxRoute
+
+
+class RoutingTableTest(SimpleTestCase):
+    def setUp(self):
+        self.table = routing.RoutingTable()
+        self.table.add(('route', 1), '10.0.0.0/8', None, 100)
+        self.table.add(('route', 2), '10.1.0.0/16', 5, 200)
+        self.table.add(('uploader', 3), '10.1.2.3/32', 5, 300,
+                       (routing.UPLOADER_ROUTE_PRIORITY, 0, 1))
+        self.table.add(('route', 4), '2001:db8::/32', None, 400)
+
+    def test_longest_prefix_match(self):
+        self.assertEqual(self.table.lookup('10.9.9.9', 5), 100)
+        self.assertEqual(self.table.lookup('10.1.9.9', 5), 200)
+        self.assertEqual(self.table.lookup('10.1.2.3', 5), 300)
+        self.assertIsNone(self.table.lookup('192.168.0.1', 5))
+
+    def test_instrument_specific_routes(self):
+        self.assertEqual(self.table.lookup('10.1.9.9', 6), 100)
+        self.assertEqual(self.table.lookup('10.1.2.3', 6), 100)
+
+    def test_ipv6(self):
+        self.assertEqual(self.table.lookup('2001:db8::1', 5), 400)
+        self.assertIsNone(self.table.lookup('2001:db9::1', 5))
+
+    def test_invalid_addresses(self):
+        self.assertIsNone(self.table.lookup('not an address', 5))
+        self.assertRaises(ValueError, self.table.add, ('route', 5),
+                          '10.0.0.1/8', None, 500)
+        self.assertRaises(ValueError, self.table.add, ('route', 5),
+                          '10.0.0.0/33', None, 500)
+
+    def test_remove_source(self):
+        self.table.remove_source(('uploader', 3))
+        self.assertEqual(self.table.lookup('10.1.2.3', 5), 200)
+        self.table.remove_source(('route', 2))
+        self.assertEqual(self.table.lookup('10.1.2.3', 5), 100)
+        self.assertEqual(len(self.table), 2)
+
+    def test_uploader_routes_beat_admin_routes(self):
+        self.table.add(('route', 6), '10.1.2.3/32', 5, 600)
+        self.assertEqual(self.table.lookup('10.1.2.3', 5), 300)
+
+    def test_ipv4_mapped_addresses(self):
+        self.assertEqual(self.table.lookup('::ffff:10.1.2.3', 5), 300)
+        self.assertEqual(self.table.lookup('::FFFF:10.9.9.9', 5), 100)
+        self.assertEqual(routing._host_cidr('::ffff:10.1.2.3'),
+                         '10.1.2.3/32')
+        self.assertEqual(routing._host_cidr('2001:db8::1'),
+                         '2001:db8::1/128')
+
+
+@override_settings(
+    CACHES={
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'mydata-routing-tests',
+        }},
+    MYDATA_ROUTING_CHECK_INTERVAL=0,
+    MYDATA_ROUTING_SETTLE_TIME=0)
+class RoutingChangesTest(TestCase):
+    def setUp(self):
+        caches['default'].clear()
+        routing._state.update(table=None, generation=None, checked=0.0)
+        self.storage_box = StorageBox(name='box', max_size=0)
+        self.storage_box.save()
+
+    def publish(self, change):
+        '''
+        Publishes a change as another process would.
+        '''
+        cache = routing.get_cache()
+        generation = routing._next_generation(cache)
+        cache.set(routing.CHANGE_KEY % generation, (change, time.time()),
+                  routing.CHANGE_TIMEOUT)
+        return generation
+
+    def test_changes_are_applied_incrementally(self):
+        table = routing.get_table()
+        # Not in the database, so it would be lost by a reload:
+        table.add(('route', 0), '192.168.0.0/16', None, 0)
+        route = StorageBoxRoute(network='10.0.0.0/8',
+                                storage_box=self.storage_box)
+        route.save()
+        self.assertIs(routing.get_table(), table)
+        self.assertEqual(routing.lookup('10.1.2.3', None),
+                         self.storage_box.id)
+
+        StorageBoxRoute.objects.filter(pk=route.pk)\
+            .update(network='172.16.0.0/12')
+        generation = self.publish(('routes', [route.id]))
+        self.assertIs(routing.get_table(), table)
+        self.assertEqual(routing.lookup('172.16.0.1', None),
+                         self.storage_box.id)
+        self.assertIsNone(routing.lookup('10.1.2.3', None))
+        self.assertEqual(routing.lookup('192.168.0.1', None), 0)
+        self.assertEqual(routing._state['generation'], generation)
+
+    def test_missed_changes_reload_table(self):
+        table = routing.get_table()
+        generation = self.publish(('routes', [1]))
+        routing.get_cache().delete(routing.CHANGE_KEY % generation)
+        self.assertIsNot(routing.get_table(), table)
+        self.assertEqual(routing._state['generation'], generation)
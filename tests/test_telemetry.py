@@ -0,0 +1,136 @@
+'''
+Testing the time series of uploaders' disk and memory figures
+'''
+from datetime import datetime
+from datetime import timedelta
+
+from django.core.cache import caches
+from django.db import connection
+from django.test import SimpleTestCase
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.test.utils import override_settings
+
+from tardis.apps.mydata import telemetry
+from tardis.apps.mydata.models import Uploader
+from tardis.apps.mydata.models import UploaderTelemetry
+from tardis.apps.mydata.models import UploaderTelemetryRollup
+
+GB = 1024 ** 3
+
+
+class ParseSizeTest(SimpleTestCase):
+    def test_parse_size(self):
+        self.assertEqual(telemetry.parse_size(1024), 1024)
+        self.assertEqual(telemetry.parse_size('16 GB'), 16 * GB)
+        self.assertEqual(telemetry.parse_size('1.5TiB'), 1536 * GB)
+        self.assertEqual(telemetry.parse_size('512'), 512)
+        self.assertIsNone(telemetry.parse_size('lots'))
+        self.assertIsNone(telemetry.parse_size(None))
+        self.assertIsNone(telemetry.parse_size(-1))
+
+
+@override_settings(
+    CACHES={
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'mydata-telemetry-tests',
+        }},
+    MYDATA_TELEMETRY_MIN_INTERVAL=300,
+    MYDATA_TELEMETRY_RETENTION_DAYS=7,
+    MYDATA_TELEMETRY_ROLLUP_RETENTION_DAYS=30)
+class TelemetryTest(TestCase):
+    def setUp(self):
+        caches['default'].clear()
+        self.uploader = Uploader(uuid='1234-5678', name='Uploader',
+                                 interface='Ethernet', mac_address='ABCDEFG')
+        self.uploader.save()
+
+    def test_record_heartbeat(self):
+        sample = telemetry.record_heartbeat(
+            self.uploader.id,
+            {'memory': '16 GB',
+             'telemetry': {'disk_total': 100 * GB, 'disk_used': 40 * GB}})
+        self.assertEqual(sample.memory_total, 16 * GB)
+        self.assertEqual(sample.disk_used, 40 * GB)
+        # Too soon after the last sample:
+        self.assertIsNone(telemetry.record_heartbeat(
+            self.uploader.id, {'memory': '16 GB'}))
+        # No figures:
+        caches['default'].clear()
+        self.assertIsNone(telemetry.record_heartbeat(
+            self.uploader.id, {'name': 'Uploader'}))
+        self.assertEqual(UploaderTelemetry.objects.count(), 1)
+
+    def test_rollup(self):
+        now = datetime(2016, 6, 30, 12, 30)
+        old = datetime(2016, 6, 1, 9, 0)
+        for minutes, disk_used in ((0, 10), (20, 20), (40, 60), (70, 5)):
+            UploaderTelemetry.objects.create(
+                uploader=self.uploader,
+                timestamp=old + timedelta(minutes=minutes),
+                disk_total=100, disk_used=disk_used)
+        UploaderTelemetry.objects.create(
+            uploader=self.uploader, timestamp=now, disk_used=1)
+        UploaderTelemetryRollup.objects.create(
+            uploader=self.uploader, period_start=datetime(2016, 5, 1),
+            samples=1)
+
+        self.assertEqual(telemetry.rollup_telemetry(now=now), (4, 1))
+        self.assertEqual(UploaderTelemetry.objects.count(), 1)
+        rollups = list(UploaderTelemetryRollup.objects
+                       .order_by('period_start'))
+        self.assertEqual(len(rollups), 2)
+        self.assertEqual(rollups[0].period_start, old)
+        self.assertEqual(rollups[0].samples, 3)
+        self.assertEqual(rollups[0].disk_used_mean, 30)
+        self.assertEqual(rollups[0].disk_used_max, 60)
+        self.assertEqual(rollups[1].disk_used_mean, 5)
+
+        # Late samples are merged into the existing rollup:
+        UploaderTelemetry.objects.create(
+            uploader=self.uploader, timestamp=old + timedelta(minutes=50),
+            disk_total=100, disk_used=70)
+        telemetry.rollup_telemetry(now=now)
+        rollup = UploaderTelemetryRollup.objects.get(period_start=old)
+        self.assertEqual(rollup.samples, 4)
+        self.assertEqual(rollup.disk_used_mean, 40)
+        self.assertEqual(rollup.disk_used_max, 70)
+
+    def test_uploader_saves_changed_fields(self):
+        uploader = Uploader.objects.get(pk=self.uploader.pk)
+        uploader.updated_time = datetime.now()
+        with CaptureQueriesContext(connection) as context:
+            uploader.save()
+        self.assertEqual(len(context.captured_queries), 1)
+        self.assertNotIn('disk_usage', context.captured_queries[0]['sql'])
+        with CaptureQueriesContext(connection) as context:
+            uploader.save()
+        self.assertEqual(len(context.captured_queries), 0)
+
+    def test_merge_rollups_in_chunks(self):
+        period_start = datetime(2016, 6, 1, 9, 0)
+        periods = []
+        for index in range(5):
+            uploader = Uploader.objects.create(
+                uuid='uuid-%d' % index, name='Uploader %d' % index,
+                interface='Ethernet', mac_address='ABCDEFG')
+            UploaderTelemetryRollup.objects.create(
+                uploader=uploader, period_start=period_start, samples=1)
+            period = telemetry._Period(uploader.id, period_start)
+            period.add(100, 10, None, None)
+            periods.append(period)
+        telemetry._save_periods(periods, chunk_size=2)
+        self.assertEqual(
+            list(UploaderTelemetryRollup.objects
+                 .values_list('samples', flat=True)), [2] * 5)
+
+    def test_uploader_refresh_from_db(self):
+        uploader = Uploader.objects.get(pk=self.uploader.pk)
+        Uploader.objects.filter(pk=uploader.pk).update(name='Renamed')
+        uploader.refresh_from_db()
+        # Setting the name back is a change since the refresh:
+        uploader.name = 'Uploader'
+        uploader.save()
+        self.assertEqual(Uploader.objects.get(pk=uploader.pk).name,
+                         'Uploader')
@@ -0,0 +1,119 @@
+'''
+Testing the per-uploader throttling of the MyData app's resources
+'''
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.test import RequestFactory
+from django.test import SimpleTestCase
+from django.test.utils import override_settings
+
+from tastypie.exceptions import ImmediateHttpResponse
+
+from tardis.apps.mydata import throttle
+
+
+class BaseResource(object):
+    def throttle_check(self, request):
+        pass
+
+
+class ThrottledResource(throttle.ThrottleMixin, BaseResource):
+    class _meta(object):
+        resource_name = 'replica'
+
+
+@override_settings(
+    CACHES={
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'mydata-throttle-tests',
+        }},
+    MYDATA_THROTTLE_ENABLED=True,
+    MYDATA_THROTTLE_RATES={'poll': (1.0, 3), 'upload': (10.0, 5)})
+class ThrottleTest(SimpleTestCase):
+    def setUp(self):
+        caches['default'].clear()
+        self.factory = RequestFactory()
+
+    def test_token_bucket(self):
+        for _ in range(3):
+            self.assertIsNone(throttle.take_token('uploader', 'poll', 100.0))
+        self.assertAlmostEqual(
+            throttle.take_token('uploader', 'poll', 100.0), 1.0)
+        self.assertAlmostEqual(
+            throttle.take_token('uploader', 'poll', 100.5), 0.5)
+        self.assertIsNone(throttle.take_token('uploader', 'poll', 101.0))
+        # Refills up to the bucket size:
+        for _ in range(3):
+            self.assertIsNone(throttle.take_token('uploader', 'poll', 200.0))
+        self.assertIsNotNone(throttle.take_token('uploader', 'poll', 200.0))
+
+    def test_budgets_are_separate(self):
+        request = self.factory.get('/api/v1/mydata_experiment/',
+                                   {'uploader': '1234-5678'})
+        for _ in range(3):
+            self.assertIsNone(throttle.check(request, 'experiment'))
+        self.assertIsNotNone(throttle.check(request, 'experiment'))
+        self.assertIsNotNone(throttle.check(request, 'replica'))
+        upload = self.factory.post(
+            '/api/v1/mydata_dataset_file/',
+            '{"uploader_uuid": "1234-5678"}',
+            content_type='application/json')
+        self.assertIsNone(throttle.check(upload, 'dataset_file'))
+        other = self.factory.get('/api/v1/mydata_experiment/',
+                                 {'uploader': '8765-4321'})
+        self.assertIsNone(throttle.check(other, 'experiment'))
+
+    def test_unidentified_requests_are_throttled_by_user_and_ip(self):
+        user = User(pk=1, username='mydata')
+        for _ in range(3):
+            request = self.factory.get('/api/v1/mydata_replica/',
+                                       {'url': 'Test/file.txt'})
+            request.user = user
+            self.assertIsNone(throttle.check(request, 'replica'))
+        request.META['REMOTE_ADDR'] = '10.0.0.2'
+        self.assertIsNone(throttle.check(request, 'replica'))
+        request.user = User(pk=2, username='other')
+        self.assertIsNone(throttle.check(request, 'replica'))
+        request = self.factory.get('/api/v1/mydata_replica/',
+                                   {'url': 'Test/file.txt'})
+        request.user = user
+        self.assertIsNotNone(throttle.check(request, 'replica'))
+
+    def test_replica_lookup_flood(self):
+        resource = ThrottledResource()
+        request = self.factory.get('/api/v1/mydata_replica/',
+                                   {'url': 'Test/file.txt'})
+        request.user = User(pk=1, username='mydata')
+        for _ in range(3):
+            resource.throttle_check(request)
+        with self.assertRaises(ImmediateHttpResponse) as context:
+            resource.throttle_check(request)
+        self.assertEqual(context.exception.response.status_code, 429)
+        self.assertEqual(context.exception.response['Retry-After'], '1')
+
+    @override_settings(MYDATA_THROTTLE_TRUST_X_FORWARDED_FOR=True)
+    def test_x_forwarded_for(self):
+        request = self.factory.get(
+            '/api/v1/mydata_replica/',
+            HTTP_X_FORWARDED_FOR='192.168.0.1, 10.0.0.2')
+        self.assertEqual(throttle.get_client_ip(request), '10.0.0.2')
+        with self.settings(MYDATA_THROTTLE_TRUST_X_FORWARDED_FOR=False):
+            self.assertEqual(throttle.get_client_ip(request), '127.0.0.1')
+
+    def test_stats(self):
+        request = self.factory.get('/api/v1/mydata_replica/',
+                                   {'uuid': '1234-5678'})
+        for _ in range(4):
+            throttle.check(request, 'replica')
+        stats = throttle.get_stats()
+        self.assertEqual(stats['poll']['allowed'], 3)
+        self.assertEqual(stats['poll']['throttled'], 1)
+        self.assertEqual(stats['upload']['allowed'], 0)
+
+    @override_settings(MYDATA_THROTTLE_ENABLED=False)
+    def test_disabled(self):
+        request = self.factory.get('/api/v1/mydata_replica/',
+                                   {'uuid': '1234-5678'})
+        for _ in range(5):
+            self.assertIsNone(throttle.check(request, 'replica'))
@@ -0,0 +1,182 @@
+"""
+Per-uploader throttling of the MyData app's API resources
+
+Each MyData instance (identified by its uploader UUID or, failing that,
+its key fingerprint) has a token bucket per budget, stored in Django's
+cache.  DataFile creation (POST to mydata_dataset_file) uses the
+"upload" budget and everything else uses the "poll" budget, so a client
+polling in a tight loop runs out of polling tokens without affecting
+anyone's uploads.  Requests which don't identify their uploader (e.g.
+mydata_replica lookups) are throttled per MyTardis account and client
+IP address instead, because many MyData instances usually share one
+MyTardis account but not one IP address.
+
+Buckets are updated without locking, so concurrent requests from the
+same uploader can occasionally each take the same token.
+"""
+import hashlib
+import math
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+
+from tastypie import http
+from tastypie.exceptions import ImmediateHttpResponse
+
+from .utils import get_uploader_identifiers
+
+KEY_PREFIX = 'mydata:throttle'
+
+#: Maps budgets to (tokens added per second, bucket size)
+DEFAULT_RATES = {
+    'poll': (2.0, 120),
+    'upload': (20.0, 1000),
+}
+
+BUDGETS = ('poll', 'upload')
+
+
+def is_enabled():
+    return getattr(settings, 'MYDATA_THROTTLE_ENABLED', False)
+
+
+def get_cache():
+    return caches[getattr(settings, 'MYDATA_THROTTLE_CACHE', 'default')]
+
+
+def get_rates():
+    rates = dict(DEFAULT_RATES)
+    rates.update(getattr(settings, 'MYDATA_THROTTLE_RATES', {}))
+    return rates
+
+
+def get_budget(resource_name, method):
+    '''
+    Returns the budget a request to one of the app's resources uses.
+    '''
+    if resource_name == 'dataset_file' and method == 'POST':
+        return 'upload'
+    return 'poll'
+
+
+def _incr(cache, name, delta=1):
+    key = '%s:stats:%s' % (KEY_PREFIX, name)
+    try:
+        cache.incr(key, delta)
+    except ValueError:
+        if not cache.add(key, delta, None):
+            cache.incr(key, delta)
+
+
+def take_token(identity, budget, now=None):
+    '''
+    Takes a token from identity's bucket for budget.  Returns None if
+    there was one, or else the number of seconds until there will be.
+    '''
+    rate, size = get_rates()[budget]
+    rate = float(rate)
+    cache = get_cache()
+    key = '%s:%s:%s' % (KEY_PREFIX, budget,
+                        hashlib.sha1(identity.encode('utf-8')).hexdigest())
+    if now is None:
+        now = time.time()
+    state = cache.get(key)
+    if state is None:
+        tokens = size
+    else:
+        tokens, updated = state
+        tokens = min(size, tokens + (now - updated) * rate)
+    if tokens >= 1:
+        tokens -= 1
+        retry_after = None
+    else:
+        retry_after = (1 - tokens) / rate
+    # An expired bucket is a full one:
+    cache.set(key, (tokens, now), int(math.ceil(size / rate)) + 60)
+    _incr(cache, '%s:%s' % (budget,
+                            'allowed' if retry_after is None
+                            else 'throttled'))
+    return retry_after
+
+
+def get_client_ip(request):
+    '''
+    Returns the client's IP address: the last one in the
+    X-Forwarded-For header (i.e. the one added by the reverse proxy)
+    if MYDATA_THROTTLE_TRUST_X_FORWARDED_FOR is set, or else
+    REMOTE_ADDR.
+    '''
+    if getattr(settings, 'MYDATA_THROTTLE_TRUST_X_FORWARDED_FOR', False):
+        forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR', '')
+        addresses = [address.strip() for address in forwarded_for.split(',')
+                     if address.strip()]
+        if addresses:
+            return addresses[-1]
+    return request.META.get('REMOTE_ADDR', '')
+
+
+def get_identity(request):
+    '''
+    Returns the identity whose buckets a request's tokens are taken
+    from: its uploader's UUID or key fingerprint if it has either, or
+    else its user and client IP address.
+    '''
+    uploader_uuid, fingerprint = get_uploader_identifiers(request)
+    if uploader_uuid:
+        return u'uuid:%s' % uploader_uuid
+    if fingerprint:
+        return u'fingerprint:%s' % fingerprint
+    user = getattr(request, 'user', None)
+    user_id = user.pk if user is not None else None
+    return u'user:%s|ip:%s' % (user_id, get_client_ip(request))
+
+
+def check(request, resource_name):
+    '''
+    Returns None if the request may proceed, or else the number of
+    seconds the client should wait before retrying.
+    '''
+    if not is_enabled():
+        return None
+    identity = get_identity(request)
+    return take_token(identity, get_budget(resource_name, request.method))
+
+
+def get_stats():
+    '''
+    Returns the numbers of allowed and throttled requests for each
+    budget, and the configured rates, for tuning the limits.
+    '''
+    names = ['%s:%s' % (budget, outcome)
+             for budget in BUDGETS for outcome in ('allowed', 'throttled')]
+    found = get_cache().get_many(['%s:stats:%s' % (KEY_PREFIX, name)
+                                  for name in names])
+    stats = {'enabled': is_enabled()}
+    rates = get_rates()
+    for budget in BUDGETS:
+        rate, size = rates[budget]
+        stats[budget] = {
+            'allowed': found.get(
+                '%s:stats:%s:allowed' % (KEY_PREFIX, budget), 0),
+            'throttled': found.get(
+                '%s:stats:%s:throttled' % (KEY_PREFIX, budget), 0),
+            'rate': rate,
+            'burst': size,
+        }
+    return stats
+
+
+class ThrottleMixin(object):
+    '''
+    Throttles a resource's requests per uploader, responding with
+    429 Too Many Requests and a Retry-After header when the uploader's
+    bucket is empty.  Applies after the resource's own throttle.
+    '''
+    def throttle_check(self, request):
+        super(ThrottleMixin, self).throttle_check(request)
+        retry_after = check(request, self._meta.resource_name)
+        if retry_after is not None:
+            response = http.HttpTooManyRequests()
+            response['Retry-After'] = str(int(math.ceil(retry_after)))
+            raise ImmediateHttpResponse(response=response)
@@ -1,3 +1,11 @@
 from django.conf.urls import patterns
+from django.conf.urls import url
 
-urlpatterns = patterns('',)
+from . import views
+
+urlpatterns = patterns(
+    '',
+    url(r'^stats/$', views.stats, name='tardis.apps.mydata.views.stats'),
+    url(r'^fleet/export/$', views.export_fleet,
+        name='tardis.apps.mydata.views.export_fleet'),
+)
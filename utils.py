@@ -0,0 +1,47 @@
+"""
+Helpers shared by the MyData app's resources
+"""
+import json
+
+from django.db import transaction
+
+
+def get_uploader_identifiers(request):
+    '''
+    Returns the (uploader UUID, requester key fingerprint) MyData included
+    in a request's query string or JSON body, either of which may be None.
+
+    Only JSON bodies are parsed, so that streamed uploads (e.g. compressed
+    manifests) aren't read into memory.
+    '''
+    params = getattr(request, 'GET', {})
+    uploader_uuid = params.get('uploader') or \
+        params.get('uploader__uuid') or params.get('uuid')
+    fingerprint = params.get('requester_key_fingerprint')
+    content_type = request.META.get('CONTENT_TYPE', '')
+    if (uploader_uuid is None or fingerprint is None) and \
+            request.method in ('POST', 'PUT', 'PATCH') and \
+            content_type.startswith('application/json'):
+        try:
+            data = json.loads(request.body.decode('utf-8'))
+        except ValueError:
+            data = None
+        if isinstance(data, dict):
+            uploader_uuid = uploader_uuid or data.get('uploader_uuid') or \
+                data.get('uuid')
+            fingerprint = fingerprint or \
+                data.get('requester_key_fingerprint')
+    return uploader_uuid, fingerprint
+
+
+def on_commit(func):
+    '''
+    Calls func once the current transaction has been committed, or
+    immediately outside a transaction, so that other processes woken by
+    func see the committed data.  Django < 1.9 has no
+    transaction.on_commit, so func is called immediately there.
+    '''
+    if hasattr(transaction, 'on_commit'):
+        transaction.on_commit(func)
+    else:
+        func()
@@ -0,0 +1,66 @@
+"""
+Views for monitoring and administering the MyData app
+"""
+import json
+from functools import wraps
+
+from django.http import HttpResponse
+from django.http import HttpResponseBadRequest
+from django.http import HttpResponseForbidden
+from django.http import StreamingHttpResponse
+from django.utils.dateparse import parse_datetime
+
+from . import export
+from . import lookup_cache
+from . import registry
+from . import throttle
+
+
+def staff_only(view):
+    '''
+    Returns 403 (rather than redirecting to a login page) to users
+    who aren't staff, so that the views can be used by scripts.
+    '''
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if not request.user.is_authenticated() or \
+                not request.user.is_staff:
+            return HttpResponseForbidden()
+        return view(request, *args, **kwargs)
+    return wrapper
+
+
+@staff_only
+def stats(request):
+    '''
+    Returns the app's performance counters as JSON, for monitoring.
+    '''
+    data = {
+        'experiment_lookup_cache': lookup_cache.get_stats(),
+        'registry': registry.get_stats(),
+        'throttle': throttle.get_stats(),
+    }
+    return HttpResponse(json.dumps(data), content_type='application/json')
+
+
+@staff_only
+def export_fleet(request):
+    '''
+    Streams the uploader fleet's inventory as CSV (?format=csv, the default)
+    or JSON Lines (?format=jsonl), optionally only the uploaders updated
+    since a timestamp (e.g. ?since=2016-06-01T00:00:00).
+    '''
+    export_format = request.GET.get('format', 'csv')
+    if export_format not in export.FORMATS:
+        return HttpResponseBadRequest('Unknown format: %s' % export_format)
+    since = None
+    if 'since' in request.GET:
+        since = parse_datetime(request.GET['since'])
+        if since is None:
+            return HttpResponseBadRequest('Invalid since timestamp.')
+    response = StreamingHttpResponse(
+        export.iter_export(export_format, since=since),
+        content_type=export.CONTENT_TYPES[export_format])
+    response['Content-Disposition'] = \
+        'attachment; filename="mydata-fleet.%s"' % export_format
+    return response